@@ -1,5 +1,7 @@
 """
 * This script reads in the device information for an NF deployment.
+* Each NIC entry is one BESS server. 'reserve' (cores kept away from NFs)
+* and 'freq' (CPU frequency in MHz) are optional.
 """
 
 import json
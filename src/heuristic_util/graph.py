@@ -1,18 +1,27 @@
 """
 * This file provides a graph struct to be used by Lemur compiler.
+*
+* Routes can be restricted to a subset of vertices (e.g., the modules
+* that BESS can run). On a DAG, route queries are then answered with
+* dynamic programming over a topological order, with reachability kept
+* as one integer bitset per vertex.
 """
 
 from collections import defaultdict 
 import copy
+import random
 
 class Graph:
     def __init__(self,vertices):
         self.V= vertices
         self.graph = defaultdict(list)
         self.route = []
+        self.allowed = (1 << vertices) - 1
+        self.reach = None
 
     def addEdge(self,u,v):
         self.graph[u].append(v)
+        self.reach = None
 
     def printAllPathsUtil(self, u, d, visited, path):
         visited[u]= True
@@ -36,3 +45,226 @@ class Graph:
         route = list(self.route)
         self.route = []
         return route
+
+    def restrict(self, vertices):
+        """ Only route through |vertices|, i.e., work on the induced
+            subgraph of |vertices|
+
+        Parameter:
+        vertices: the allowed vertices
+        """
+        self.allowed = 0
+        for u in vertices:
+            self.allowed |= 1 << u
+        self.reach = None
+
+    def topoOrder(self):
+        """ Get a topological order of all vertices
+
+        Returns:
+        order: a list of vertices, each one before its successors
+        """
+        indegree = [0]*self.V
+        for u in range(self.V):
+            for v in self.graph[u]:
+                indegree[v] += 1
+        order = [u for u in range(self.V) if indegree[u] == 0]
+        for u in order:
+            for v in self.graph[u]:
+                indegree[v] -= 1
+                if indegree[v] == 0:
+                    order.append(v)
+        if len(order) != self.V:
+            raise ValueError("route queries need an acyclic graph")
+        return order
+
+    def reachBits(self):
+        """ Get the vertices reachable from each vertex through
+            allowed vertices only
+
+        Returns:
+        reach: a list of bitsets, bit v of reach[u] is set if v can
+               be reached from u; 0 for vertices that are not allowed
+        """
+        if self.reach is None:
+            reach = [0]*self.V
+            for u in reversed(self.topoOrder()):
+                if not (self.allowed >> u) & 1:
+                    continue
+                bits = 1 << u
+                for v in self.graph[u]:
+                    bits |= reach[v]
+                reach[u] = bits
+            self.reach = reach
+        return self.reach
+
+    def reachable(self, s, d):
+        return (self.reachBits()[s] >> d) & 1 == 1
+
+    def allRoutes(self, s, d):
+        """ List the routes from s to d through allowed vertices only.
+            Routes come in the same order as printAllPaths(), but
+            branches that cannot reach d are never entered, so the
+            cost is linear in the size of the output.
+
+        Parameter:
+        s: source vertex
+        d: destination vertex
+
+        Returns:
+        routes: a list of vertex lists
+        """
+        reach = self.reachBits()
+        target = 1 << d
+        if not reach[s] & target:
+            return []
+        if s == d:
+            return [[s]]
+        routes = []
+        path = [s]
+        stack = [iter(self.graph[s])]
+        while len(stack) > 0:
+            for v in stack[-1]:
+                if not reach[v] & target:
+                    continue
+                if v == d:
+                    routes.append(path + [v])
+                    continue
+                path.append(v)
+                stack.append(iter(self.graph[v]))
+                break
+            else:
+                stack.pop()
+                path.pop()
+        return routes
+
+    def countRoutes(self, s, d):
+        """ Count the routes from s to d through allowed vertices only
+
+        Parameter:
+        s: source vertex
+        d: destination vertex
+
+        Returns:
+        the number of routes
+        """
+        reach = self.reachBits()
+        target = 1 << d
+        if not reach[s] & target:
+            return 0
+        count = [0]*self.V
+        for u in reversed(self.topoOrder()):
+            if not reach[u] & target:
+                continue
+            if u == d:
+                count[u] = 1
+                continue
+            count[u] = sum([count[v] for v in self.graph[u]])
+        return count[s]
+
+    def extremeRoute(self, s, d, longest):
+        # the longest/shortest route, ties go to the earlier successor
+        reach = self.reachBits()
+        target = 1 << d
+        if not reach[s] & target:
+            return None
+        length = [0]*self.V
+        best_next = [None]*self.V
+        for u in reversed(self.topoOrder()):
+            if not reach[u] & target or u == d:
+                continue
+            for v in self.graph[u]:
+                if not reach[v] & target:
+                    continue
+                if best_next[u] is None or \
+                        (longest and length[v] > length[best_next[u]]) or \
+                        (not longest and length[v] < length[best_next[u]]):
+                    best_next[u] = v
+            length[u] = length[best_next[u]] + 1
+        route = [s]
+        while route[-1] != d:
+            route.append(best_next[route[-1]])
+        return route
+
+    def longestRoute(self, s, d):
+        """ Get a route from s to d with the most vertices, through
+            allowed vertices only
+
+        Parameter:
+        s: source vertex
+        d: destination vertex
+
+        Returns:
+        route: a vertex list, None if d cannot be reached
+        """
+        return self.extremeRoute(s, d, True)
+
+    def shortestRoute(self, s, d):
+        """ Get a route from s to d with the fewest vertices, through
+            allowed vertices only
+
+        Parameter:
+        s: source vertex
+        d: destination vertex
+
+        Returns:
+        route: a vertex list, None if d cannot be reached
+        """
+        return self.extremeRoute(s, d, False)
+
+
+def routeTest(numTest=3000, seed=0):
+    # check the route queries on random DAGs with restricted vertices
+    # against the recursive printAllPaths()
+    rng = random.Random(seed)
+    for test in range(numTest):
+        num = rng.randint(1, 12)
+        # random labels, so the topological order is not the identity
+        label = range(num)
+        rng.shuffle(label)
+        g = Graph(num)
+        for u in range(num):
+            for v in range(u+1, num):
+                if rng.random() < 0.35:
+                    g.addEdge(label[u], label[v])
+        allowed = [u for u in range(num) if rng.random() < 0.75]
+        g.restrict(allowed)
+        for s in range(num):
+            for d in range(num):
+                routes = [route for route in g.printAllPaths(s, d) \
+                          if all([u in allowed for u in route])]
+                assert g.allRoutes(s, d) == routes
+                assert g.countRoutes(s, d) == len(routes)
+                assert g.reachable(s, d) == (len(routes) > 0)
+                longest = g.longestRoute(s, d)
+                shortest = g.shortestRoute(s, d)
+                if len(routes) == 0:
+                    assert longest is None and shortest is None
+                    continue
+                assert longest in routes
+                assert len(longest) == max([len(route) for route in routes])
+                assert shortest in routes
+                assert len(shortest) == min([len(route) for route in routes])
+    print "routeTest: %d DAGs checked" % numTest
+
+
+def deepRouteTest(num=5000):
+    # a chain deeper than the recursion limit, and a ladder with 2^k
+    # routes counted without listing them
+    g = Graph(num)
+    for u in range(num-1):
+        g.addEdge(u, u+1)
+    assert g.allRoutes(0, num-1) == [range(num)]
+    g = Graph(num)
+    for u in range(0, num-2, 2):
+        for a in (u, u+1):
+            for b in (u+2, u+3):
+                g.addEdge(a, b)
+    assert g.countRoutes(0, num-2) == 2**((num-2)//2-1)
+    assert len(g.longestRoute(0, num-2)) == num//2
+    print "deepRouteTest: %d vertices" % num
+
+
+if __name__ == "__main__":
+    routeTest()
+    deepRouteTest()
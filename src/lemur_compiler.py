@@ -40,6 +40,7 @@ from util.lemur_nf_node import *
 from core.lemur_p4_profiler import p4_usage_checker
 import nf_placement as placeTool
 from nf_placement import log_module
+from optimization import setSolver, SOLVER_BACKENDS, gurobiAvailable
 
 
 '''
@@ -76,6 +77,20 @@ P416_LIB_DIR = "./p4_lib/"
 OUTPUT_DIR = "./"
 traverse_time = 0
 
+def shard_type(text):
+    """
+    This function parses the --shard argument 'i/n' into (i, n).
+    Input: the argument text
+    Output: the shard index and the number of shards
+    """
+    try:
+        index, count = [int(part) for part in text.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected i/n, got '%s'" % text)
+    if count < 1 or index < 0 or index >= count:
+        raise argparse.ArgumentTypeError("expected 0 <= i < n, got '%s'" % text)
+    return index, count
+
 def get_argparse():
     """
     This function generates a argument parser for Lemur compiler.
@@ -104,9 +119,64 @@ def get_argparse():
         '--mode', '-m',
         type=int,
         action="store",
-        choices=[0,1,2,3,4,5,6,7],
+        choices=[0,1,2,3,4,5,6,7,8,9,10],
+        default=0,
+        help='specify mode, 0: core_op, 1: no_profile, 2: greedy priotize one chain by another, 3: all P4, 4: no core_op, 5: E2, 6: P4 usage estimation, 7: all BESS, 8: local search within --time-budget, 9: one Gurobi MILP, 10: per-chain decomposition'
+    )
+
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=1,
+        help='number of worker processes to evaluate placements in mode 0/6 and the heuristic candidates of lemur_heuristic_compiler.py'
+    )
+
+    parser.add_argument(
+        '--keep',
+        type=int,
+        default=None,
+        help='number of best placements kept in mode 0/4/6/8/10, all by default; --iter only steps through the kept ones'
+    )
+
+    parser.add_argument(
+        '--time-budget',
+        type=float,
+        default=placeTool.TIME_BUDGET,
+        help='wall-clock budget in seconds of the local search in mode 8'
+    )
+
+    parser.add_argument(
+        '--seed',
+        type=int,
         default=0,
-        help='specify mode, 0: core_op, 1: no_profile, 2: greedy priotize one chain by another, 3: all P4, 4: no core_op, 5: E2, 6: P4 usage estimation, 7: all BESS'
+        help='seed of the local search in mode 8'
+    )
+
+    parser.add_argument(
+        '--deadline',
+        type=float,
+        default=placeTool.DEADLINE,
+        help='wall-clock deadline in seconds of the placement search in mode 0/1/4/5/6, the best placement evaluated by then is used'
+    )
+
+    parser.add_argument(
+        '--shard',
+        type=shard_type,
+        default=None,
+        help='only evaluate shard i/n (0 <= i < n) of the placements in mode 0/4/6 and write them to pattern.shard-i-of-n.bin, no code is generated'
+    )
+
+    parser.add_argument(
+        '--merge',
+        action='store_true',
+        help='merge the pattern.shard-*-of-n.bin files of all shards into the placement ranking and generate code for the best one'
+    )
+
+    parser.add_argument(
+        '--lp-solver',
+        choices=list(SOLVER_BACKENDS),
+        default='auto',
+        help='LP solver backend, auto: closed form for separable LPs, then Gurobi if licensed, otherwise numpy-simplex'
     )
 
     parser.add_argument(
@@ -137,11 +207,26 @@ def lemur_compiler_main():
 
     arg_parser = get_argparse()
     args = arg_parser.parse_args()
+    if args.shard is not None and args.mode not in [0, 4, 6]:
+        arg_parser.error('--shard needs mode 0, 4 or 6')
+    if args.merge and (args.shard is not None or args.iter):
+        arg_parser.error('--merge cannot be used with --shard or --iter')
+    if args.mode == 9 and not (args.iter or args.merge) and \
+            not gurobiAvailable():
+        arg_parser.error('--mode 9 needs gurobipy with a valid licence')
     enumerate_bool = args.iter
     of_flag = args.of
     p4_version = args.lang[0]
     op_mode = args.mode
+    jobs = args.jobs
+    keep = args.keep
+    time_budget = args.time_budget
+    seed = args.seed
+    deadline = args.deadline
+    shard = args.shard
+    merge = args.merge
     input_filename = args.file
+    setSolver(args.lp_solver)
 
     print('input mode: %d' % op_mode)
     print("NFCP Compiler Starts:")
@@ -153,8 +238,9 @@ def lemur_compiler_main():
     p4_code_name = "nf"
     final_p4_filename = os.path.join(OUTPUT_DIR, p4_code_name.strip() + ".p4")
     final_bess_filename = os.path.join(OUTPUT_DIR, p4_code_name.strip() + ".bess")
-    output_fp = open(final_p4_filename, 'w')
-    output_fp.write("\n")
+    if shard is None:
+        output_fp = open(final_p4_filename, 'w')
+        output_fp.write("\n")
 
     # Lemur compiler runs the user-level parser to read in NF chains.
     p4_logger.info('NFCP ConfParser is running...')
@@ -172,7 +258,18 @@ def lemur_compiler_main():
         pipeline_fp.close()
 
     start_time = time.time()
-    all_nf_nodes = placeTool.place_decision(conf_parser, enumerate_bool, op_mode)
+    context = placeTool.load_context()
+    if shard is not None:
+        # a shard only evaluates placements, --merge generates the code
+        shard_path = placeTool.shard_decision(conf_parser, op_mode, shard, \
+                                              jobs, context, keep, deadline)
+        print("--- %s seconds ---" % (time.time() - start_time))
+        print("Shard %d/%d written to %s" % (shard[0], shard[1], shard_path))
+        return
+    all_nf_nodes = placeTool.place_decision(conf_parser, enumerate_bool, \
+                                            op_mode, jobs, context, keep, \
+                                            time_budget, seed, deadline, \
+                                            merge)
     print("--- %s seconds ---" % (time.time() - start_time))
     all_nodes = all_nf_nodes
 
@@ -10,10 +10,12 @@
 
 from __future__ import print_function
 import os
+import sys
 import subprocess
 import collections
 import argparse
 import itertools
+import multiprocessing
 import lemur_user_level_parser as configParser
 import lemur_p4lib_parser as libParser
 import lemur_code_generator as codeGenerator
@@ -24,11 +26,13 @@ from util.lemur_nf_node import *
 import util.lemur_nf_node as ND
 from connect import stage_feasible
 from lemur_compiler import get_argparse
+from optimization import setSolver
 from user_level_parser.UDLemurUserListener \
     import convert_nf_graph, convert_global_nf_graph
 import nf_placement as placeTool
 from nf_placement import log_module
 import heuristic_util.graph as G
+import placement_util.sensitivity as sens
 
 
 STATE_INIT = 0
@@ -42,6 +46,9 @@ global last_index
 last_index = -1
 global option_set
 option_set = []
+# routes listed per end node pair, beyond this only the longest and
+# the shortest route are tried
+MAX_OFFLOAD_ROUTES = 64
 
 
 def parse_all_node(lemur_parser):
@@ -58,18 +65,19 @@ def parse_all_node(lemur_parser):
     modules.sort(key=lambda l: (l.service_path_id, l.service_id))
     return modules
 
-def init_allp4(module_list):
+def init_allp4(module_list, context):
     """ Set module to be deployed at P4 if feasible
 
     Parameter:
     module_list: all NF modules
+    context: the PlacementContext of this run
 
     Returns:
     module_list: all NF modules with P4 module notated
     """
     index = 0
     global last_index, option_set
-    para_list,_ = placeTool.read_para()
+    para_list = context.bess_para
     for module in module_list:
         if module.nf_type == 2:
             module.nf_type = 0
@@ -196,12 +204,13 @@ def next_placement_to_offload_p4(module_list):
 
     return module_list
 
-def core_allocation_for_highest_tput_derived_from_LP(module_list):
+def core_allocation_for_highest_tput_derived_from_LP(module_list, context):
     """ Run core allocation and estimate throughput to get
         final chosen placement and core allocation
 
     Parameter:
     module_list: all NF modules
+    context: the PlacementContext of this run
 
     Returns:
     find_solution: flagged if a SLO-satisfying placement is found
@@ -209,10 +218,31 @@ def core_allocation_for_highest_tput_derived_from_LP(module_list):
     expected_throughput: the estimated throughput for chosen placement
 
     """
-    find_solution = False
     chosen_module_list = copy.deepcopy(module_list)
-    throughput_list, bess_dict_para = placeTool.heuristic_core_allocation(module_list)
-    
+    throughput_list, bess_dict_para = \
+        placeTool.heuristic_core_allocation(module_list, context)
+    return pick_core_allocation(module_list, chosen_module_list, \
+                                throughput_list, bess_dict_para)
+
+def pick_core_allocation(module_list, chosen_module_list, throughput_list, \
+                         bess_dict_para):
+    """ Apply the highest-throughput core allocation of a candidate,
+        see core_allocation_for_highest_tput_derived_from_LP()
+
+    Parameter:
+    module_list: all NF modules after core allocation
+    chosen_module_list: a copy of the modules before core allocation,
+                        returned if no allocation satisfies the SLOs
+    throughput_list: evaluated placements and core allocations
+    bess_dict_para: a dictionary of BESS moduels and its profiled
+                    CPU cycles
+
+    Returns:
+    find_solution: flagged if a SLO-satisfying placement is found
+    chosen_module_list: all NF modules with notated placement info
+    expected_throughput: the estimated throughput for chosen placement
+    """
+    find_solution = False
     if len(throughput_list)>0:
         find_solution = True
         chosen_pattern, core_alloc, expected_throughput = \
@@ -226,6 +256,67 @@ def core_allocation_for_highest_tput_derived_from_LP(module_list):
         expected_throughput = 0
     return find_solution, chosen_module_list, expected_throughput
 
+def pool_core_allocation(candidate):
+    """ Run core allocation of a heuristic candidate inside a pool
+        worker
+
+    Parameter:
+    candidate: a tuple of (NF modules, PlacementContext, error rate)
+
+    Returns:
+    module_list: the NF modules after core allocation
+    chosen_module_list: a copy of the modules before core allocation
+    throughput_list: evaluated placements and core allocations, None
+                     if the placement routines exited
+    """
+    module_list, context, error_rate = candidate
+    placeTool.error_rate = error_rate
+    chosen_module_list = copy.deepcopy(module_list)
+    try:
+        throughput_list, _ = \
+            placeTool.heuristic_core_allocation(module_list, context)
+    except SystemExit:
+        # an exiting worker would hang the pool, exit in the parent
+        return module_list, chosen_module_list, None
+    return module_list, chosen_module_list, throughput_list
+
+def candidate_core_allocation(candidate_list, context, jobs=1):
+    """ Run core_allocation_for_highest_tput_derived_from_LP() on
+        each candidate. With several jobs, the candidates are
+        evaluated by a process pool and picked in order, so the
+        result is the same as a serial run.
+
+    Parameter:
+    candidate_list: candidate placements, lists of NF modules
+    context: the PlacementContext of this run
+    jobs: number of worker processes
+
+    Returns:
+    a list of (find_solution, chosen_module_list, expected_throughput)
+    in the order of |candidate_list|
+    """
+    if jobs <= 1 or len(candidate_list) <= 1:
+        return [core_allocation_for_highest_tput_derived_from_LP(case_list, \
+                                                                  context) \
+                for case_list in candidate_list]
+
+    pool = multiprocessing.Pool(min(jobs, len(candidate_list)))
+    try:
+        allocations = pool.map(pool_core_allocation, \
+                               [(case_list, context, placeTool.error_rate) \
+                                for case_list in candidate_list], 1)
+    finally:
+        pool.close()
+        pool.join()
+    results = []
+    for module_list, chosen_module_list, throughput_list in allocations:
+        if throughput_list is None:
+            sys.exit()
+        results.append(pick_core_allocation(module_list, chosen_module_list, \
+                                            throughput_list, \
+                                            context.bess_para))
+    return results
+
 def least_change(throughput_dict):
     key = 0
     index = 0
@@ -239,7 +330,8 @@ def least_change(throughput_dict):
     return key, index
 
 def get_graph(chain_module):
-    """ Base on a chain of modules to construct a graph
+    """ Base on a chain of modules to construct a graph, routes
+        of the graph only go through modules BESS can run
 
     Parameter:
     chain_module: a chain of modules
@@ -249,10 +341,14 @@ def get_graph(chain_module):
 
     """
     g = G.Graph(len(chain_module))
+    index_of = dict([(module, index) \
+                     for index, module in enumerate(chain_module)])
     for index in range(len(chain_module)):
         module = chain_module[index]
         for child in module.adj_nodes:
-            g.addEdge(index, chain_module.index(child))
+            g.addEdge(index, index_of[child])
+    g.restrict([index for index in range(len(chain_module)) \
+                if chain_module[index].nf_class in bess_module_list])
     return g
 
 def can_offload(pair, chain, g):
@@ -262,10 +358,13 @@ def can_offload(pair, chain, g):
     Parameter:
     pair: a pair of subgroups
     chain: modules of a chain
-    g: graph of a chain
+    g: graph of a chain, see get_graph()
 
     Returns:
-    offload_route: which modules can be offloaded
+    offload_route: which modules can be offloaded, routes whose
+                   modules can all run on BESS; only the longest and
+                   the shortest route of an end node pair with more
+                   than MAX_OFFLOAD_ROUTES routes
     """
     offload_route = []
     subgroup_1 = pair[0]
@@ -292,26 +391,28 @@ def can_offload(pair, chain, g):
                     add_to_latter_queue = True
             if add_to_latter_queue:
                 end_node_queue_2.append(chain.index(lead_node))
-    src_dest = list(itertools.product(*([end_node_queue_1, end_node_queue_2])))
-    for target_src_dest in src_dest:
-        src = target_src_dest[0]
-        dest = target_src_dest[1]
-        route_list = g.printAllPaths(src,dest)
-        for route in route_list:
-            add_to_potential_bounce = True
-            for route_index in route:
-                if (chain[route_index].nf_class not in bess_module_list):
-                    add_to_potential_bounce = False
-            if add_to_potential_bounce:
-                offload_route.append(route)
+    for src, dest in itertools.product(end_node_queue_1, end_node_queue_2):
+        if not g.reachable(src, dest):
+            continue
+        if g.countRoutes(src, dest) <= MAX_OFFLOAD_ROUTES:
+            offload_route.extend(g.allRoutes(src, dest))
+            continue
+        # too many routes to score each one: the longest offloads the
+        # most modules, the shortest bounces the least
+        longest = g.longestRoute(src, dest)
+        shortest = g.shortestRoute(src, dest)
+        offload_route.append(longest)
+        if shortest != longest:
+            offload_route.append(shortest)
     return offload_route
 
-def potential_better_placement(module_list, strict_flag):
+def potential_better_placement(module_list, strict_flag, context):
     """ Coalesce subgroups 
 
     Parameter:
     module_list: all NF modules
     strict_flag: flagged if using strict coalescing
+    context: the PlacementContext of this run
 
     Returns:
     final_list: NF modules with coalescing placement
@@ -319,15 +420,13 @@ def potential_better_placement(module_list, strict_flag):
     copy_module_list = copy.deepcopy(module_list)
     chain_module, _ = placeTool.segment_module_list(copy_module_list)
     offload_option = {}
-    para_list, _ = placeTool.read_para()
-    chain_rate = placeTool.get_rate()
+    para_list = context.bess_para
+    chain_rate = context.chain_rate
     for chain in chain_module:
         g = get_graph(chain)
-        chain_copy = copy.deepcopy(chain)
-        chain_bess, chain_p4 = placeTool.bfs_sort(chain_copy)
-        updated_chain_bess = copy.deepcopy(chain_bess)
-        if len(updated_chain_bess)>1:
-            for pair in itertools.combinations(updated_chain_bess, 2):
+        chain_bess, chain_p4 = placeTool.bfs_sort(chain)
+        if len(chain_bess)>1:
+            for pair in itertools.combinations(chain_bess, 2):
                 offload_route = can_offload(pair, chain, g)
                 if len(offload_route)>0:
                     if chain_module.index(chain) not in offload_option:
@@ -335,8 +434,7 @@ def potential_better_placement(module_list, strict_flag):
                     offload_option[chain_module.index(chain)].extend(offload_route)
     offload_case = {}
     for key in offload_option:
-        chain_copy = copy.deepcopy(chain_module[key])
-        chain_bess, _ = placeTool.bfs_sort(chain_copy)
+        chain_bess, _ = placeTool.bfs_sort(chain_module[key])
         route_list = offload_option[key]
         route_list = sorted(route_list,key = len, reverse=True)
         for route in route_list:
@@ -349,11 +447,10 @@ def potential_better_placement(module_list, strict_flag):
                         if subgroup not in target_subgroup:
                             target_subgroup.append(subgroup)
                 chain_another_copy[index].nf_type = 1
-            chain_new_copy = copy.deepcopy(chain_another_copy)
             chain_bess_after, _ = placeTool.bfs_sort(chain_another_copy)
             target_subgroup = []
             for subgroup in chain_bess_after:
-                if chain_new_copy[route[0]] in subgroup:
+                if chain_another_copy[route[0]] in subgroup:
                     target_subgroup = subgroup
             for module in target_subgroup:
                 if module.nf_class in dup_avoid_list:
@@ -428,11 +525,12 @@ def potential_better_placement(module_list, strict_flag):
 
     return final_list
 
-def next_smaller_bounce_placement(module_list):
+def next_smaller_bounce_placement(module_list, context):
     """ Find smaller bounce placement from current placement
 
     Parameter:
     module_list: all NF modules
+    context: the PlacementContext of this run
 
     Returns:
     final_list: NF modules with smaller bounce placement
@@ -441,22 +539,19 @@ def next_smaller_bounce_placement(module_list):
     chain_module, _ = placeTool.segment_module_list(copy_module_list)
     offload_option = {}
     offload_throughput = {}
-    para_list,_ = placeTool.read_para()
+    para_list = context.bess_para
     for chain in chain_module:
         g = get_graph(chain)
-        chain_copy = copy.deepcopy(chain)
-        chain_bess, chain_p4 = placeTool.bfs_sort(chain_copy)
-        updated_chain_bess = copy.deepcopy(chain_bess)
-        if len(updated_chain_bess)>1:
-            for pair in itertools.combinations(updated_chain_bess, 2):
+        chain_bess, chain_p4 = placeTool.bfs_sort(chain)
+        if len(chain_bess)>1:
+            for pair in itertools.combinations(chain_bess, 2):
                 offload_route = can_offload(pair, chain, g)
                 if len(offload_route)>0:
                     if chain_module.index(chain) not in offload_option:
                         offload_option[chain_module.index(chain)] = []
                     offload_option[chain_module.index(chain)].extend(offload_route)
     for key in offload_option:
-        chain_copy = copy.deepcopy(chain_module[key])
-        chain_bess, _ = placeTool.bfs_sort(chain_copy)
+        chain_bess, _ = placeTool.bfs_sort(chain_module[key])
         subgroup_throughput = []
         for subgroup in chain_bess:
             left_vector, right_const = placeTool.inequal_form(subgroup, \
@@ -493,73 +588,56 @@ def next_smaller_bounce_placement(module_list):
         final_list = final_list + chain
     return final_list
 
-def heuristic_main():
-    """ Run heuristic algorithm and select deploymenet placement
-        and generate hardware codes
+def reset_offload_state():
+    """ Forget the P4 offload options of a previous search, see
+        init_allp4() and next_placement_to_offload_p4()
     """
+    global last_index, option_set
+    del option_nf[:]
+    option_set = []
+    last_index = -1
 
-    #parse_user_configuration_chain
-    global bess_module_list, p4_module_list, p4_14_module_list, dup_avoid_list
-    global CONF_LIB, P414_LIB_DIR, P416_LIB_DIR, OUTPUT_DIR
-    global error_rate
-
-    print("List all user-level configuration scripts:")
-    subprocess.call(['ls', './user_level_examples'])
-
-    arg_parser = get_argparse()
-    args = arg_parser.parse_args()
-    enumerate_bool = args.iter
-    of_flag = args.of
-    pisa_flag = args.pisa
-    p4_version = args.lang[0]
-    op_mode = args.mode
-    input_filename = args.file
+def heuristic_placement(conf_parser, nf_node_list, context, pisa_flag, \
+                        p4_filename, p4_version, fit_cache=None, jobs=1):
+    """ Run the heuristic state machine on parsed NF modules
 
-    config_filename = './user_level_examples/'+input_filename+'.conf'
-    entry_filename = input_filename
-    p4_code_name = "heuristic"
-    final_p4_filename = os.path.join(OUTPUT_DIR, p4_code_name.strip() + ".p4")
-    final_bess_filename = os.path.join(OUTPUT_DIR, p4_code_name.strip() + ".bess")
+    Parameter:
+    conf_parser: DAG parser
+    nf_node_list: all NF modules with weights tagged, not modified
+    context: the PlacementContext of this run
+    pisa_flag: flagged if p4c checks the P4 placements
+    p4_filename: p4 code filename used by the p4c checks
+    p4_version: p4 language version 14 or 16
+    fit_cache: an optional dictionary of P4 placement and its p4c
+               result, shared by several searches on the same modules
+    jobs: number of worker processes evaluating the candidates
 
+    Returns:
+    find_solution: flagged if a SLO-satisfying placement is found
+    node_list: all NF modules with notated placement info
+    expected_throughput: the estimated throughput of the placement
     """
-    Handle OpenFlow case    
-    """
-    of_module = {
-        #'ACL': 'acl.lib',
-        'IPv4Forward': 'ipv4_forward.lib',
-        'VLANPush': 'vlan_add.lib',
-        'VLANPop': 'vlan_rm.lib',
-        #'HashLB':'hash_lb.lib'    
-        }
-    if of_flag:
-        ND.p4_module_list = of_module
-        ND.p4_14_module_list = of_module
+    reset_offload_state()
+    node_list = init_allp4(copy.deepcopy(nf_node_list), context)
 
-    print('Lemur ConfParser is running...')
-    conf_parser = configParser.Lemur_config_parser(config_filename)
-    for flowspec_name, nfchain_name in conf_parser.scanner.flowspec_nfchain_mapping.items():
-        chain_ll_node = conf_parser.scanner.struct_nlinkedlist_dict[nfchain_name]
-        flowspec_instance = conf_parser.scanner.struct_nlist_dict[flowspec_name]
-        print(chain_ll_node._draw_pipeline())
-        pipeline_fp = open(('_pipeline.txt'), 'a+')
-        pipeline_fp.write(chain_ll_node._draw_pipeline())
-        pipeline_fp.close()
-
-    nf_node_list = parse_all_node(conf_parser)
-    weight_dict = placeTool.generate_weight(nf_node_list)
-    nf_node_list = placeTool.tag_weight(nf_node_list, weight_dict)
-    node_list = init_allp4(nf_node_list)
-    
     state = STATE_INIT
     find_solution = False
     stop_search = False
     candidate_list = []
+    expected_throughput = 0
 
     while(not stop_search):
         
         if state == 0: 
             if pisa_flag:
-                success = fitp4(conf_parser, node_list, final_p4_filename, p4_version)
+                p4_placement = tuple([module.nf_type for module in node_list])
+                if fit_cache is not None and p4_placement in fit_cache:
+                    success = fit_cache[p4_placement]
+                else:
+                    success = fitp4(conf_parser, node_list, p4_filename, \
+                                    p4_version)
+                    if fit_cache is not None:
+                        fit_cache[p4_placement] = success
             else:
                 success = True  ## Skip remote compilation if the result is known 
             if success: state = 1.5
@@ -572,9 +650,11 @@ def heuristic_main():
 
         elif state == 1.5:
             candidate_list.append(copy.deepcopy(node_list))
-            advanced_list = potential_better_placement(node_list, False)
+            advanced_list = potential_better_placement(node_list, False, \
+                                                       context)
             candidate_list.append(advanced_list)
-            strict_advanced_list = potential_better_placement(node_list, True)
+            strict_advanced_list = potential_better_placement(node_list, True, \
+                                                              context)
             candidate_list.append(strict_advanced_list)
             if(len(candidate_list)!=0):  state = 2
             else: state = 5
@@ -583,9 +663,8 @@ def heuristic_main():
             new_candidate_list = []
             throughput_list = []
             satisfy_SLO = False
-            for case_list in candidate_list:
-                SLO_result, case_list, estimate_throughput = \
-                    core_allocation_for_highest_tput_derived_from_LP(case_list)
+            for SLO_result, case_list, estimate_throughput in \
+                    candidate_core_allocation(candidate_list, context, jobs):
                 if SLO_result:
                     satisfy_SLO = True
                 new_candidate_list.append(case_list)
@@ -593,13 +672,14 @@ def heuristic_main():
             if satisfy_SLO: 
                 get_index = throughput_list.index(max(throughput_list))
                 node_list = new_candidate_list[get_index]
+                expected_throughput = throughput_list[get_index]
                 state = 4
             else:  
                 node_list = new_candidate_list[0]
                 state = 3
                     
         elif state == 3: 
-            node_list = next_smaller_bounce_placement(node_list)
+            node_list = next_smaller_bounce_placement(node_list, context)
             candidate_list = []
             candidate_list.append(node_list)
             if(len(node_list) != 0):  state = 2
@@ -611,7 +691,212 @@ def heuristic_main():
                     
         elif state == 5: 
             stop_search = True
-    
+
+    return find_solution, node_list, expected_throughput
+
+def sensitivity_sweep(conf_parser, nf_node_list, context, perturbations, \
+                      pisa_flag, p4_filename, p4_version, jobs=1):
+    """ Place the parsed NF modules under each perturbation and
+        compare with the unperturbed placement. The DAG is parsed
+        once, p4c results and subgroup rows are shared by all runs,
+        and no code is generated.
+
+    Parameter:
+    conf_parser: DAG parser
+    nf_node_list: all NF modules with weights tagged
+    context: the PlacementContext of the unperturbed run
+    perturbations: a list of sensitivity.Perturbation
+    pisa_flag: flagged if p4c checks the P4 placements
+    p4_filename: p4 code filename used by the p4c checks
+    p4_version: p4 language version 14 or 16
+    jobs: number of worker processes evaluating the candidates
+
+    Returns:
+    base_throughput: the estimated throughput of the unperturbed
+                     placement, None if there is no placement
+    report: a list of (perturbation, status, changed modules,
+            estimated throughput)
+    """
+    fit_cache = {}
+    base_error_rate = placeTool.error_rate
+
+    def place(run_context):
+        try:
+            find_solution, node_list, throughput = \
+                heuristic_placement(conf_parser, nf_node_list, run_context, \
+                                    pisa_flag, p4_filename, p4_version, \
+                                    fit_cache, jobs)
+        except SystemExit:
+            # the placement routines exit when nothing fits
+            return [], None
+        if not find_solution:
+            return [], None
+        return get_module_info(node_list), throughput
+
+    report = []
+    try:
+        base_info, base_throughput = place(context)
+        for perturbation in perturbations:
+            placeTool.error_rate = perturbation.error_rate
+            info, throughput = place(perturbation.apply(context))
+            status, changed = sens.compare_placement(base_info, info)
+            report.append((perturbation, status, changed, throughput))
+    finally:
+        placeTool.error_rate = base_error_rate
+    return base_throughput, report
+
+def print_sensitivity_report(base_throughput, report):
+    """ Print the outcome of a sensitivity sweep
+
+    Parameter:
+    base_throughput: the estimated throughput of the unperturbed
+                     placement
+    report: see sensitivity_sweep()
+    """
+    if base_throughput is None:
+        print('cannot find solution without perturbation')
+    else:
+        print('unperturbed throughput: %f' % base_throughput)
+    for perturbation, status, changed, throughput in report:
+        if throughput is None:
+            throughput = 0
+        print(colored('%-12s %-9s changed: %d throughput: %f' % \
+                      (perturbation.label, status, changed, throughput), \
+                      'blue'))
+    summary = sens.stability_summary(report)
+    print('stability: %d/%d SAME, %d Different, %d INVALID' % \
+          (summary[sens.SAME], len(report), summary[sens.DIFFERENT], \
+           summary[sens.INVALID]))
+
+def get_heuristic_argparse():
+    """ Get the argument parser of the Lemur compiler with the
+        options of the heuristic compiler
+
+    Returns:
+    argparser
+    """
+    parser = get_argparse()
+    parser.add_argument(
+        '--sensitivity',
+        choices=['error', 'profile'],
+        default=None,
+        help='skip code generation and report placement stability, error: global profile errors, profile: sampled per-module cycle errors'
+    )
+    parser.add_argument(
+        '--error-range',
+        type=int,
+        default=10,
+        help='largest global profile error in percent for --sensitivity error'
+    )
+    parser.add_argument(
+        '--samples',
+        type=int,
+        default=20,
+        help='number of sampled profiles for --sensitivity profile'
+    )
+    parser.add_argument(
+        '--sigma',
+        type=float,
+        default=0.05,
+        help='standard deviation of the per-module cycle error for --sensitivity profile'
+    )
+    parser.add_argument(
+        '--sample-seed',
+        type=int,
+        default=0,
+        help='seed of the sampled profiles for --sensitivity profile'
+    )
+    return parser
+
+def heuristic_main(args=None):
+    """ Run heuristic algorithm and select deploymenet placement
+        and generate hardware codes
+
+    Parameter:
+    args: parsed arguments, parsed from the command line if None
+
+    Returns:
+    node_list: all NF modules with notated placement info, or the
+               sensitivity report with --sensitivity
+    """
+
+    #parse_user_configuration_chain
+    global bess_module_list, p4_module_list, p4_14_module_list, dup_avoid_list
+    global CONF_LIB, P414_LIB_DIR, P416_LIB_DIR, OUTPUT_DIR
+    global error_rate
+
+    print("List all user-level configuration scripts:")
+    subprocess.call(['ls', './user_level_examples'])
+
+    if args is None:
+        arg_parser = get_heuristic_argparse()
+        args = arg_parser.parse_args()
+    enumerate_bool = args.iter
+    of_flag = args.of
+    pisa_flag = args.pisa
+    p4_version = args.lang[0]
+    op_mode = args.mode
+    jobs = args.jobs
+    input_filename = args.file
+    setSolver(args.lp_solver)
+
+    config_filename = './user_level_examples/'+input_filename+'.conf'
+    entry_filename = input_filename
+    p4_code_name = "heuristic"
+    final_p4_filename = os.path.join(OUTPUT_DIR, p4_code_name.strip() + ".p4")
+    final_bess_filename = os.path.join(OUTPUT_DIR, p4_code_name.strip() + ".bess")
+
+    """
+    Handle OpenFlow case    
+    """
+    of_module = {
+        #'ACL': 'acl.lib',
+        'IPv4Forward': 'ipv4_forward.lib',
+        'VLANPush': 'vlan_add.lib',
+        'VLANPop': 'vlan_rm.lib',
+        #'HashLB':'hash_lb.lib'    
+        }
+    if of_flag:
+        ND.p4_module_list = of_module
+        ND.p4_14_module_list = of_module
+
+    print('Lemur ConfParser is running...')
+    conf_parser = configParser.Lemur_config_parser(config_filename)
+    for flowspec_name, nfchain_name in conf_parser.scanner.flowspec_nfchain_mapping.items():
+        chain_ll_node = conf_parser.scanner.struct_nlinkedlist_dict[nfchain_name]
+        flowspec_instance = conf_parser.scanner.struct_nlist_dict[flowspec_name]
+        print(chain_ll_node._draw_pipeline())
+        pipeline_fp = open(('_pipeline.txt'), 'a+')
+        pipeline_fp.write(chain_ll_node._draw_pipeline())
+        pipeline_fp.close()
+
+    context = placeTool.load_context()
+    nf_node_list = parse_all_node(conf_parser)
+    weight_dict = placeTool.generate_weight(nf_node_list)
+    nf_node_list = placeTool.tag_weight(nf_node_list, weight_dict)
+
+    if args.sensitivity is not None:
+        if args.sensitivity == 'error':
+            perturbations = sens.error_rate_perturbations(args.error_range)
+        else:
+            perturbations = sens.profile_perturbations(context.bess_para, \
+                                                       args.samples, \
+                                                       args.sigma, \
+                                                       args.sample_seed)
+        base_throughput, report = sensitivity_sweep(conf_parser, \
+                                                    nf_node_list, context, \
+                                                    perturbations, \
+                                                    pisa_flag, \
+                                                    final_p4_filename, \
+                                                    p4_version, jobs)
+        print_sensitivity_report(base_throughput, report)
+        return report
+
+    find_solution, node_list, _ = heuristic_placement(conf_parser, \
+                                                      nf_node_list, context, \
+                                                      pisa_flag, \
+                                                      final_p4_filename, \
+                                                      p4_version, jobs=jobs)
 
     if find_solution: 
         if not of_flag:
@@ -623,47 +908,35 @@ def heuristic_main():
         else:
             output_list = []
         bess_code(conf_parser, node_list, final_bess_filename)
-        return 
+        return node_list
     else:
         print('cannot find solution')
         sys.exit()
         return
 
 def get_module_info(node_list):
-    """ Retrive module's nic index and core numbers
+    """ Retrive module's placement, nic index and core numbers
 
     Parameter:
     node_list: a list of modules
 
     Returns:
-    module_info: a list of <nic_index, core_num>
+    module_info: a list of <nf_type, nic_index, core_num>
     """
 
     module_info = []
     for module in node_list:
-        module_info.append([module.nic_index, module.core_num])
+        module_info.append([module.nf_type, module.nic_index, module.core_num])
     return module_info
 
 
 def error_call():
     """ Run +/-10% error and notate if the placement differs
     """
-    standard_result = heuristic_main()
-    default_info = get_module_info(standard_result)
-    final_result = []
-    for i in range(21):
-        error_percent = (i-10)/100.0
-        placeTool.error_rate = error_percent
-        compare_result = heuristic_main()
-        compare_info = get_module_info(compare_result)
-        if(compare_info == default_info):
-            final_result.append([error_percent,"SAME"])
-        elif compare_info == list():
-            final_result.append([error_percent,"INVALID"])
-        else:
-            final_result.append([error_percent,"Different"])
-    for item in final_result:
-        print(colored(item, 'blue'))
+    args = get_heuristic_argparse().parse_args()
+    args.sensitivity = 'error'
+    args.error_range = 10
+    return heuristic_main(args)
 
 def target_compare():
     """ Add error to profiled cycles and run heuristic
@@ -137,10 +137,11 @@ class Lemur_config_parser(object):
 		p4_node_lists = []
 		global_graph = convert_global_nf_graph(self.scanner)
 
+		decision_dict = nfcp_nf_node_lookup(placement_decision)
 		global_graph_list = global_graph.list_modules()
 		for idx in range(len(global_graph_list)):
 			curr = global_graph_list[idx]
-			comp_curr = placement_decision[placement_decision.index(curr)]
+			comp_curr = decision_dict[curr]
 			curr.bind_node_nf_type(comp_curr.nf_type)
 
 		p4_node_lists.append(global_graph.get_p4_nodes())
@@ -170,12 +171,14 @@ class Lemur_config_parser(object):
 		Output: a list of nfchain_graph (type=list)
 		"""
 		res_graphs = {}
+		if placement_decision:
+			decision_dict = nfcp_nf_node_lookup(placement_decision)
 		for flowspec, nfchain in self.scanner.flowspec_nfchain_mapping.items():
 			nfchain_ll_node = self.scanner.struct_nlinkedlist_dict[nfchain]
 			res_graphs[nfchain] = convert_nf_graph(nfchain_ll_node)
 			if placement_decision:
 				for nf_node in res_graphs[nfchain].list_modules():
-					op_nf_node = placement_decision[placement_decision.index(nf_node)]
+					op_nf_node = decision_dict[nf_node]
 					nf_node.bind_node_nf_type(op_nf_node.nf_type)
 		return res_graphs
 
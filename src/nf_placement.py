@@ -11,16 +11,33 @@ import copy
 import re
 import json
 import time
-import ast
 import random
 import sys
+import multiprocessing
 import numpy as np
 from ast import literal_eval as make_tuple
 from user_level_parser.UDLemurUserListener \
     import convert_nf_graph, convert_global_nf_graph
 from collections import OrderedDict, defaultdict
 from operator import itemgetter
-from optimization import maximizeMarginalRate, marginalRate
+from optimization import maximizeMarginalRate, marginalRate, \
+    maximizeMarginalRateBatch
+from placement_util.eval_kernel import EvalKernel
+from placement_util.core_alloc import iter_core_alloc, core_upper_bound
+from placement_util.row_cache import RowCache
+from placement_util.subgroup import partition_subgroups, index_modules
+from placement_util.context import CONTEXT_FILES, make_context, file_stamp
+from placement_util.pattern_store import PATTERN_STORE_FILE, \
+    SHARD_STORE_FILE, PatternStore, write_pattern_store, find_shard_stores
+from placement_util.result_sink import ResultSink
+from placement_util.nic_assign import nic_classes, iter_nic_assign
+from placement_util.local_search import Annealer
+from placement_util.decompose import rate_curve, split_cores, \
+    core_steps, knapsack_combine
+from placement_util.symmetry import chain_orbits, option_key
+from placement_util.progress import Progress
+from placement_util.milp import MILPModel, solve_gurobi, BINARY, INTEGER, \
+    LESS_EQUAL, EQUAL, GREATER_EQUAL
 
 
 PLACE_LOGGER = logging.getLogger("placement_logger")
@@ -43,6 +60,35 @@ MAX_THROUGHPUT = 6400000000
 CPU_FREQ = 1700000000
 PKT_SIZE = 1500*8
 FREQ = 1700
+POOL_CHUNK_SIZE = 64
+SUBGROUP_CACHE_SIZE = 65536
+DELAY_BLOCK_SIZE = 1024
+# core allocations of a placement solved in one LP batch
+LP_BATCH_SIZE = 1024
+# throughput of placements dropped by a bounded ResultSink
+RESULT_SAMPLE_SIZE = 1024
+RESULT_HISTOGRAM_BINS = 10
+# wall-clock budget (seconds) of the local search, mode 8
+TIME_BUDGET = 10.0
+# most subgradient steps on the NIC multipliers of the decomposition,
+# mode 10
+LAGRANGE_STEPS = 30
+LAGRANGE_STEP_SIZE = 1.0
+# the steps stop once no multiplier moves by more than this
+LAGRANGE_TOL = 1e-2
+# smallest relative gain of an improvement step
+DECOMPOSE_GAIN = 1e-9
+# most placements of a chain with branches enumerated by the MILP,
+# mode 9
+MILP_ENUM_CAP = 1024
+# unit (bps) of the chain throughput in the MILP
+MILP_RATE_UNIT = 1000000.0
+# wall-clock deadline (seconds) of the exhaustive modes, None for none
+DEADLINE = None
+# constraint rows of node-based subgroups, see inequal_form()
+subgroup_row_cache = RowCache(SUBGROUP_CACHE_SIZE)
+# (file stamp, PlacementContext) of the last load_context()
+context_state = None
 
 def read_para():
     """ Read data from module_data.txt and construct
@@ -90,39 +136,99 @@ def enum_case(module_list):
     enum_list: a list of all possible placement
     """
 
-    option_count = 0
-    enum_list = []
+    return list(iter_case(module_list))
 
-    for module in module_list:
+def iter_case(module_list, prune=None, shard=None):
+    """ Lazily enum all possible placement for NF chain, in the
+        same order as enum_case(). Modules that can be either P4
+        or BESS are decided from the last one to the first one,
+        trying P4 before BESS.
+
+    Parameter:
+    module_list: all NF modules
+    prune: an optional callback prune(pattern, decided_index). All
+           options at module index >= decided_index are decided in
+           |pattern| (the others are still P4). Returns True to drop
+           every placement below this partial decision.
+    shard: an optional (index, count), only the placements whose
+           position (see case_position()) is |index| modulo |count|
+           are enumerated
+
+    Returns:
+    a generator of possible placements
+    """
+    node_num = len(module_list)
+    base_pattern = 0
+    option_index = []
+    for index in range(node_num):
+        module = module_list[index]
+        base_pattern = (base_pattern<<1)
         if module.is_both():
-            option_count += 1
+            option_index.append(index)
+        elif module.is_bess():
+            base_pattern += 1
+
+    if prune is not None and prune(base_pattern, node_num):
+        return
+    if len(option_index) == 0:
+        if shard is None or shard[0] == 0:
+            yield base_pattern
+        return
+
+    depth = len(option_index)-1
+    option_bit = 1<<(node_num-option_index[depth]-1)
+    stack = [(depth, base_pattern|option_bit), (depth, base_pattern)]
+    while len(stack)>0:
+        depth, pattern = stack.pop()
+        if prune is not None and prune(pattern, option_index[depth]):
+            continue
+        if depth == 0:
+            if shard is None or \
+                    option_key(pattern, node_num, option_index)%shard[1] == \
+                    shard[0]:
+                yield pattern
+        else:
+            option_bit = 1<<(node_num-option_index[depth-1]-1)
+            stack.append((depth-1, pattern|option_bit))
+            stack.append((depth-1, pattern))
 
-    if option_count>0:
-        total_case = (1<<option_count)
-    else:
-        total_case = 0
+def case_position(module_list):
+    """ Build a function giving the position of a placement in
+        iter_case() order, pruned placements included
 
-    for case_num in range(total_case):
-        pattern = 0
-        case_num_copy = case_num
-        for module in module_list:
-            pattern = (pattern<<1)
-            if module.is_both():
-                pattern += case_num_copy % 2
-                case_num_copy = case_num_copy>>1
-            elif module.is_bess():
-                pattern += 1
-        enum_list.append(pattern)
-
-    if option_count == 0:
-        pattern_none = 0
-        for module in module_list:
-            pattern_none = (pattern_none<<1)
-            if module.is_bess():
-                pattern_none += 1
-        enum_list.append(pattern_none)
+    Parameter:
+    module_list: all NF modules
+
+    Returns:
+    position: the function position(pattern)
+    space: number of positions
+    """
+    node_num = len(module_list)
+    option_index = [index for index in range(node_num) \
+                    if module_list[index].is_both()]
+
+    def position(pattern):
+        return option_key(pattern, node_num, option_index)
+
+    return position, 1<<len(option_index)
 
-    return enum_list
+def case_fraction(module_list):
+    """ Build a function giving the fraction of all placements that
+        iter_case() enumerates up to and including a placement,
+        pruned ones included
+
+    Parameter:
+    module_list: all NF modules
+
+    Returns:
+    fraction: the function fraction(pattern)
+    """
+    position, space = case_position(module_list)
+
+    def fraction(pattern):
+        return (position(pattern)+1)/float(space)
+
+    return fraction
 
 def notate_list(target_list, bess_core, mask_pattern):
     """ Notate deployment hardware and assigned # of cores
@@ -190,68 +296,75 @@ def segment_module_list(all_modules):
         chain_module_list.append(module_list)
     return chain_module_list, cut_index
 
-def no_core_op_calc_cycle(pattern_list, module_list, bess_para):
+def no_core_op_calc_cycle(pattern_list, module_list, context, sink=None, \
+                          progress=None, shard=None):
     """ Calculate the throughput of no_core_optimization algorithm
 
     Parameter:
-    pattern_list: all possible placements
+    pattern_list: all possible placements, None to enumerate them
+                  lazily
     module_list: all NF modules
-    bess_para: BESS module name mapping to profiled cycles
+    context: the PlacementContext of this run
+    sink: the ResultSink collecting the placements, keeps all of
+          them if None
+    progress: an optional Progress counting the evaluated placements,
+              the enumeration stops at its deadline
+    shard: an optional (index, count) of the placements to enumerate,
+           see iter_case()
 
     Returns:
     pattern_throughput_dict: a dictionary of placement and its
                              corresponding throughput
     """
-    nic = get_nic_info()
-    pattern_throughput_dict = []
-    module_list = tag_chain_index(module_list)
-    weight_dict = generate_weight(module_list)
-    module_list = tag_weight(module_list, weight_dict)
-    chain_rate = get_rate()
-    total_chain_num = len(chain_rate)
+    if sink is None:
+        sink = ResultSink()
+    module_list, kernel = build_eval_kernel(module_list, context.bess_para)
+    chain_rate = context.chain_rate
+    spare_core, nic_throughput, cpu_freq = nic_resources(context)
+    nic_class = nic_class_list(context)
+    if pattern_list is None:
+        pattern_list = iter_case(module_list, \
+                                 symmetry_prune(kernel, context), shard)
+    if progress is not None:
+        pattern_list = progress.track(pattern_list, sink.best_value)
     for pattern in pattern_list:
         if pattern == 0:
             module_info = []
             for module in module_list:
                 module_info.append([module.nic_index, module.core_num]) 
-            pattern_throughput_dict.append([0, module_info, MAX_THROUGHPUT])
-        else:
-            module_list_backup = copy.deepcopy(module_list)
-            total_module_num = len(module_list)
-            for module_index in range(total_module_num):
-                mode_bit = (pattern>>(total_module_num - module_index-1))%2
-                module_list_backup[module_index].nf_type = mode_bit
-                if mode_bit == 1:
-                    module_list_backup[module_index].nic_index = 0
-            notate_module_list = module_list_backup
-            cp_final_module = copy.deepcopy(notate_module_list)
-
-            bess_subgroup_list, p4_list = bfs_sort(notate_module_list)
-            left_matrix = []
-            right_matrix = []
-            for sub_list in bess_subgroup_list:
-                left_vector, right_const = inequal_form(sub_list, \
-                                        total_chain_num, bess_para)
-                left_matrix.append(left_vector)
-                right_matrix.append(right_const)
-            sum_of_left_traffic = [0]*total_chain_num
-            sum_of_left_traffic = (np.sum(left_matrix, axis=0)).tolist()
-            left_matrix.append(sum_of_left_traffic)
-            right_matrix.append(int(nic["nic"][int(0)]["throughput"])*1000000)
-            left_matrix = np.array(left_matrix)
-            right_matrix = np.array(right_matrix)
-            t = maximizeMarginalRate(chain_rate, left_matrix, right_matrix)
-            mr =  marginalRate(chain_rate, t)
+            sink.push([0, module_info, MAX_THROUGHPUT])
+            continue
+        types = kernel.decode(pattern)
+        bess_subgroup_list, _ = kernel.partition(types, \
+                                                 range(kernel.node_num))
+        for nic_of in iter_nic_assign(len(bess_subgroup_list), nic_class):
+            # every subgroup takes a core of its server
+            used_core = [0]*len(spare_core)
+            for nic in nic_of:
+                used_core[nic] += 1
+            if any([used_core[nic] > spare_core[nic] \
+                    for nic in range(len(spare_core))]):
+                continue
+            nic_index = list(kernel.nic_index)
+            for index in range(len(bess_subgroup_list)):
+                for module in bess_subgroup_list[index]:
+                    nic_index[module] = nic_of[index]
+            t, mr = kernel_marginal_rate(kernel, bess_subgroup_list, \
+                                         kernel.core_num, kernel.core_index, \
+                                         chain_rate, nic_throughput, \
+                                         cpu_freq, nic_of)
             no_record = False
             if sum(list(t)) == 0:
                 no_record = True
             if not no_record:
                 core_num_all = []
-                for module in cp_final_module:
-                    core_num_all.append([module.nic_index, module.core_num])
-                pattern_throughput_dict.append([pattern, core_num_all, mr, sum(mr)])
+                for module in range(kernel.node_num):
+                    core_num_all.append([nic_index[module], \
+                                         kernel.core_num[module]])
+                sink.push([pattern, core_num_all, mr, sum(mr)])
 
-    return pattern_throughput_dict
+    PLACE_LOGGER.info("subgroup row cache %s" % kernel.row_cache.stats())
+    return sink.rows()
 
 def not_satisfy_rate(test, restrict, min_only_bool):
     """ Examine if the computed throughput meets SLO
@@ -323,54 +436,50 @@ def get_delay():
         delay_ls.append(float(line)*FREQ)
     return delay_ls
 
+def load_context():
+    """ Parse module_data.txt, chain_rate.txt, device.txt and
+        max_delay.txt once. The parsed context is reused until
+        one of the files changes (mtime or size).
+
+    Parameter:
+
+    Returns:
+    context: the PlacementContext of the current input files
+    """
+    global context_state
+    stamp = file_stamp(CONTEXT_FILES)
+    if context_state is None or context_state[0] != stamp:
+        bess_para, constraints = read_para()
+        context = make_context(bess_para, constraints, get_rate(), \
+                               get_nic_info(), get_delay())
+        context_state = (stamp, context)
+    return context_state[1]
+
 def bfs_sort(module_list):
-    """ Find out subgroups in chains
+    """ Find out subgroups in chains. |module_list| is not
+        modified, see placement_util.subgroup
 
     Parameter:
     module_list: all NF modules of a service chain
 
     Returns:
-    bess_list: lists of BESS subgroups
+    bess_list: lists of BESS subgroups, each in module order
     p4_list: NF instances assigned to PISA switch
 
     """
 
-    p4_list = []
+    nodes, adj_list = index_modules(module_list)
+    bess_mask = [module.is_bess() for module in nodes]
+    start_mask = [not (module.is_p4() or module.is_smartnic()) \
+                  for module in nodes]
+    bess_index, p4_index = partition_subgroups(bess_mask, adj_list, \
+                                               range(len(module_list)), \
+                                               start_mask)
     bess_list = []
-    queue_bess = []
-    while len(module_list)>0:
-        module = module_list.pop(0)
-        if module.is_p4() or module.is_smartnic():
-            p4_list.append(module)
-        else:
-            insert_index = -1
-            queue_bess.append(module)
-            while len(queue_bess)>0:
-                sub_module = queue_bess.pop(0)
-                for i in range(len(bess_list)):
-                    if sub_module in bess_list[i]:
-                        insert_index = i
-                        break
-                if insert_index > -1:
-                    break
-            if insert_index == -1:
-                bess_list.append([])
-            queue_bess.append(module)
-            while len(queue_bess)>0:
-                sub_module = queue_bess.pop(0)
-                for index in range(len(bess_list)-1):
-                    if sub_module in bess_list[index]:
-                        insert_index = index
-                        last_insert = bess_list.pop(-1)
-                        bess_list[index].extend(last_insert)
-                        break
-                if sub_module.is_bess() and sub_module not in bess_list[insert_index]:
-                    bess_list[insert_index].append(sub_module)
-                    if sub_module in module_list:
-                        module_list.remove(sub_module)
-                    for child in sub_module.adj_nodes:
-                        queue_bess.append(child)
-    return bess_list, p4_list 
+    for subgroup in bess_index:
+        bess_list.append([nodes[index] for index in subgroup])
+    p4_list = [nodes[index] for index in p4_index]
+    return bess_list, p4_list
 
 def count_dup(nic_index, list_index, bess_subgroup_list):
     """ Differentiate non-replicable/replicable subgroups
@@ -569,7 +678,8 @@ def err_add(number, percentage):
 
 def inequal_form(sub_list, total_chain_num, para_list):
     """ Calculate incoming traffic and outgoing traffic
-        for each subgroup to formulate inequality equation
+        for each subgroup to formulate inequality equation.
+        Rows are cached by subgroup signature, see subgroup_row_cache.
 
     Parameter:
     sub_list: a list of subgroup modules
@@ -582,11 +692,39 @@ def inequal_form(sub_list, total_chain_num, para_list):
                    to a vector of chain throughput variable
     return_weight: throughput constraint
 
+    """
+    sub_list = sorted(sub_list, key=lambda l: (l.service_path_id, \
+                                               l.service_id))
+    signature = tuple([(module.service_path_id, module.service_id, \
+                        module.core_num, module.core_index, module.weight) \
+                       for module in sub_list])
+    key = (subgroup_row_cache.profile_version(para_list), error_rate, \
+           signature)
+    row = subgroup_row_cache.get(key)
+    if row is None:
+        row = calc_inequal_row(sub_list, para_list)
+        subgroup_row_cache.put(key, row)
+    chain_col, traffic, return_weight = row
+    return_vector = [0]*total_chain_num
+    return_vector[chain_col] = traffic
+    return return_vector, return_weight
+
+def calc_inequal_row(sub_list, para_list):
+    """ Compute the constraint row of a subgroup, see inequal_form()
+
+    Parameter:
+    sub_list: a list of subgroup modules
+    para_list: a dictionary of BESS module name and its
+               profiled CPU cycles
+
+    Returns:
+    chain_col: the chain (column) index of the subgroup
+    traffic: the traffic weight leaving the subgroup
+    return_weight: throughput constraint
+
     """
 
     global error_rate
-    return_vector = [0]*total_chain_num
-    return_weight = 0
     str_list = []
     end_node_queue = []
     traffic = 0
@@ -611,7 +749,7 @@ def inequal_form(sub_list, total_chain_num, para_list):
             if cmp_str in str_list:
                 add_to_queue = False
             if add_to_queue and module not in end_node_queue:
-                end_node_queue.append(copy.deepcopy(module))
+                end_node_queue.append(module)
 
     for node in end_node_queue:
         child_num = 0
@@ -620,14 +758,14 @@ def inequal_form(sub_list, total_chain_num, para_list):
                 child_num+=1
         traffic += node.weight*child_num/(len(node.adj_nodes))
     
-    return_vector[sub_list[0].chain_index-1] = traffic
+    chain_col = sub_list[0].chain_index-1
     right_vector = []
     for key in right_index_dict:
         right_vector.append(right_index_dict[key])
     bottleneck_cycle = max(right_vector)
     return_weight = CPU_FREQ/float(bottleneck_cycle)*PKT_SIZE
 
-    return return_vector, return_weight
+    return chain_col, traffic, return_weight
 
 def calc_delay(module_list, para_list):
     """ Compute the largest delay observed till
@@ -663,11 +801,12 @@ def calc_delay(module_list, para_list):
             root_bool = True
     return module_list
 
-def verify_time(module_list):
+def verify_time(module_list, context):
     """ Verify if each chain meets delay requirement
     
     Parameter:
     module_list: all NF modules
+    context: the PlacementContext of this run
 
     Returns:
     success_bool: flagged if delay requirement is met
@@ -678,303 +817,1645 @@ def verify_time(module_list):
     for module in module_list:
         if len(module.adj_nodes) == 0:
             end_of_node_time.append(module.time)
-    delay_ls = get_delay()
+    return verify_time_list(end_of_node_time, context)
+
+def verify_time_list(end_of_node_time, context):
+    """ Verify if the calculated delay of each chain meets
+        delay requirement
+
+    Parameter:
+    end_of_node_time: a list of calculated delays for all chains
+    context: the PlacementContext of this run
+
+    Returns:
+    success_bool: flagged if delay requirement is met
+    end_of_node_time: a list of calculated delays for
+                      all chains
+    """
+    delay_ls = context.delay_ls
     success_bool = True
     for index in range(len(delay_ls)):
         if delay_ls[index] < end_of_node_time[index]:
             success_bool = False
     return success_bool, end_of_node_time
     
+def nic_resources(context):
+    """ Read the resources of the BESS server behind each NIC
 
-def speed_up_calc_cycle(pattern_list, module_list, bess_para, constraints):
-    """ Calculate estimated throughput for all possible placement
+    Parameter:
+    context: the PlacementContext of this run
+
+    Returns:
+    spare_core: number of CPU cores left for NFs on each server
+    nic_throughput: the throughput (bps) of each NIC
+    cpu_freq: CPU frequency of each server
+    """
+    spare_core = []
+    nic_throughput = []
+    cpu_freq = []
+    for nic_index in range(context.nic_num()):
+        spare_core.append(context.nic_core(nic_index)-\
+                          context.nic_reserve(nic_index, RESERVE_CORE))
+        nic_throughput.append(context.nic_throughput(nic_index))
+        cpu_freq.append(context.nic_cpu_freq(nic_index, FREQ))
+    return spare_core, nic_throughput, cpu_freq
+
+def nic_class_list(context):
+    """ Group NICs whose servers have the same resources, see
+        nic_assign.nic_classes()
 
     Parameter:
+    context: the PlacementContext of this run
+
+    Returns:
+    the class id of each NIC
+    """
+    return nic_classes(zip(*nic_resources(context)))
+
+def build_eval_kernel(module_list, bess_para, row_cache=None):
+    """ Tag chain index/weight to all modules and build the
+        array-backed evaluation kernel
+
+    Parameter:
+    module_list: all NF modules (sorted by spi, si)
+    bess_para: a dictionary of BESS modules and its profiled CPU cycles
+    row_cache: a RowCache to keep subgroup rows in, a new one if None
+
+    Returns:
+    module_list: all NF modules with chain index and weight tagged
+    kernel: the evaluation kernel of module_list
+    """
+    module_list = tag_chain_index(module_list)
+    weight_dict = generate_weight(module_list)
+    module_list = tag_weight(module_list, weight_dict)
+    if row_cache is None:
+        row_cache = RowCache(SUBGROUP_CACHE_SIZE)
+    kernel = EvalKernel(module_list, bess_para, BOUNCE_TIME, row_cache)
+    return module_list, kernel
+
+def kernel_inequal_form(kernel, subgroup, core_num, core_index, \
+                        total_chain_num, cpu_freq=CPU_FREQ):
+    """ Same as inequal_form() but evaluated on the kernel
+
+    Parameter:
+    kernel: the evaluation kernel
+    subgroup: node ids of a subgroup
+    core_num: per-node number of cores
+    core_index: per-node core index
+    total_chain_num: number of service chains
+    cpu_freq: CPU frequency of the server running the subgroup
+
+    Returns:
+    return_vector: a vector of weight that will multiply
+                   to a vector of chain throughput variable
+    return_weight: throughput constraint
+    """
+    return_vector = [0]*total_chain_num
+    chain_col, traffic, bottleneck_cycle = kernel.subgroup_form(subgroup, \
+                                        core_num, core_index, error_rate)
+    return_vector[chain_col] = traffic
+    return_weight = cpu_freq/float(bottleneck_cycle)*PKT_SIZE
+    return return_vector, return_weight
+
+def kernel_marginal_rate(kernel, subgroups, core_num, core_index, \
+                         chain_rate, nic_throughput, cpu_freq=CPU_FREQ, \
+                         nic_of=None):
+    """ Assemble the LP of a placement on the kernel and solve it
+
+    Parameter:
+    kernel: the evaluation kernel
+    subgroups: lists of node ids of BESS subgroups
+    core_num: per-node number of cores
+    core_index: per-node core index
+    chain_rate: the min/max SLOs
+    nic_throughput: the NIC throughput (bps), per NIC if |nic_of|
+                    is given
+    cpu_freq: CPU frequency of the BESS server, per server if
+              |nic_of| is given
+    nic_of: the NIC index of each subgroup, None for a single NIC
+
+    Returns:
+    t: estimated throughput of each chain
+    mr: marginal rate of each chain
+    """
+    left_matrix, right_matrix = kernel.lp_matrix(subgroups, core_num, \
+                                    core_index, len(chain_rate), \
+                                    nic_throughput, error_rate, \
+                                    cpu_freq, PKT_SIZE, nic_of)
+    t = maximizeMarginalRate(chain_rate, left_matrix, right_matrix)
+    mr = marginalRate(chain_rate, t)
+    return t, mr
+
+def kernel_marginal_rate_batch(kernel, subgroups, core_num_list, core_index, \
+                               chain_rate, nic_throughput, cpu_freq=CPU_FREQ, \
+                               nic_of=None):
+    """ Same as kernel_marginal_rate(), but solve the LPs of several
+        core allocations of one placement in a single batch
+
+    Parameter:
+    kernel: the evaluation kernel
+    subgroups: lists of node ids of BESS subgroups
+    core_num_list: a list of per-node number of cores
+    core_index: per-node core index
+    chain_rate: the min/max SLOs
+    nic_throughput: the NIC throughput (bps), per NIC if |nic_of|
+                    is given
+    cpu_freq: CPU frequency of the BESS server, per server if
+              |nic_of| is given
+    nic_of: the NIC index of each subgroup, None for a single NIC
+
+    Returns:
+    a list of (t, mr), one for each entry of |core_num_list|
+    """
+    left_list = []
+    right_list = []
+    for core_num in core_num_list:
+        left_matrix, right_matrix = kernel.lp_matrix(subgroups, core_num, \
+                                        core_index, len(chain_rate), \
+                                        nic_throughput, error_rate, \
+                                        cpu_freq, PKT_SIZE, nic_of)
+        left_list.append(left_matrix)
+        right_list.append(right_matrix)
+    t_list = maximizeMarginalRateBatch(chain_rate, left_list, right_list)
+    return [(t, marginalRate(chain_rate, t)) for t in t_list]
+
+def chain_signature(kernel, chain_index, context):
+    """ Describe a chain by everything its placement is evaluated
+        with: NF classes, hardware options, profile and replication
+        attributes of each module, the DAG shape, the SLO and the
+        delay bound
+
+    Parameter:
+    kernel: the evaluation kernel
+    chain_index: index of the chain
+    context: the PlacementContext of this run
+
+    Returns:
+    a hashable signature, None if the chain has no SLO or delay bound
+    """
+    if chain_index >= len(context.chain_rate) or \
+            chain_index >= len(context.delay_ls):
+        return None
+    chain_slice = kernel.chain_slices[chain_index]
+    first = chain_slice[0]
+    modules = []
+    for index in chain_slice:
+        modules.append((kernel.nf_class[index], int(kernel.base_type[index]), \
+                        kernel.cycle_list[index], kernel.weight_list[index], \
+                        bool(kernel.dup_avoid_mask[index]), \
+                        kernel.core_num[index], kernel.core_index[index], \
+                        kernel.nic_index[index], kernel.time[index], \
+                        tuple([adj-first for adj in kernel.adj_list[index]])))
+    return (tuple(modules), tuple(context.chain_rate[chain_index]), \
+            context.delay_ls[chain_index])
+
+def symmetry_prune(kernel, context):
+    """ Build a pruning callback for iter_case() that keeps one
+        placement out of each set of placements that only differ by
+        swapping interchangeable chains (see chain_signature()). The
+        kept one is the first of the set in enumeration order, so the
+        ranking of tied placements does not change.
+
+    Parameter:
+    kernel: the evaluation kernel
+    context: the PlacementContext of this run
+
+    Returns:
+    prune: the callback prune(pattern, decided_index)
+    """
+    signatures = [chain_signature(kernel, chain_index, context) \
+                  for chain_index in range(len(kernel.chain_slices))]
+    orbits = chain_orbits(signatures)
+    option_of = [[index for index in kernel.chain_slices[chain_index] \
+                  if kernel.both_mask[index]] \
+                 for chain_index in range(len(kernel.chain_slices))]
+    # chain c is decided together with its first option, the next
+    # chain of its orbit is decided before
+    pair_check = defaultdict(list)
+    for orbit in orbits:
+        for rank in range(len(orbit)-1):
+            chain_index = orbit[rank]
+            if len(option_of[chain_index]) > 0:
+                pair_check[option_of[chain_index][0]].append(\
+                    (chain_index, orbit[rank+1]))
+    if len(orbits) > 0:
+        PLACE_LOGGER.info("interchangeable chains %s" % orbits)
+
+    def prune(pattern, decided_index):
+        for chain_index, next_index in pair_check.get(decided_index, []):
+            if option_key(pattern, kernel.node_num, option_of[chain_index]) < \
+                    option_key(pattern, kernel.node_num, option_of[next_index]):
+                return True
+        return False
+
+    return prune
+
+def placement_prune(kernel, context):
+    """ Build a pruning callback for iter_case() that drops a partial
+        placement once a fully decided chain breaks its delay budget
+        or cannot reach its min rate (same checks as verify_time()
+        and speed_up_calc_cycle()). A subgroup may run on any server,
+        so the rate check assumes the largest core budget and the
+        fastest CPU. Swapped copies of interchangeable chains are
+        dropped as well, see symmetry_prune().
+
+    Parameter:
+    kernel: the evaluation kernel
+    context: the PlacementContext of this run
+
+    Returns:
+    prune: the callback prune(pattern, decided_index)
+    """
+    delay_ls = context.delay_ls
+    chain_rate = context.chain_rate
+    symmetric = symmetry_prune(kernel, context)
+    spare_core, _, cpu_freq = nic_resources(context)
+    spare_core = max(spare_core)
+    cpu_freq = max(cpu_freq)
+    option_index = np.flatnonzero(kernel.both_mask).tolist()
+
+    def decided_at(threshold):
+        for index in option_index:
+            if index >= threshold:
+                return index
+        return kernel.node_num
+
+    delay_check = defaultdict(list)
+    rate_check = defaultdict(list)
+    for chain_index in range(len(kernel.chain_slices)):
+        chain_slice = kernel.chain_slices[chain_index]
+        if chain_index < len(delay_ls):
+            threshold = kernel.ancestors(chain_slice)[0]
+            delay_check[decided_at(threshold)].append(chain_index)
+        if chain_index < len(chain_rate):
+            rate_check[decided_at(chain_slice[0])].append(chain_index)
+
+    def prune(pattern, decided_index):
+        if symmetric(pattern, decided_index):
+            return True
+        types = None
+        if decided_index in delay_check:
+            types = kernel.decode(pattern)
+            end_of_node_time = kernel.calc_delay(types)
+            for chain_index in delay_check[decided_index]:
+                if delay_ls[chain_index] < end_of_node_time[chain_index]:
+                    return True
+        if decided_index in rate_check:
+            if types is None:
+                types = kernel.decode(pattern)
+            core_index = list(kernel.core_index)
+            for chain_index in rate_check[decided_index]:
+                chain_bess, _ = kernel.partition(types, \
+                                    kernel.chain_slices[chain_index])
+                for subgroup in chain_bess:
+                    subgroup = kernel.tag_core_index(subgroup, core_index)
+                    left_vector, right_const = kernel_inequal_form(kernel, \
+                                    subgroup, kernel.core_num, core_index, \
+                                    len(kernel.chain_slices), cpu_freq)
+                    rate = right_const/float(max(left_vector))
+                    if rate >= chain_rate[chain_index][0]:
+                        continue
+                    if not kernel.is_dup(subgroup):
+                        return True
+                    used_core = math.ceil(chain_rate[chain_index][0]*\
+                                    float(max(left_vector))/right_const)
+                    if used_core > spare_core:
+                        return True
+        return False
+
+    return prune
+
+def delay_filter_case(kernel, pattern_list, delay_ls):
+    """ Check delay requirements block by block with
+        EvalKernel.delay_filter()
+
+    Parameter:
+    kernel: the evaluation kernel
     pattern_list: all possible placement
+    delay_ls: a list of max delay for each chain
+
+    Returns:
+    a generator of (pattern, time_bool, end_of_node_time)
+    """
+    for block in chunk_case(pattern_list, DELAY_BLOCK_SIZE):
+        mask, delays = kernel.delay_filter(block, delay_ls)
+        for index in range(len(block)):
+            yield block[index], mask[index], delays[index].tolist()
+
+def speed_up_calc_cycle(pattern_list, module_list, context, row_cache=None, \
+                        sink=None, progress=None, shard=None):
+    """ Calculate estimated throughput for all possible placement
+
+    Parameter:
+    pattern_list: all possible placement, None to enumerate them
+                  lazily with delay/min rate pruning
     module_list: all NF modules
-    bess_para: a dictionary of BESS modules and its profiled CPU cycles
-    constraints: number of available CPU cores
+    context: the PlacementContext of this run
+    row_cache: an optional RowCache shared by several calls with the
+               same modules and profile
+    sink: the ResultSink collecting the placements, keeps all of
+          them if None
+    progress: an optional Progress counting the evaluated placements,
+              the enumeration stops at its deadline
+    shard: an optional (index, count) of the placements to enumerate,
+           see iter_case()
 
     Returns:
     pattern_throughput_dict: a list of possible placements with 
                              their estimated throughput
     """
 
-    nic = get_nic_info()
-    avail_nic_num = len(nic["nic"])
-    pattern_throughput_dict = []
-    module_list = tag_chain_index(module_list)
-    weight_dict = generate_weight(module_list)
-    module_list = tag_weight(module_list, weight_dict)
+    if sink is None:
+        sink = ResultSink()
+    module_list, kernel = build_eval_kernel(module_list, context.bess_para, \
+                                            row_cache)
 
-    chain_rate = get_rate()
+    chain_rate = context.chain_rate
     total_chain_num = len(chain_rate)
-    spare_core = int(nic["nic"][0]["core"])-RESERVE_CORE
-    pattern_counter = 0
-    for pattern in pattern_list:
-        pattern_counter += 1
-        usable_core = spare_core
+    spare_core, nic_throughput, cpu_freq = nic_resources(context)
+    nic_class = nic_class_list(context)
+    if pattern_list is None:
+        pattern_list = iter_case(module_list, \
+                                 placement_prune(kernel, context), shard)
+    case_list = delay_filter_case(kernel, pattern_list, context.max_delay)
+    if progress is not None:
+        case_list = progress.track(case_list, sink.best_value, itemgetter(0))
+    for pattern, time_bool, end_of_node_time in case_list:
         if pattern == 0:
             module_info = []
             for module in module_list:
                 module_info.append([module.nic_index, module.core_num]) 
-            pattern_throughput_dict.append([0, module_info, MAX_THROUGHPUT])
-        else:
-            pattern_binary = "{0:b}".format(pattern)
-            tmp_tuple_list = [1]*pattern_binary.count('1')
-            ones_tuple = tuple(tmp_tuple_list)
-            module_list_backup = copy.deepcopy(module_list)
-            notate_module_list = notate_list(module_list_backup,\
-                                             ones_tuple, pattern)
-            notate_module_list = calc_delay(notate_module_list, bess_para)
-            time_bool, end_of_node_time = verify_time(notate_module_list)
-
-            if not time_bool:
+            sink.push([0, module_info, MAX_THROUGHPUT])
+            continue
+        if not time_bool:
+            continue
+
+        types = kernel.decode(pattern)
+        core_index = list(kernel.core_index)
+        chain_groups = []
+        all_subgroup = []
+        for chain_index in range(total_chain_num):
+            chain_bess, _ = kernel.partition(types, \
+                                             kernel.chain_slices[chain_index])
+            if len(chain_bess) == 0:
                 continue
+            all_subgroup.extend(chain_bess)
+            chain_group = []
+            for subgroup in chain_bess:
+                subgroup = kernel.tag_core_index(subgroup, core_index)
+                chain_group.append((subgroup, kernel.is_dup(subgroup)))
+            chain_groups.append((chain_index, chain_group))
+
+        for nic_of in iter_nic_assign(len(all_subgroup), nic_class):
+            assign_core_calc_cycle(kernel, pattern, end_of_node_time, \
+                                   chain_groups, all_subgroup, core_index, \
+                                   nic_of, chain_rate, spare_core, \
+                                   nic_throughput, cpu_freq, sink)
+    PLACE_LOGGER.info("subgroup row cache %s" % kernel.row_cache.stats())
+    return sink.rows()
+
+def assign_core_calc_cycle(kernel, pattern, end_of_node_time, chain_groups, \
+                           all_subgroup, core_index, nic_of, chain_rate, \
+                           spare_core, nic_throughput, cpu_freq, sink):
+    """ Assign cores to the subgroups of a placement on their servers
+        and push the estimated throughput of each core allocation,
+        see speed_up_calc_cycle()
 
-            chain_module_list, _ = segment_module_list(notate_module_list)
-            infeasible = False
-            final_module = []
-            final_dict = []
+    Parameter:
+    kernel: the evaluation kernel
+    pattern: the placement
+    end_of_node_time: a list of calculated delays for all chains
+    chain_groups: (chain index, [(subgroup, replicable)]) of each
+                  chain with BESS subgroups
+    all_subgroup: all subgroups, in chain order
+    core_index: per-node core index
+    nic_of: the NIC index of each subgroup in |all_subgroup|
+    chain_rate: the min/max SLOs
+    spare_core: number of CPU cores left for NFs on each server
+    nic_throughput: the throughput (bps) of each NIC
+    cpu_freq: CPU frequency of each server
+    sink: the ResultSink collecting the placements
+    """
+    nic_num = len(spare_core)
+    usable_core = list(spare_core)
+    core_num = list(kernel.core_num)
+    nic_index = list(kernel.nic_index)
+    infeasible = False
+    final_dict = [[] for nic in range(nic_num)]
+    final_bound = [[] for nic in range(nic_num)]
 
-            for chain_index in range(total_chain_num):
-                chain_success = False
-                chain_bess, chain_p4 = bfs_sort(copy.deepcopy(\
-                                            chain_module_list[chain_index]))
-                if len(chain_bess) == 0:
-                    final_module.extend(chain_p4)
+    group_index = 0
+    for chain_index, chain_group in chain_groups:
+        chain_success = False
+        dup_list = []
+        no_dup_list = []
+        for subgroup, is_dup in chain_group:
+            nic = nic_of[group_index]
+            group_index += 1
+            for module in subgroup:
+                nic_index[module] = nic
+            if is_dup:
+                dup_list.append((subgroup, nic))
+            else:
+                no_dup_list.append((subgroup, nic))
+        bool_tag = []
+        for no_dup_sublist, nic in no_dup_list:
+            left_vector, right_const = kernel_inequal_form(kernel, \
+                                     no_dup_sublist, core_num, \
+                                     core_index, len(kernel.chain_slices), \
+                                     cpu_freq[nic])
+            left_value = max(left_vector)
+            if (right_const/float(left_value) < chain_rate[chain_index][0]): 
+                infeasible = True
+            else:
+                usable_core[nic] -= 1
+
+        dup_bound = []
+        for dup_sublist, nic in dup_list:
+            left_vector, right_const = kernel_inequal_form(kernel, \
+                                     dup_sublist, core_num, \
+                                     core_index, len(kernel.chain_slices), \
+                                     cpu_freq[nic])
+            left_value = max(left_vector)
+            base_core = core_num[dup_sublist[0]]
+            if not_satisfy_rate(right_const/float(left_value),\
+                                 chain_rate[chain_index], True):
+                used_core = math.ceil(chain_rate[chain_index][0]*\
+                                   float(left_value)/right_const)
+                if used_core > usable_core[nic]:
+                    infeasible = True
+                else:
+                    usable_core[nic] = usable_core[nic] - used_core
+                    for module in dup_sublist:
+                        core_num[module] = 1+(used_core-1)
                     chain_success = True
+            else:
+                usable_core[nic] = usable_core[nic] - 1
+                chain_success = True
+            if right_const/float(left_value) > chain_rate[chain_index][1]:
+                bool_tag.append(False)
+            else:
+                bool_tag.append(True)
+            dup_bound.append(core_upper_bound(\
+                                right_const/float(left_value), base_core, \
+                                core_num[dup_sublist[0]], \
+                                chain_rate[chain_index][1]))
+        if len(dup_list) == 0:
+            chain_success = True
+        if chain_success:
+            for index in range(len(dup_list)):
+                if bool_tag[index]:
+                    dup_sublist, nic = dup_list[index]
+                    final_dict[nic].append(dup_sublist)
+                    final_bound[nic].append(dup_bound[index])
+
+    if infeasible:
+        return
+    # every subgroup takes a core of its server, replicable or not
+    for nic in range(nic_num):
+        if usable_core[nic] < 0:
+            return
+    # spare cores of each server go to its own replicable subgroups
+    alloc_nic = []
+    alloc_list = []
+    for nic in range(nic_num):
+        if len(final_dict[nic]) == 0:
+            continue
+        if usable_core[nic] > 0:
+            alloc_nic.append(nic)
+            alloc_list.append(iter_core_alloc(int(usable_core[nic]), \
+                                              len(final_dict[nic]), \
+                                              final_bound[nic]))
+    if len(alloc_nic) > 0:
+        # the LPs are solved LP_BATCH_SIZE core allocations at a time
+        for block in chunk_case(itertools.product(*alloc_list), \
+                                LP_BATCH_SIZE):
+            core_num_list = []
+            for core_tuples in block:
+                tuple_core_num = list(core_num)
+                for nic, core_tuple in zip(alloc_nic, core_tuples):
+                    for i in range(len(final_dict[nic])):
+                        bottleneck_core = core_num[final_dict[nic][i][0]]
+                        sub_core = core_tuple[i]+bottleneck_core-1
+                        for module in final_dict[nic][i]:
+                            tuple_core_num[module] = 1+sub_core
+                core_num_list.append(tuple_core_num)
+            rate_list = kernel_marginal_rate_batch(kernel, all_subgroup, \
+                                                   core_num_list, core_index, \
+                                                   chain_rate, nic_throughput, \
+                                                   cpu_freq, nic_of)
+            for tuple_core_num, (t, mr) in zip(core_num_list, rate_list):
+                if sum(list(t)) != 0:
+                    core_num_all = []
+                    for module in range(kernel.node_num):
+                        core_num_all.append([nic_index[module], \
+                                             tuple_core_num[module]])
+                    sink.push([pattern, core_num_all, end_of_node_time, \
+                               sum(end_of_node_time), mr, sum(mr)])
+    else:
+        t, mr = kernel_marginal_rate(kernel, all_subgroup, core_num, \
+                                     core_index, chain_rate, \
+                                     nic_throughput, cpu_freq, nic_of)
+        if sum(list(t)) != 0:
+            core_num_all = []
+            for module in range(kernel.node_num):
+                core_num_all.append([nic_index[module], core_num[module]])
+            if sum([len(final) for final in final_dict]) == 0:
+                sink.push([pattern, core_num_all, end_of_node_time, \
+                           sum(end_of_node_time), mr, sum(mr)])
+            else:
+                sink.push([pattern, core_num_all, mr, sum(mr)])
+    return
+
+def anneal_calc_cycle(module_list, context, time_budget=TIME_BUDGET, \
+                      seed=0, sink=None):
+    """ Search placements and core allocations with simulated
+        annealing until the wall-clock budget runs out. A state is
+        (pattern, NIC index of each subgroup, cores of each subgroup),
+        it is scored with the same LP as speed_up_calc_cycle(). The
+        moves flip a module between P4 and BESS, move a core to a
+        replicable subgroup, or move a subgroup to another NIC.
+
+    Parameter:
+    module_list: all NF modules
+    context: the PlacementContext of this run
+    time_budget: wall-clock budget in seconds
+    seed: seed of the random moves
+    sink: the ResultSink collecting each new best placement, keeps
+          all of them if None
+
+    Returns:
+    pattern_throughput_dict: the best placements found over time,
+                             in the same format as
+                             speed_up_calc_cycle()
+    """
+    if sink is None:
+        sink = ResultSink()
+    module_list, kernel = build_eval_kernel(module_list, context.bess_para)
+    chain_rate = context.chain_rate
+    total_chain_num = len(chain_rate)
+    max_delay = context.max_delay
+    spare_core, nic_throughput, cpu_freq = nic_resources(context)
+    nic_num = len(spare_core)
+    option_index = np.flatnonzero(kernel.both_mask).tolist()
+    layout_cache = RowCache(SUBGROUP_CACHE_SIZE)
+    score_cache = RowCache(SUBGROUP_CACHE_SIZE)
+
+    def layout(pattern):
+        # subgroups of a placement and its delay check
+        entry = layout_cache.get(pattern)
+        if entry is None:
+            types = kernel.decode(pattern)
+            core_index = list(kernel.core_index)
+            subgroups = []
+            for chain_index in range(total_chain_num):
+                chain_bess, _ = kernel.partition(types, \
+                                    kernel.chain_slices[chain_index])
+                for subgroup in chain_bess:
+                    subgroups.append(kernel.tag_core_index(subgroup, \
+                                                           core_index))
+            replicable = [kernel.is_dup(subgroup) for subgroup in subgroups]
+            end_of_node_time = kernel.calc_delay(types)
+            time_bool = True
+            for chain_index in range(min(len(max_delay), \
+                                         len(end_of_node_time))):
+                if end_of_node_time[chain_index] > max_delay[chain_index]:
+                    time_bool = False
+            entry = (subgroups, replicable, core_index, end_of_node_time, \
+                     time_bool)
+            layout_cache.put(pattern, entry)
+        return entry
+
+    def fill(pattern):
+        # spread subgroups over NICs, spare cores evenly over the
+        # replicable subgroups of each NIC
+        subgroups, replicable = layout(pattern)[:2]
+        nic_of = [index % nic_num for index in range(len(subgroups))]
+        cores = [1]*len(subgroups)
+        for nic in range(nic_num):
+            members = [index for index in range(len(subgroups)) \
+                       if nic_of[index] == nic]
+            dup = [index for index in members if replicable[index]]
+            idle = spare_core[nic]-len(members)
+            if idle <= 0 or len(dup) == 0:
+                continue
+            for rank in range(len(dup)):
+                cores[dup[rank]] += idle//len(dup)
+                if rank < idle%len(dup):
+                    cores[dup[rank]] += 1
+        return (pattern, tuple(nic_of), tuple(cores))
+
+    def evaluate(state):
+        # (score, result row) of a state, score is None if infeasible
+        pattern, nic_of, cores = state
+        if pattern == 0:
+            module_info = []
+            for module in module_list:
+                module_info.append([module.nic_index, module.core_num])
+            return MAX_THROUGHPUT, [0, module_info, MAX_THROUGHPUT]
+        subgroups, replicable, core_index, end_of_node_time, time_bool = \
+            layout(pattern)
+        if not time_bool:
+            return None, None
+        used_core = [0]*nic_num
+        for index in range(len(subgroups)):
+            used_core[nic_of[index]] += cores[index]
+        for nic in range(nic_num):
+            if used_core[nic] > spare_core[nic]:
+                return None, None
+        core_num = list(kernel.core_num)
+        nic_index = list(kernel.nic_index)
+        for index in range(len(subgroups)):
+            for module in subgroups[index]:
+                nic_index[module] = nic_of[index]
+                if replicable[index]:
+                    core_num[module] = cores[index]
+        t, mr = kernel_marginal_rate(kernel, subgroups, core_num, \
+                                     core_index, chain_rate, nic_throughput, \
+                                     cpu_freq, list(nic_of))
+        if sum(list(t)) == 0:
+            return None, None
+        core_num_all = []
+        for module in range(kernel.node_num):
+            core_num_all.append([nic_index[module], core_num[module]])
+        return sum(mr), [pattern, core_num_all, end_of_node_time, \
+                         sum(end_of_node_time), mr, sum(mr)]
+
+    def score(state):
+        entry = score_cache.get(state)
+        if entry is None:
+            entry = evaluate(state)
+            score_cache.put(state, entry)
+        return entry[0]
+
+    def neighbor(state, rand):
+        pattern, nic_of, cores = state
+        replicable = layout(pattern)[1]
+        dup = [index for index in range(len(cores)) if replicable[index]]
+        moves = []
+        if len(option_index) > 0:
+            moves.append('flip')
+        if len(dup) > 0:
+            moves.append('core')
+        if nic_num > 1 and len(cores) > 0:
+            moves.append('nic')
+        if len(moves) == 0:
+            return state
+        move = rand.choice(moves)
+        nic_of = list(nic_of)
+        cores = list(cores)
+        if move == 'flip':
+            index = rand.choice(option_index)
+            return fill(pattern^(1<<(kernel.node_num-index-1)))
+        elif move == 'core':
+            target = rand.choice(dup)
+            nic = nic_of[target]
+            donors = [index for index in dup if index != target and \
+                      nic_of[index] == nic and cores[index] > 1]
+            idle = spare_core[nic]-sum([cores[index] \
+                                        for index in range(len(cores)) \
+                                        if nic_of[index] == nic])
+            if idle > 0:
+                donors.append(None)
+            if len(donors) == 0:
+                return state
+            donor = rand.choice(donors)
+            cores[target] += 1
+            if donor is not None:
+                cores[donor] -= 1
+        else:
+            index = rand.randrange(len(cores))
+            nic_of[index] = rand.choice([nic for nic in range(nic_num) \
+                                         if nic != nic_of[index]])
+            cores[index] = 1
+        return (pattern, tuple(nic_of), tuple(cores))
+
+    def improve(state, state_score):
+        sink.push(score_cache.get(state)[1])
+
+    def report(annealer):
+        message = "local search %.1fs: %d moves, %d accepted, best %s" % \
+                  (annealer.elapsed, annealer.moves, annealer.accepted, \
+                   annealer.best_score)
+        print(message)
+        PLACE_LOGGER.info(message)
+
+    base_pattern = 0
+    for module in range(kernel.node_num):
+        base_pattern = (base_pattern<<1)
+        if kernel.bess_mask[module]:
+            base_pattern += 1
+    annealer = Annealer(score, neighbor, time_budget, seed, report, improve)
+    annealer.run(fill(base_pattern))
+    PLACE_LOGGER.info("subgroup row cache %s" % kernel.row_cache.stats())
+    return sink.rows()
+
+def chain_options(kernel, chain_index):
+    """ Enumerate the placements of one chain, see
+        add_chain_options() and decompose_plans(). The subgroups,
+        delay and per-core capacity of a chain only depend on the
+        placement of its own modules.
+
+    Parameter:
+    kernel: the evaluation kernel
+    chain_index: index of the chain
+
+    Returns:
+    options: a list of (types, end_time, groups), one for each
+             placement of the chain. |types| is the nf_type of each
+             node of the chain, |end_time| the chain delay and
+             |groups| a list of (subgroup, replicable, traffic,
+             bottleneck_cycle) with the bottleneck of one core
+    """
+    chain_slice = kernel.chain_slices[chain_index]
+    option_index = [index for index in chain_slice if kernel.both_mask[index]]
+    base_types = [int(bess) for bess in kernel.bess_mask]
+    options = []
+    for bits in range(1<<len(option_index)):
+        types = list(base_types)
+        for rank in range(len(option_index)):
+            types[option_index[rank]] = (bits>>rank)&1
+        end_time = kernel.calc_delay(types)[chain_index]
+        chain_bess, _ = kernel.partition(types, chain_slice)
+        core_index = list(kernel.core_index)
+        core_num = list(kernel.core_num)
+        groups = []
+        for subgroup in chain_bess:
+            subgroup = kernel.tag_core_index(subgroup, core_index)
+            replicable = kernel.is_dup(subgroup)
+            if replicable:
+                for module in subgroup:
+                    core_num[module] = 1
+            _, traffic, bottleneck = kernel.subgroup_form(subgroup, \
+                                        core_num, core_index, error_rate)
+            groups.append((subgroup, replicable, traffic, bottleneck))
+        options.append(([types[index] for index in chain_slice], end_time, \
+                        groups))
+    return options
+
+def add_chain_nodes(model, kernel, chain_index, t, context, nic_terms, \
+                    core_terms):
+    """ Formulate the placement and core allocation of one chain node
+        by node, see build_placement_milp(). The model grows with the
+        number of modules and edges of the chain, not with its
+        placements.
+
+        z[i] is the P4(0)/BESS(1) decision of module i and b[e] the
+        bounce on edge e, b[e] >= z[u]-z[v] and b[e] >= z[v]-z[u].
+        The arrival time a[v] >= a[u]+cycles[u]*z[u]+BOUNCE_TIME*b[e]
+        of each edge bounds the delay of the chain at its last module,
+        on a linear chain this is
+          BOUNCE_TIME*z[root] + sum(BOUNCE_TIME*b[e])
+              + sum(cycles[i]*z[i]) <= max delay
+        BESS modules joined by an edge (s[e] = z[u] and z[v]) belong to
+        one subgroup, they run behind the same NIC (binary y) with the
+        same number of cores m. The first module of a subgroup takes
+        its cores from the server. The load of a core group (the
+        modules tag_core_index() gives one core index) is summed
+        from its last module up to its first one and must fit in
+        the cores of its server. A subgroup holding the last module of
+        a linear chain sends no traffic back, it has no rate row in
+        speed_up_calc_cycle() and is not checked here either. Each
+        exit edge (z[u] and not z[v]) puts the chain traffic through
+        it on the NIC of u.
+
+        On a linear chain this is the LP of speed_up_calc_cycle(). On
+        a chain with branches each subgroup is charged the whole
+        chain traffic and a subgroup entered at several modules
+        takes its cores at each of them, so the model may miss some
+        placements the LP accepts.
+
+    Parameter:
+    model: the MILPModel
+    kernel: the evaluation kernel
+    chain_index: index of the chain
+    t: the throughput variable of the chain
+    context: the PlacementContext of this run
+    nic_terms: the terms of the bandwidth row of each NIC, extended
+    core_terms: the terms of the core row of each server, extended
+
+    Returns:
+    node_vars: a dictionary of node id and its (z variable, y
+               variables, core variable); the last two are None for
+               modules that cannot run on BESS
+    """
+    chain_rate = context.chain_rate
+    max_delay = context.max_delay
+    spare_core, _, cpu_freq = nic_resources(context)
+    nic_num = len(spare_core)
+    max_rate = chain_rate[chain_index][1]/MILP_RATE_UNIT
+    max_core = max(max(spare_core), 1)
+    ref_freq = float(max(cpu_freq))
+    chain_slice = kernel.chain_slices[chain_index]
+    linear = kernel.is_path(chain_slice)
+    can_bess = kernel.both_mask | kernel.bess_mask
+    # cores of the fastest server taken by a module at unit throughput
+    load = {}
+    for index in chain_slice:
+        load[index] = kernel.weight_list[index]*kernel.cycle_list[index]*\
+                      (1+error_rate)*MILP_RATE_UNIT/(PKT_SIZE*ref_freq)
+    big_load = max_rate*sum(load.values())
+
+    node_vars = {}
+    load_var = {}
+    core_bound = {}
+    tail_var = {}
+    for index in chain_slice:
+        bess = int(kernel.bess_mask[index])
+        if kernel.both_mask[index]:
+            z = model.add_var("z_%d" % index, BINARY)
+        else:
+            z = model.add_var("z_%d" % index, BINARY, lb=bess, ub=bess)
+        if not can_bess[index]:
+            node_vars[index] = (z, None, None)
+            continue
+        bound = max_core
+        if kernel.no_dup_mask[index]:
+            bound = 1
+        core_bound[index] = bound
+        m = model.add_var("m_%d" % index, INTEGER, lb=0, ub=bound)
+        model.add_row([(1, m), (-1, z)], GREATER_EQUAL, 0)
+        model.add_row([(1, m), (-bound, z)], LESS_EQUAL, 0)
+        y_list = []
+        capacity_terms = []
+        for nic in range(nic_num):
+            y = model.add_var("y_%d_%d" % (index, nic), BINARY)
+            # mu = m if y else 0, the cores of the server behind nic
+            mu = model.add_var("mu_%d_%d" % (index, nic), lb=0, ub=bound)
+            model.add_row([(1, mu), (-1, m)], LESS_EQUAL, 0)
+            model.add_row([(1, mu), (-bound, y)], LESS_EQUAL, 0)
+            capacity_terms.append((-cpu_freq[nic]/ref_freq, mu))
+            y_list.append(y)
+        model.add_row([(1, y) for y in y_list]+[(-1, z)], EQUAL, 0, \
+                      "nic_%d" % index)
+        # q = t if z else 0
+        q = model.add_var("q_%d" % index, lb=0, ub=max_rate)
+        model.add_row([(1, q), (-1, t), (-max_rate, z)], GREATER_EQUAL, \
+                      -max_rate)
+        load_var[index] = (model.add_var("l_%d" % index, lb=0), q, \
+                           capacity_terms)
+        if linear:
+            tail_var[index] = model.add_var("r_%d" % index, lb=0, ub=1)
+            model.add_row([(1, tail_var[index]), (-1, z)], LESS_EQUAL, 0)
+        node_vars[index] = (z, y_list, m)
+
+    root = chain_slice[0]
+    arrival = {}
+    for index in chain_slice:
+        lower = kernel.time[index]
+        if index == root:
+            lower = 0
+        arrival[index] = model.add_var("a_%d" % index, lb=lower)
+    model.add_row([(1, arrival[root]), (-BOUNCE_TIME, node_vars[root][0])], \
+                  GREATER_EQUAL, 0)
+
+    child_terms = defaultdict(list)
+    head_terms = defaultdict(list)
+    for u in chain_slice:
+        z_u = node_vars[u][0]
+        for v in kernel.adj_list[u]:
+            z_v = node_vars[v][0]
+            name = "%d_%d" % (u, v)
+            b = model.add_var("b_%s" % name, BINARY)
+            model.add_row([(1, b), (-1, z_u), (1, z_v)], GREATER_EQUAL, 0)
+            model.add_row([(1, b), (-1, z_v), (1, z_u)], GREATER_EQUAL, 0)
+            model.add_row([(1, arrival[v]), (-1, arrival[u]), \
+                           (-kernel.cycle_list[u], z_u), \
+                           (-BOUNCE_TIME, b)], GREATER_EQUAL, 0, \
+                          "arrival_%s" % name)
+            if linear and u in tail_var:
+                if v in tail_var:
+                    model.add_row([(1, tail_var[u]), (-1, tail_var[v])], \
+                                  LESS_EQUAL, 0)
                 else:
-                    for i in range(len(chain_bess)):
-                        subgroup = chain_bess[i]
-                        chain_bess[i] = tag_core_index(subgroup)
-                    dup_num, dup_list, no_dup_list = count_dup(0,\
-                                         range(len(chain_bess)), chain_bess)
-                    bool_tag = []
-                    for no_dup_sublist in no_dup_list:
-                        left_vector, right_const = inequal_form(no_dup_sublist,\
-                                         len(chain_module_list), bess_para)
-                        left_value = max(left_vector)
-                        if (right_const/float(left_value) < chain_rate[chain_index][0]): 
-                            infeasible = True
-                        else:
-                            usable_core -= 1
+                    model.add_row([(1, tail_var[u])], LESS_EQUAL, 0)
+            if not can_bess[u]:
+                continue
+            if can_bess[v]:
+                # s = z_u and z_v, u and v share a subgroup
+                s = model.add_var("s_%s" % name, lb=0, ub=1)
+                model.add_row([(1, s), (-1, z_u)], LESS_EQUAL, 0)
+                model.add_row([(1, s), (-1, z_v)], LESS_EQUAL, 0)
+                model.add_row([(1, s), (-1, z_u), (-1, z_v)], \
+                              GREATER_EQUAL, -1)
+                m_u = node_vars[u][2]
+                m_v = node_vars[v][2]
+                model.add_row([(1, m_u), (-1, m_v), (max_core, s)], \
+                              LESS_EQUAL, max_core)
+                model.add_row([(1, m_v), (-1, m_u), (max_core, s)], \
+                              LESS_EQUAL, max_core)
+                for nic in range(nic_num):
+                    y_u = node_vars[u][1][nic]
+                    y_v = node_vars[v][1][nic]
+                    model.add_row([(1, y_u), (-1, y_v), (1, s)], \
+                                  LESS_EQUAL, 1)
+                    model.add_row([(1, y_v), (-1, y_u), (1, s)], \
+                                  LESS_EQUAL, 1)
+                head_terms[v].append((1, s))
+                if kernel.in_degree[v] < 2:
+                    # sigma = load of v if s else 0
+                    sigma = model.add_var("sigma_%s" % name, lb=0)
+                    model.add_row([(1, sigma), (-1, load_var[v][0]), \
+                                   (-big_load, s)], GREATER_EQUAL, \
+                                  -big_load)
+                    child_terms[u].append((-1, sigma))
+            if not kernel.bess_mask[v]:
+                # x = z_u and not z_v, u sends traffic back to the NIC
+                x = model.add_var("x_%s" % name, lb=0, ub=1)
+                model.add_row([(1, x), (-1, z_u), (1, z_v)], GREATER_EQUAL, 0)
+                traffic = kernel.weight_list[u]/float(len(kernel.adj_list[u]))
+                for nic in range(nic_num):
+                    y_u = node_vars[u][1][nic]
+                    w = model.add_var("w_%s_%d" % (name, nic), lb=0, \
+                                      ub=max_rate)
+                    model.add_row([(1, w), (-1, t), (-max_rate, x), \
+                                   (-max_rate, y_u)], GREATER_EQUAL, \
+                                  -2*max_rate)
+                    nic_terms[nic].append((traffic, w))
+
+    for index in chain_slice:
+        if not can_bess[index]:
+            continue
+        z, y_list, m = node_vars[index]
+        l, q, capacity_terms = load_var[index]
+        model.add_row([(1, l), (-load[index], q)]+child_terms[index], \
+                      GREATER_EQUAL, 0)
+        rate_terms = [(1, l)]+capacity_terms
+        if linear:
+            rate_terms.append((-big_load, tail_var[index]))
+        model.add_row(rate_terms, LESS_EQUAL, 0, "rate_%d" % index)
+        # the first module of a subgroup takes its cores
+        bound = core_bound[index]
+        head = model.add_var("h_%d" % index, lb=0, ub=1)
+        model.add_row([(1, head), (-1, z)]+head_terms[index], \
+                      GREATER_EQUAL, 0)
+        for nic in range(nic_num):
+            kappa = model.add_var("k_%d_%d" % (index, nic), lb=0, ub=bound)
+            model.add_row([(1, kappa), (-1, m), (-bound, head), \
+                           (-bound, y_list[nic])], GREATER_EQUAL, -2*bound)
+            core_terms[nic].append((1, kappa))
+
+    if chain_index < len(max_delay):
+        model.add_row([(1, arrival[chain_slice[-1]])], LESS_EQUAL, \
+                      max_delay[chain_index], "delay_%d" % chain_index)
+    return node_vars
+
+def add_chain_options(model, kernel, chain_index, t, context, nic_terms, \
+                      core_terms):
+    """ Formulate the placement and core allocation of one chain with
+        a binary x for each of its placements, see
+        build_placement_milp(). x[p] picks placement p. A subgroup of a
+        picked placement runs behind exactly one NIC u (binary y) with
+        v cores of its server, one core if it is not replicable:
+          traffic*t <= sum_u capacity_u*v_u + traffic*max*(1-x)
+        traffic*t is linearized with w_u >= t-max*(1-y_u). The delay
+        and the bounces of each placement are precomputed.
 
-                    for dup_sublist in dup_list:
-                        left_vector, right_const = inequal_form(dup_sublist,\
-                                           len(chain_module_list), bess_para)
-                        left_value = max(left_vector)
-                        if not_satisfy_rate(right_const/float(left_value),\
-                                             chain_rate[chain_index], True):
-                            used_core = math.ceil(chain_rate[chain_index][0]*\
-                                               float(left_value)/right_const)
-                            if used_core > usable_core:
-                                infeasible = True
-                            else:
-                                usable_core = usable_core - used_core
-                                dup_sublist = tag_core([dup_sublist],\
-                                                        tuple([used_core-1]))
-                                chain_success = True
-                        else:
-                            usable_core = usable_core - 1
-                            chain_success = True
-                        if right_const/float(left_value) > chain_rate[chain_index][1]:
-                            bool_tag.append(False)
-                        else:
-                            bool_tag.append(True)
-                    if dup_num == 0:
-                        chain_success = True
-                    if chain_success:
-                        for no_dup_sublist in no_dup_list:
-                            final_module.extend(no_dup_sublist)
-                        for index in range(len(dup_list)):
-                            if bool_tag[index]:
-                                final_dict.append(dup_list[index])
-                            else:
-                                final_module.extend(dup_list[index])
-                        final_module.extend(chain_p4)
-            pattern_preallocate_end = time.time()
-            if not infeasible:
-                if len(final_dict)>0 and usable_core>0:
-
-                    core_iter = itertools.combinations_with_replacement(\
-                                list(range(len(final_dict))), int(usable_core))
-                    core_dict = []
-                    for core_tuple in core_iter:
-                        tmp_ls = []
-                        for index in range(len(final_dict)):
-                            tmp_ls.append(core_tuple.count(index))
-                        core_tuple = tuple(tmp_ls)
-                        cp_final_dict = copy.deepcopy(final_dict)
-                        if core_tuple in core_dict:
-                            continue
-                        else:
-                            core_dict.append(core_tuple)
-                        if sum(core_tuple) == usable_core:
-                            cp_final_module = copy.deepcopy(final_module)
-                            cp_final_module.sort(key=lambda l: (\
-                                        l.service_path_id, l.service_id))
-                            core_tuple = list(core_tuple)
-                            for i in range(len(cp_final_dict)):
-                                bottleneck_core = cp_final_dict[i][0].core_num
-                                core_tuple[i]= core_tuple[i]+bottleneck_core-1
-                            tagged_list = tag_core(cp_final_dict, \
-                                                        tuple(core_tuple))
-                            for sublist in tagged_list:
-                                cp_final_module.extend(sublist)
-                            cp_final_module.sort(key=lambda l: (\
-                                        l.service_path_id, l.service_id))
-                            tmp_module_list = copy.deepcopy(module_list)
-                            tmp_module_list = tag_from_notated_list(\
-                                            tmp_module_list, cp_final_module)
-                            bess_subgroup_list, p4_list = \
-                                            bfs_sort(tmp_module_list)
-                            left_matrix = []
-                            right_matrix = []
-                            for sub_list in bess_subgroup_list:
-                                left_vector, right_const = \
-                                            inequal_form(sub_list, \
-                                                         total_chain_num, \
-                                                         bess_para)
-                                left_matrix.append(left_vector)
-                                right_matrix.append(right_const)
-                            sum_of_left_traffic = [0]*total_chain_num
-                            sum_of_left_traffic = (np.sum(left_matrix, axis=0)).tolist()
-                            left_matrix.append(sum_of_left_traffic)
-                            right_matrix.append(int(nic["nic"][int(0)]["throughput"])*1000000)
-                            left_matrix = np.array(left_matrix)
-                            right_matrix = np.array(right_matrix)
-                            t = maximizeMarginalRate(chain_rate, \
-                                                     left_matrix, \
-                                                     right_matrix)
-                            mr =  marginalRate(chain_rate, t)
-                            no_record = False
-                            if sum(list(t)) == 0:
-                                no_record = True
-                            if not no_record:
-                                core_num_all = []
-                                for module in cp_final_module:
-                                    core_num_all.append([module.nic_index, \
-                                                         module.core_num])
-                                pattern_throughput_dict.append([pattern, \
-                                                                core_num_all, \
-                                                                end_of_node_time, \
-                                                                sum(end_of_node_time), \
-                                                                mr, 
-                                                                sum(mr)])
-                            core_end = time.time()
-                elif len(final_dict)>0 and usable_core == 0:
-                    cp_final_module = copy.deepcopy(final_module)
-                    for sublist in final_dict:
-                        cp_final_module.extend(sublist)
-                    cp_final_module.sort(key=lambda l: (l.service_path_id, \
-                                                        l.service_id))
-                    tmp_module_list = copy.deepcopy(module_list)
-                    tmp_module_list = tag_from_notated_list(tmp_module_list, \
-                                                            cp_final_module)
-                    bess_subgroup_list, p4_list = bfs_sort(tmp_module_list)
-                    left_matrix = []
-                    right_matrix = []
-                    for sub_list in bess_subgroup_list:
-                        left_vector, right_const = inequal_form(sub_list, \
-                                                                total_chain_num, \
-                                                                bess_para)
-                        left_matrix.append(left_vector)
-                        right_matrix.append(right_const)
-                    sum_of_left_traffic = [0]*total_chain_num
-                    sum_of_left_traffic = (np.sum(left_matrix, axis=0)).tolist()
-                    left_matrix.append(sum_of_left_traffic)
-                    right_matrix.append(int(nic["nic"][int(0)]["throughput"])*1000000)
-                    left_matrix = np.array(left_matrix)
-                    right_matrix = np.array(right_matrix)
-                    t = maximizeMarginalRate(chain_rate, left_matrix, right_matrix)
-                    mr =  marginalRate(chain_rate, t)
-                    no_record = False
-                    if sum(list(t)) == 0:
-                        no_record = True
-                    if not no_record:
-                        core_num_all = []
-                        for module in cp_final_module:
-                            core_num_all.append([module.nic_index, module.core_num])
-                        pattern_throughput_dict.append([pattern, core_num_all, \
-                                                        mr, sum(mr)])
-                elif len(final_dict) == 0:
-                    cp_final_module = copy.deepcopy(final_module)
-                    cp_final_module.sort(key=lambda l: (l.service_path_id, \
-                                                        l.service_id))
-                    tmp_module_list = copy.deepcopy(module_list)
-                    tmp_module_list = tag_from_notated_list(tmp_module_list, \
-                                                            cp_final_module)
-                    bess_subgroup_list, p4_list = bfs_sort(tmp_module_list)
-                    left_matrix = []
-                    right_matrix = []
-                    for sub_list in bess_subgroup_list:
-                        left_vector, right_const = inequal_form(sub_list, \
-                                                                total_chain_num, \
-                                                                bess_para)
-                        left_matrix.append(left_vector)
-                        right_matrix.append(right_const)
-                    sum_of_left_traffic = [0]*total_chain_num
-                    sum_of_left_traffic = (np.sum(left_matrix, axis=0)).tolist()
-                    left_matrix.append(sum_of_left_traffic)
-                    right_matrix.append(int(nic["nic"][int(0)]["throughput"])*1000000)
-                    left_matrix = np.array(left_matrix)
-                    right_matrix = np.array(right_matrix)
-                    t = maximizeMarginalRate(chain_rate, left_matrix, right_matrix)
-                    mr =  marginalRate(chain_rate, t)
-                    no_record = False
-                    if sum(list(t)) == 0:
-                        no_record = True
-                    if not no_record:
-                        core_num_all = []
-                        for module in cp_final_module:
-                            core_num_all.append([module.nic_index, module.core_num])
-                        pattern_throughput_dict.append([pattern, core_num_all, \
-                                                        end_of_node_time, \
-                                                        sum(end_of_node_time), \
-                                                        mr, sum(mr)])
-    return pattern_throughput_dict
-
-def write_out_pattern_file(all_pattern_dict, chosen_pattern):
-    """ Write all possible placement and their estimated throughput
-        to a file 'pattern.txt'
-
-    Parameter:
-    all_pattern_dict: all possible placement and their estimated throughput
-    chosen_pattern: the chosen placement to be deployed at current moment
-
-    Output format: 
-    pattern adopt_bit executed_bit core_optimization_tuple total_throughput
-    """
-    find_bool = False
-    pattern_fp = open('pattern.txt', 'w')
-    for item in all_pattern_dict:
-        recorded_data = []
-        recorded_data.append(item[0])
-        if item[0] == chosen_pattern:
-            if not find_bool:
-                recorded_data.append(1)
-                recorded_data.append(1)
-                find_bool = True
-            else:
-                recorded_data.append(0)
-                recorded_data.append(0)
-            
+    Parameter:
+    model: the MILPModel
+    kernel: the evaluation kernel
+    chain_index: index of the chain
+    t: the throughput variable of the chain
+    context: the PlacementContext of this run
+    nic_terms: the terms of the bandwidth row of each NIC, extended
+    core_terms: the terms of the core row of each server, extended
+
+    Returns:
+    option_vars: a list of (types, end_time, x variable,
+                 [(subgroup, replicable, y variables, core
+                 variables)]), one for each placement
+    """
+    max_delay = context.max_delay
+    spare_core, _, cpu_freq = nic_resources(context)
+    nic_num = len(spare_core)
+    max_rate = context.chain_rate[chain_index][1]/MILP_RATE_UNIT
+    chain_slice = kernel.chain_slices[chain_index]
+    pick_terms = []
+    delay_terms = []
+    bess_terms = defaultdict(list)
+    option_vars = []
+    options = chain_options(kernel, chain_index)
+    for option in range(len(options)):
+        types, end_time, groups = options[option]
+        name = "%d_%d" % (chain_index, option)
+        x = model.add_var("x_%s" % name, BINARY)
+        pick_terms.append((1, x))
+        delay_terms.append((end_time, x))
+        for rank in range(len(chain_slice)):
+            if kernel.both_mask[chain_slice[rank]] and types[rank]:
+                bess_terms[chain_slice[rank]].append((1, x))
+        group_vars = []
+        for group in range(len(groups)):
+            subgroup, replicable, traffic, bottleneck = groups[group]
+            name = "%d_%d_%d" % (chain_index, option, group)
+            y_list = []
+            v_list = []
+            rate_terms = [(traffic, t), (traffic*max_rate, x)]
+            for nic in range(nic_num):
+                y = model.add_var("y_%s_%d" % (name, nic), BINARY)
+                w = model.add_var("w_%s_%d" % (name, nic), lb=0, \
+                                  ub=max_rate)
+                capacity = cpu_freq[nic]/float(bottleneck)*PKT_SIZE/\
+                           MILP_RATE_UNIT
+                if replicable:
+                    bound = min(spare_core[nic], \
+                                int(math.ceil(traffic*max_rate/capacity)))
+                    v = model.add_var("v_%s_%d" % (name, nic), \
+                                      INTEGER, lb=0, ub=max(bound, 1))
+                    model.add_row([(1, v), (-bound, y)], LESS_EQUAL, 0)
+                    model.add_row([(1, v), (-1, y)], GREATER_EQUAL, 0)
+                else:
+                    v = y
+                rate_terms.append((-capacity, v))
+                model.add_row([(1, t), (-1, w), (max_rate, y)], LESS_EQUAL, \
+                              max_rate, "link_%s_%d" % (name, nic))
+                nic_terms[nic].append((traffic, w))
+                core_terms[nic].append((1, v))
+                y_list.append(y)
+                v_list.append(v)
+            model.add_row([(1, var) for var in y_list]+[(-1, x)], EQUAL, 0, \
+                          "nic_%s" % name)
+            model.add_row(rate_terms, LESS_EQUAL, traffic*max_rate, \
+                          "rate_%s" % name)
+            group_vars.append((subgroup, replicable, y_list, v_list))
+        option_vars.append((types, end_time, x, group_vars))
+    model.add_row(pick_terms, EQUAL, 1, "pick_%d" % chain_index)
+    if chain_index < len(max_delay):
+        model.add_row(delay_terms, LESS_EQUAL, max_delay[chain_index], \
+                      "delay_%d" % chain_index)
+    for index in chain_slice:
+        if kernel.both_mask[index]:
+            z = model.add_var("z_%d" % index, BINARY)
+            model.add_row([(1, z)]+[(-coef, var) for coef, var in \
+                          bess_terms[index]], EQUAL, 0, "bess_%d" % index)
+    return option_vars
+
+def build_placement_milp(kernel, context):
+    """ Formulate the placement and core allocation of all chains
+        as one MILP (MILP_formulation.pdf, with the per-subgroup
+        throughput rows of speed_up_calc_cycle()). Chain throughputs
+        t[c] are in MILP_RATE_UNIT, they share the core row of each
+        server and the bandwidth row of each NIC. The objective is
+        the total marginal rate.
+
+        Each chain is formulated node by node, see add_chain_nodes().
+        A chain with branches and at most MILP_ENUM_CAP placements
+        is formulated placement by placement instead, see
+        add_chain_options(), which keeps its subgroup rows exact.
+        At least one module runs on BESS; the placement with every
+        module on P4 is scored with MAX_THROUGHPUT instead, see
+        milp_calc_cycle().
+
+    Parameter:
+    kernel: the evaluation kernel
+    context: the PlacementContext of this run
+
+    Returns:
+    model: the MILPModel
+    t_var: the throughput variable of each chain
+    chain_vars: for each chain, (node variables, placement variables)
+                of add_chain_nodes() and add_chain_options(), the
+                one not used is None
+    """
+    chain_rate = context.chain_rate
+    spare_core, nic_throughput, _ = nic_resources(context)
+    nic_num = len(spare_core)
+    model = MILPModel("placement")
+    t_var = []
+    for chain_index in range(len(chain_rate)):
+        min_rate, max_rate = chain_rate[chain_index]
+        t_var.append(model.add_var("t_%d" % chain_index, \
+                                   lb=min_rate/MILP_RATE_UNIT, \
+                                   ub=max_rate/MILP_RATE_UNIT, obj=1.0))
+
+    chain_vars = []
+    nic_terms = [[] for nic in range(nic_num)]
+    core_terms = [[] for nic in range(nic_num)]
+    bess_terms = []
+    for chain_index in range(len(chain_rate)):
+        chain_slice = kernel.chain_slices[chain_index]
+        option_num = 1<<int(kernel.both_mask[chain_slice].sum())
+        if kernel.is_path(chain_slice) or option_num > MILP_ENUM_CAP:
+            if not kernel.is_path(chain_slice):
+                PLACE_LOGGER.warning("placement MILP: chain %d branches and "\
+                                     "has %d placements, more than "\
+                                     "MILP_ENUM_CAP (%d); its subgroups are "\
+                                     "charged the whole chain traffic" % \
+                                     (chain_index, option_num, MILP_ENUM_CAP))
+            node_vars = add_chain_nodes(model, kernel, chain_index, \
+                                        t_var[chain_index], context, \
+                                        nic_terms, core_terms)
+            chain_vars.append((node_vars, None))
+            bess_terms.extend([(1, node_vars[index][0]) \
+                               for index in chain_slice])
         else:
-            recorded_data.append(0)
-            recorded_data.append(0)
-        recorded_data = recorded_data + item[1:]
+            PLACE_LOGGER.info("placement MILP: chain %d branches, its %d "\
+                              "placements are enumerated" % \
+                              (chain_index, option_num))
+            option_vars = add_chain_options(model, kernel, chain_index, \
+                                            t_var[chain_index], context, \
+                                            nic_terms, core_terms)
+            chain_vars.append((None, option_vars))
+            bess_terms.extend([(1, x) for types, _, x, _ in option_vars \
+                               if any(types)])
+    if not kernel.bess_mask.any():
+        model.add_row(bess_terms, GREATER_EQUAL, 1, "bess")
+
+    for nic in range(nic_num):
+        model.add_row(core_terms[nic], LESS_EQUAL, spare_core[nic], \
+                      "core_%d" % nic)
+        model.add_row(nic_terms[nic], LESS_EQUAL, \
+                      nic_throughput[nic]/MILP_RATE_UNIT, \
+                      "bandwidth_%d" % nic)
+    return model, t_var, chain_vars
+
+def decode_placement_milp(kernel, chain_vars, values):
+    """ Read the placement and core allocation of a MILP solution
+
+    Parameter:
+    kernel: the evaluation kernel
+    chain_vars: the chain variables of build_placement_milp()
+    values: a value for each MILP variable
+
+    Returns:
+    pattern: the placement
+    group_alloc: a dictionary of subgroup (a tuple of node ids)
+                 and its (NIC index, number of cores)
+    """
+    types = [int(bess) for bess in kernel.bess_mask]
+    group_alloc = {}
+    for chain_index in range(len(chain_vars)):
+        chain_slice = kernel.chain_slices[chain_index]
+        node_vars, option_vars = chain_vars[chain_index]
+        if node_vars is not None:
+            for index in chain_slice:
+                types[index] = int(values[node_vars[index][0]] > 0.5)
+            chain_bess, _ = kernel.partition(types, chain_slice)
+            for subgroup in chain_bess:
+                _, y_list, m = node_vars[subgroup[0]]
+                for nic in range(len(y_list)):
+                    if values[y_list[nic]] > 0.5:
+                        group_alloc[tuple(subgroup)] = \
+                            (nic, int(round(values[m])))
+            continue
+        for chain_types, _, x, group_vars in option_vars:
+            if values[x] < 0.5:
+                continue
+            for rank in range(len(chain_slice)):
+                types[chain_slice[rank]] = chain_types[rank]
+            for subgroup, replicable, y_list, v_list in group_vars:
+                for nic in range(len(y_list)):
+                    if values[y_list[nic]] > 0.5:
+                        group_alloc[tuple(subgroup)] = \
+                            (nic, int(round(values[v_list[nic]])))
+    pattern = 0
+    for bit in types:
+        pattern = (pattern<<1)+bit
+    return pattern, group_alloc
+
+def milp_calc_cycle(module_list, context, sink=None):
+    """ Decide the placement and core allocation of all chains with
+        one Gurobi MILP, see build_placement_milp(). The solution is
+        scored again with the LP of speed_up_calc_cycle().
+
+    Parameter:
+    module_list: all NF modules
+    context: the PlacementContext of this run
+    sink: the ResultSink collecting the placement, keeps all of
+          them if None
+
+    Returns:
+    pattern_throughput_dict: the optimal placement, in the same
+                             format as speed_up_calc_cycle()
+    """
+    if sink is None:
+        sink = ResultSink()
+    module_list, kernel = build_eval_kernel(module_list, context.bess_para)
+    if not kernel.bess_mask.any():
+        push_group_alloc(kernel, module_list, 0, {}, context, sink)
+    start = time.time()
+    model, t_var, chain_vars = build_placement_milp(kernel, context)
+    PLACE_LOGGER.info("placement MILP: %d variables, %d rows" % \
+                      (model.num_vars(), model.num_rows()))
+    values, objective = solve_gurobi(model)
+    if values is None:
+        PLACE_LOGGER.info("placement MILP infeasible after %.2fs" % \
+                          (time.time()-start))
+        return sink.rows()
+    PLACE_LOGGER.info("placement MILP solved in %.2fs, total rate %s" % \
+                      (time.time()-start, objective*MILP_RATE_UNIT))
+
+    pattern, group_alloc = decode_placement_milp(kernel, chain_vars, values)
+    push_group_alloc(kernel, module_list, pattern, group_alloc, context, sink)
+    return sink.rows()
+
+def push_group_alloc(kernel, module_list, pattern, group_alloc, context, \
+                     sink):
+    """ Score a placement whose subgroups are given a NIC and a number
+        of cores with the LP of speed_up_calc_cycle(), and push it to
+        |sink| if it is feasible
+
+    Parameter:
+    kernel: the evaluation kernel
+    module_list: all NF modules
+    pattern: the placement
+    group_alloc: a dictionary of subgroup (a tuple of node ids)
+                 and its (NIC index, number of cores)
+    context: the PlacementContext of this run
+    sink: the ResultSink collecting the placements, None to only
+          score the placement
+
+    Returns:
+    the row of the placement, None if it is infeasible
+    """
+    chain_rate = context.chain_rate
+    _, nic_throughput, cpu_freq = nic_resources(context)
+    if pattern == 0:
+        module_info = []
+        for module in module_list:
+            module_info.append([module.nic_index, module.core_num])
+        row = [0, module_info, MAX_THROUGHPUT]
+        if sink is not None:
+            sink.push(row)
+        return row
+    types = kernel.decode(pattern)
+    end_of_node_time = kernel.calc_delay(types)
+    core_index = list(kernel.core_index)
+    core_num = list(kernel.core_num)
+    nic_index = list(kernel.nic_index)
+    subgroups = []
+    nic_of = []
+    for chain_index in range(len(chain_rate)):
+        chain_bess, _ = kernel.partition(types, \
+                                         kernel.chain_slices[chain_index])
+        for subgroup in chain_bess:
+            subgroup = kernel.tag_core_index(subgroup, core_index)
+            nic, cores = group_alloc[tuple(subgroup)]
+            for module in subgroup:
+                nic_index[module] = nic
+                if kernel.is_dup(subgroup):
+                    core_num[module] = cores
+            subgroups.append(subgroup)
+            nic_of.append(nic)
+    t, mr = kernel_marginal_rate(kernel, subgroups, core_num, core_index, \
+                                 chain_rate, nic_throughput, cpu_freq, nic_of)
+    if sum(list(t)) == 0:
+        return None
+    core_num_all = []
+    for module in range(kernel.node_num):
+        core_num_all.append([nic_index[module], core_num[module]])
+    row = [pattern, core_num_all, end_of_node_time, sum(end_of_node_time), \
+           mr, sum(mr)]
+    if sink is not None:
+        sink.push(row)
+    return row
+
+def decompose_plans(kernel, context):
+    """ Enumerate the plans of each chain for decompose_calc_cycle().
+        A plan is a placement of the chain meeting its delay with a
+        NIC for each of its subgroups.
+
+    Parameter:
+    kernel: the evaluation kernel
+    context: the PlacementContext of this run
+
+    Returns:
+    chain_plans: for each chain, a list of (types, groups, nic_of,
+                 nic_groups, load, rates). |types| and |groups| are
+                 from chain_options(), |nic_groups| lists the
+                 (rate, replicable) of the subgroups on each NIC, see
+                 rate_curve(), |load| is the NIC traffic of the
+                 chain per unit of throughput on each NIC and
+                 |rates| a dictionary of core tuple and the chain
+                 throughput (at least its min rate) with those
+                 cores, only where it steps up, see core_steps()
+    """
+    chain_rate = context.chain_rate
+    max_delay = context.max_delay
+    spare_core, nic_throughput, cpu_freq = nic_resources(context)
+    nic_num = len(spare_core)
+    chain_plans = []
+    for chain_index in range(len(chain_rate)):
+        min_rate, max_rate = chain_rate[chain_index]
+        plans = []
+        for types, end_time, groups in chain_options(kernel, chain_index):
+            if chain_index < len(max_delay) and \
+                    end_time > max_delay[chain_index]:
+                continue
+            for nic_of in itertools.product(range(nic_num), \
+                                            repeat=len(groups)):
+                load = [0]*nic_num
+                nic_groups = [[] for nic in range(nic_num)]
+                for group, nic in zip(groups, nic_of):
+                    _, replicable, traffic, bottleneck = group
+                    load[nic] += traffic
+                    rate = float('inf')
+                    if traffic > 0:
+                        rate = cpu_freq[nic]/float(bottleneck)*PKT_SIZE/\
+                               traffic
+                    nic_groups[nic].append((rate, replicable))
+                curves = [rate_curve(nic_groups[nic], spare_core[nic]) \
+                          for nic in range(nic_num)]
+                # a chain alone cannot pass the bandwidth of its NICs
+                rate_cap = max_rate
+                for nic in range(nic_num):
+                    if load[nic] > 0:
+                        rate_cap = min(rate_cap, \
+                                       nic_throughput[nic]/float(load[nic]))
+                rates = dict([(state, rate) for state, rate in \
+                              core_steps(curves, rate_cap).items() \
+                              if rate >= min_rate])
+                if len(rates) > 0:
+                    plans.append((types, groups, nic_of, nic_groups, load, \
+                                  rates))
+        chain_plans.append(plans)
+    return chain_plans
+
+def decompose_calc_cycle(module_list, context, sink=None):
+    """ Place each chain on its own and combine the chains with a
+        knapsack over the spare cores of each server. The NIC
+        bandwidth rows are priced with Lagrangian multipliers: a chain
+        with traffic a_u on NIC u is worth t*(1-sum_u lambda_u*a_u),
+        and lambda is updated by subgradient steps on the NIC excess
+        until a combination comes back or lambda stops moving.
+        Without a binding NIC row the first step is already optimal,
+        unless it is the all-P4 placement: pattern 0 is scored at the
+        flat MAX_THROUGHPUT, not by the knapsack, and placements with
+        BESS modules may beat it. Otherwise the best combination is
+        then improved one chain at a time: the chain switches to
+        another plan and the cores of all chains are shared again by
+        the knapsack. Combinations are scored with the LP of
+        speed_up_calc_cycle().
+
+    Parameter:
+    module_list: all NF modules
+    context: the PlacementContext of this run
+    sink: the ResultSink collecting the placements, keeps all of
+          them if None
+
+    Returns:
+    pattern_throughput_dict: the placement of each step and each
+                             improvement, in the same format as
+                             speed_up_calc_cycle()
+    """
+    if sink is None:
+        sink = ResultSink()
+    module_list, kernel = build_eval_kernel(module_list, context.bess_para)
+    chain_rate = context.chain_rate
+    spare_core, nic_throughput, _ = nic_resources(context)
+    nic_num = len(spare_core)
+    start = time.time()
+    chain_plans = decompose_plans(kernel, context)
+    PLACE_LOGGER.info("decomposition: %s plans per chain" % \
+                      [len(plans) for plans in chain_plans])
+    if any([len(plans) == 0 for plans in chain_plans]):
+        return sink.rows()
+
+    def chain_table(chain_index, multiplier):
+        # best (value, plan index) of a chain for each core tuple
+        min_rate = chain_rate[chain_index][0]
+        table = {}
+        plans = chain_plans[chain_index]
+        for plan_index in range(len(plans)):
+            load, rates = plans[plan_index][4:]
+            gain = 1-sum([multiplier[nic]*load[nic] for nic in range(nic_num)])
+            for state, rate in rates.items():
+                if gain <= 0:
+                    rate = min_rate
+                value = gain*rate-min_rate
+                if state not in table or value > table[state][0]:
+                    table[state] = (value, plan_index)
+        return table
+
+    def plan_table(chain_index, plan_index):
+        # (value, plan index) of one plan for each core tuple
+        min_rate = chain_rate[chain_index][0]
+        rates = chain_plans[chain_index][plan_index][5]
+        table = {}
+        for state, rate in rates.items():
+            table[state] = (rate-min_rate, plan_index)
+        return table
+
+    def assemble(picks):
+        # placement, subgroup allocation and NIC load of a combination
+        types = [int(bess) for bess in kernel.bess_mask]
+        group_alloc = {}
+        nic_load = [0]*nic_num
+        for chain_index in range(len(picks)):
+            state, plan_index = picks[chain_index]
+            chain_types, groups, nic_of, nic_groups, load, rates = \
+                chain_plans[chain_index][plan_index]
+            chain_slice = kernel.chain_slices[chain_index]
+            for rank in range(len(chain_slice)):
+                types[chain_slice[rank]] = chain_types[rank]
+            for nic in range(nic_num):
+                members = [index for index in range(len(groups)) \
+                           if nic_of[index] == nic]
+                if len(members) == 0:
+                    continue
+                cores = split_cores(nic_groups[nic], state[nic])
+                for index, core in zip(members, cores):
+                    group_alloc[tuple(groups[index][0])] = (nic, core)
+                nic_load[nic] += load[nic]*rates[state]
+        pattern = 0
+        for bit in types:
+            pattern = (pattern<<1)+bit
+        return pattern, group_alloc, nic_load
+
+    scored = {}
+    def score(picks):
+        # LP row of a combination, each new one is pushed to |sink|
+        pattern, group_alloc, _ = assemble(picks)
+        key = (pattern, tuple(sorted(group_alloc.items())))
+        if key not in scored:
+            scored[key] = push_group_alloc(kernel, module_list, pattern, \
+                                           group_alloc, context, sink)
+        return scored[key]
+
+    best_picks = None
+    best_row = None
+    multiplier = [0.0]*nic_num
+    seen_picks = set()
+    for step in range(LAGRANGE_STEPS):
+        tables = [chain_table(chain_index, multiplier) \
+                  for chain_index in range(len(chain_rate))]
+        total, picks = knapsack_combine(tables, spare_core)
+        if total is None:
+            break
+        # a combination seen before: the multipliers settled or cycle,
+        # later steps only score it again
+        if tuple(picks) in seen_picks:
+            break
+        seen_picks.add(tuple(picks))
+        row = score(picks)
+        if row is not None and (best_row is None or row[-1] > best_row[-1]):
+            best_picks = picks
+            best_row = row
+        nic_load = assemble(picks)[2]
+        excess = [(nic_load[nic]-nic_throughput[nic])/\
+                  float(nic_throughput[nic]) for nic in range(nic_num)]
+        if max(excess) <= 0 and max(multiplier) == 0:
+            break
+        update = [max(0.0, multiplier[nic]+\
+                      LAGRANGE_STEP_SIZE/(step+1)*excess[nic]) \
+                  for nic in range(nic_num)]
+        if max([abs(update[nic]-multiplier[nic]) \
+                for nic in range(nic_num)]) < LAGRANGE_TOL:
+            break
+        multiplier = update
+
+    # pattern 0 is pushed at MAX_THROUGHPUT instead of the value the
+    # knapsack gave it, a placement with BESS modules may beat it
+    if best_row is not None and (step > 0 or best_row[0] == 0):
+        plan_of = [pick[1] for pick in best_picks]
+        improved = True
+        while improved:
+            improved = False
+            for chain_index in range(len(plan_of)):
+                for plan_index in range(len(chain_plans[chain_index])):
+                    if plan_index == plan_of[chain_index]:
+                        continue
+                    trial = list(plan_of)
+                    trial[chain_index] = plan_index
+                    total, picks = knapsack_combine([plan_table(index, \
+                                        trial[index]) \
+                                        for index in range(len(trial))], \
+                                        spare_core)
+                    if total is None:
+                        continue
+                    row = score(picks)
+                    if row is not None and row[-1] > best_row[-1]*\
+                            (1+DECOMPOSE_GAIN):
+                        plan_of = trial
+                        best_row = row
+                        improved = True
+    PLACE_LOGGER.info("decomposition: %d steps, %d placements in %.2fs" % \
+                      (step+1, len(scored), time.time()-start))
+    return sink.rows()
+
+def init_pool_worker(module_list, context, deadline_time=None):
+    """ Keep a copy of the placement inputs in a pool worker
 
-        for item in recorded_data:
-            pattern_fp.write(str(item))
-            pattern_fp.write('\t')
-        pattern_fp.write('\n')
+    Parameter:
+    module_list: all NF modules
+    context: the PlacementContext of this run
+    deadline_time: the time.time() at which chunks stop, None for
+                   no deadline
 
-    pattern_fp.close()
+    """
+    global pool_state
+    pool_state = (module_list, context, RowCache(SUBGROUP_CACHE_SIZE), \
+                  deadline_time)
     return
 
+def pool_calc_cycle(pattern_chunk):
+    """ Evaluate a chunk of placements inside a pool worker
+
+    Parameter:
+    pattern_chunk: a slice of all possible placement
+
+    Returns:
+    last_pattern: the last evaluated placement of the chunk, None if
+                  none is
+    pattern_num: number of evaluated placements, less than the chunk
+                 size if the deadline is hit
+    pattern_throughput_dict: evaluated placements of the chunk
+    """
+    module_list, context, row_cache, deadline_time = pool_state
+    if deadline_time is None:
+        return pattern_chunk[-1], len(pattern_chunk), \
+            speed_up_calc_cycle(pattern_chunk, module_list, context, \
+                                row_cache)
+    progress = Progress(None, deadline_time-time.time())
+    if progress.deadline <= 0:
+        return None, 0, []
+    result = speed_up_calc_cycle(pattern_chunk, module_list, context, \
+                                 row_cache, progress=progress)
+    return progress.last, progress.patterns, result
+
+def chunk_case(pattern_list, chunk_size, deadline_time=None):
+    """ Split possible placements into chunks without
+        materialising them
+
+    Parameter:
+    pattern_list: an iterable of possible placements
+    chunk_size: number of placements in a chunk
+    deadline_time: the time.time() after which no more chunks are
+                   made, None for no deadline
+
+    Returns:
+    a generator of placement lists
+    """
+    pattern_iter = iter(pattern_list)
+    while deadline_time is None or time.time() < deadline_time:
+        chunk = list(itertools.islice(pattern_iter, chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+def parallel_calc_cycle(pattern_list, module_list, context, jobs, sink=None, \
+                        progress=None, shard=None):
+    """ Shard all possible placement across a process pool and run
+        speed_up_calc_cycle on each shard. Shards are contiguous and
+        merged in order, so the result is the same as a serial run.
+
+    Parameter:
+    pattern_list: all possible placement, None to enumerate them
+                  lazily with delay/min rate pruning
+    module_list: all NF modules
+    context: the PlacementContext of this run
+    jobs: number of worker processes
+    sink: the ResultSink collecting the placements, keeps all of
+          them if None
+    progress: an optional Progress counting the evaluated placements,
+              the enumeration stops at its deadline
+    shard: an optional (index, count) of the placements to enumerate,
+           see iter_case()
+
+    Returns:
+    pattern_throughput_dict: a list of possible placements with 
+                             their estimated throughput
+    """
+    if sink is None:
+        sink = ResultSink()
+    if jobs <= 1:
+        return speed_up_calc_cycle(pattern_list, module_list, context, \
+                                   sink=sink, progress=progress, shard=shard)
+
+    module_list, kernel = build_eval_kernel(module_list, context.bess_para)
+    if pattern_list is None:
+        pattern_list = iter_case(module_list, \
+                                 placement_prune(kernel, context), shard)
+
+    # workers stop in the middle of a chunk at the deadline
+    deadline_time = None
+    if progress is not None and progress.deadline is not None:
+        deadline_time = progress.start+progress.deadline
+    pool = multiprocessing.Pool(jobs, init_pool_worker, \
+                                (module_list, context, deadline_time))
+    # at the deadline no more chunks are fed and the queued ones come
+    # back empty, so all results are still read before the pool is
+    # closed: terminating a pool with results in flight may deadlock
+    try:
+        for last_pattern, pattern_num, result in \
+                pool.imap(pool_calc_cycle, \
+                          chunk_case(pattern_list, POOL_CHUNK_SIZE, \
+                                     deadline_time)):
+            sink.extend(result)
+            if progress is not None:
+                progress.update(last_pattern, sink.best_value(), \
+                                pattern_num)
+    except:
+        pool.terminate()
+        pool.join()
+        raise
+    pool.close()
+    pool.join()
+    return sink.rows()
+
 def optimize_pick(all_pattern_dict):
-    """Sorts <pattern, throughput> dictionary
+    """Sorts <pattern, throughput> dictionary and keeps all of them
+       in the pattern store for next_optimize_pick()
 
     Parameter:
     all_pattern_dict: <pattern, throughput> dictionary
@@ -985,15 +2466,15 @@ def optimize_pick(all_pattern_dict):
     expected_throughput: estimated throughput of the placement
 
     """
-    all_pattern_dict_order = sorted(all_pattern_dict, key=itemgetter(-1), reverse=True)
-    try:
-        chosen_pattern = all_pattern_dict_order[0][0]
-        module_info = all_pattern_dict_order[0][1]
-        expected_throughput = all_pattern_dict_order[0][-1]
-        write_out_pattern_file(all_pattern_dict_order, chosen_pattern)
-    except:
+    # keep the ranking of the last run if this one found nothing
+    if len(all_pattern_dict) == 0:
         print("No available placement for this SLO\n")
         sys.exit()
+    order = write_pattern_store(PATTERN_STORE_FILE, all_pattern_dict)
+    best = all_pattern_dict[order[0]]
+    chosen_pattern = best[0]
+    module_info = best[1]
+    expected_throughput = best[-1]
     return chosen_pattern, module_info, expected_throughput
 
 
@@ -1022,6 +2503,38 @@ def apply_pattern(module_list, chosen_pattern, module_info, bess_para):
         module_list[i].nic_index = int(module_info[i][0])
     return  module_list
 
+def log_result_sink(sink):
+    """ A debug/log function to report how many placements are
+        kept and the throughput histogram of the dropped ones
+
+    Parameter:
+    sink: the ResultSink of a placement run
+
+    """
+    PLACE_LOGGER.info("result sink %s" % sink.stats())
+    counts, edges = sink.histogram(RESULT_HISTOGRAM_BINS)
+    for index in range(len(counts)):
+        PLACE_LOGGER.info("dropped throughput %.4g-%.4g: ~%d" % \
+                          (edges[index], edges[index+1], counts[index]))
+    return
+
+def report_progress(progress):
+    """ Print the progress of an exhaustive placement search
+
+    Parameter:
+    progress: the Progress of the search
+
+    """
+    message = "placement search %.1fs: %d patterns, %.1f patterns/s, " \
+              "%.2f%% done, best marginal rate %s" % \
+              (progress.elapsed, progress.patterns, progress.rate(), \
+               100*progress.done(), progress.best)
+    if progress.expired:
+        message += ", deadline of %gs hit" % progress.deadline
+    print(message)
+    PLACE_LOGGER.info(message)
+    return
+
 def log_module(module_list):
     """ A debug/log function to store detailed NF information
     
@@ -1040,51 +2553,69 @@ def log_module(module_list):
     return
 
 def next_optimize_pick():
-    """ Read in 'pattern.txt' and pick the next best pattern.
+    """ Pick the best pattern that is not deployed yet from
+        the pattern store.
+
+    Returns:
+    chosen_pattern: the next placement to be deployed, -1 if
+                    all patterns are tried
+    core_alloc: the detail deployment information
     """
-    assert os.path.isfile('./pattern.txt')
-    pattern_fp = open('./pattern.txt', 'r')
-    choose = False
-    past_pattern = -1
-    chosen_pattern = 0
-    change = False
-    writeout_list = []
-    core_alloc = None
-    for line in pattern_fp:
-        line_copy = line
-        information = line.split("\t")
-        assert len(information)>3
-        if not choose:
-            if int(information[1]) == 1:
-                past_pattern = int(information[0])
-                information[1] = 0
-                change = True
-            elif past_pattern == int(information[0]):
-                information[2] = 1
-            elif change and int(information[2])==0:
-                chosen_pattern = int(information[0])
-                core_alloc = information[3]
-                information[1] = 1
-                information[2] = 1
-                choose = True
+    assert os.path.isfile(PATTERN_STORE_FILE)
+    store = PatternStore(PATTERN_STORE_FILE, 'r+')
+    index = store.next_untried()
+    store.adopt(index)
+    if index is None:
+        return -1, None
+    return store.pattern(index), store.core_alloc(index)
+
+def merge_optimize_pick(module_list, keep=None):
+    """ Merge the shard stores written by shard_decision() into the
+        pattern store, ranked as if all shards were evaluated in a
+        single run, and pick the best placement
+
+    Parameter:
+    module_list: all NF modules
+    keep: number of best placements kept, all of them if None
+
+    Returns:
+    chosen_pattern: the chosen placement to be deployed
+    module_info: the detail deployment information
+    """
+    shards = find_shard_stores()
+    if len(shards) != 1:
+        if len(shards) == 0:
+            print("No shard store found")
         else:
-            if past_pattern == int(information[0]):
-                information[2] = 1
-        if '\n' in information:
-            information.remove('\n')
-        writeout_list.append(information)
-    if not change:
-        chosen_pattern = -1
-    pattern_fp.close()
-    writeout_fp = open('pattern.txt', 'w')
-    for writeout_line in writeout_list:
-        for item in writeout_line:            
-            writeout_fp.write(str(item))
-            writeout_fp.write('\t')
-        writeout_fp.write('\n')
-    writeout_fp.close()
-    core_alloc = ast.literal_eval(core_alloc)
-    return chosen_pattern, core_alloc
+            print("Shard stores of several runs (%s shards), remove the " \
+                  "stale ones" % ", ".join(map(str, sorted(shards))))
+        sys.exit(1)
+    shard_num, paths = shards.items()[0]
+    missing = [index for index in range(shard_num) if index not in paths]
+    if len(missing) > 0:
+        print("Missing shards %s of %d" % (missing, shard_num))
+        sys.exit(1)
+
+    position, _ = case_position(module_list)
+    rows = []
+    for index in range(shard_num):
+        store = PatternStore(paths[index])
+        for record in range(len(store)):
+            row = store.row(record)
+            if len(row[1]) != len(module_list):
+                print("%s is not a shard of this configuration" % \
+                      paths[index])
+                sys.exit(1)
+            rows.append(row)
+    # a single run ranks equal throughput in enumeration order; all
+    # records of a pattern are in one shard, in that order already
+    rows.sort(key=lambda row: (-row[-1], position(row[0])))
+    if keep is not None:
+        rows = rows[:keep]
+    PLACE_LOGGER.info("merged %d placements of %d shards" % \
+                      (len(rows), shard_num))
+    chosen_pattern, module_info, _ = optimize_pick(rows)
+    return chosen_pattern, module_info
 
 def count_bounce(module_list, pattern):
     """ Count # bounces between hardwares for a chain
@@ -1115,29 +2646,31 @@ def count_bounce(module_list, pattern):
             count += 1
     return count
 
-def no_profile_optimize_pick(pattern_list, module_list, bess_para, constraints):  
+def no_profile_optimize_pick(pattern_list, module_list, context, \
+                             progress=None):
     """ Run no-profile algorithm (assume all BESS modules have
         same CPU cycles) and select deployment placement
 
     Parameter:
     pattern_list: a list of possible placements
     module_list: all NF modules
-    bess_para: a dictionary of BESS moduels and its profiled
-               CPU cycles
-    constraints: number of available cores
+    context: the PlacementContext of this run
+    progress: an optional Progress counting the evaluated placements,
+              the enumeration stops at its deadline
 
     Returns:
     chosen_pattern: the selected deployment placement
     module_info: the deployment detailed info
 
     """
-    for item_index in bess_para:
-        bess_para[item_index] = '20000'
+    bess_para = {}
+    for item_index in context.bess_para:
+        bess_para[item_index] = 20000
 
     all_chain_pattern_dict = speed_up_calc_cycle(pattern_list, \
                                                  module_list, \
-                                                 bess_para, \
-                                                 constraints)
+                                                 context.with_profile(bess_para), \
+                                                 progress=progress)
     try:
         chosen_pattern, module_info, _ = optimize_pick(all_chain_pattern_dict)
     except:
@@ -1149,14 +2682,12 @@ def no_profile_optimize_pick(pattern_list, module_list, bess_para, constraints):
 
         
 
-def individual_optimize_pick(module_list, bess_para, constraints):
+def individual_optimize_pick(module_list, context):
     """ Run Greedy algortihm and select deployment placement
 
     Parameter:
     module_list: all NF modules
-    bess_para: a dictionary of BESS moduels and its profiled
-               CPU cycles
-    constraints: number of available cores
+    context: the PlacementContext of this run
 
     Returns:
     chosen_pattern:  the selected deployment placement
@@ -1164,13 +2695,13 @@ def individual_optimize_pick(module_list, bess_para, constraints):
                   for BESS modules
 
     """
-    nic = get_nic_info()
+    bess_para = context.bess_para
     module_list = tag_chain_index(copy.deepcopy(module_list))
     weight_dict = generate_weight(module_list)
     module_list = tag_weight(module_list, weight_dict)
-    chain_rate = get_rate()
+    chain_rate = context.chain_rate
     chosen_pattern = 0
-    spare_core = int(nic["nic"][0]["core"])-RESERVE_CORE
+    spare_core = context.nic_core()-RESERVE_CORE
 
     for module in module_list:
         if module.nf_type == 2:
@@ -1189,8 +2720,7 @@ def individual_optimize_pick(module_list, bess_para, constraints):
 
     for chain_index in range(num_of_chain):
         chain_success = False
-        chain_bess, chain_p4 = bfs_sort(copy.deepcopy(\
-                            chain_module_list[chain_index]))
+        chain_bess, chain_p4 = bfs_sort(chain_module_list[chain_index])
         for index in range(len(chain_bess)):
             subgroup = chain_bess[index]
             chain_bess[index] = tag_core_index(subgroup)
@@ -1312,7 +2842,7 @@ def individual_optimize_pick(module_list, bess_para, constraints):
         sum_of_left_traffic = [0]*len(chain_module_list)
         sum_of_left_traffic = (np.sum(left_matrix, axis=0)).tolist()
         left_matrix.append(sum_of_left_traffic)
-        right_matrix.append(int(nic["nic"][int(0)]["throughput"])*1000000)
+        right_matrix.append(context.nic_throughput())
         left_matrix = np.array(left_matrix)
         right_matrix = np.array(right_matrix)
         t = maximizeMarginalRate(chain_rate, left_matrix, right_matrix)
@@ -1328,25 +2858,25 @@ def individual_optimize_pick(module_list, bess_para, constraints):
 
     return chosen_pattern, core_num_all    
 
-def all_p4_optimize_pick(pattern_list, module_list, bess_para):
+def all_p4_optimize_pick(pattern_list, module_list, context):
     """ Run HW-preferred algorithm and select deployment placement
 
     Parameter:
     pattern_list: a list of possible placements
     module_list: all NF modules
-    bess_para: a dictionary of BESS moduels and its profiled
-               CPU cycles
+    context: the PlacementContext of this run
     
     Returns:
     chosen_pattern: the selected deployment placement
     core_num_all: a dictionary of <nic_index, core numbers>
                   for BESS modules
     """
+    bess_para = context.bess_para
     module_list = tag_chain_index(module_list)
     weight_dict = generate_weight(module_list)
     module_list = tag_weight(module_list, weight_dict)
 
-    chain_rate = get_rate()
+    chain_rate = context.chain_rate
     total_chain_num = len(chain_rate)
     chosen_pattern = 0
     for module in module_list:
@@ -1372,8 +2902,7 @@ def all_p4_optimize_pick(pattern_list, module_list, bess_para):
     categorize_dict = {}
     for entry in unique_entries:
         categorize_dict[entry] = []
-    nic = get_nic_info()
-    spare_core_num = int(nic["nic"][0]["core"])\
+    spare_core_num = context.nic_core()\
                         -RESERVE_CORE\
                         -len(bess_subgroup_list)
     notated_final = []
@@ -1415,7 +2944,7 @@ def all_p4_optimize_pick(pattern_list, module_list, bess_para):
         sum_of_left_traffic = [0]*total_chain_num
         sum_of_left_traffic = (np.sum(left_matrix, axis=0)).tolist()
         left_matrix.append(sum_of_left_traffic)
-        right_matrix.append(int(nic["nic"][int(0)]["throughput"])*1000000)
+        right_matrix.append(context.nic_throughput())
     
     left_matrix = np.array(left_matrix)
     right_matrix = np.array(right_matrix)
@@ -1430,26 +2959,25 @@ def all_p4_optimize_pick(pattern_list, module_list, bess_para):
 
     return chosen_pattern, core_num_all
 
-def all_BESS_optimize_pick(pattern_list, module_list, bess_para, constraints):
+def all_BESS_optimize_pick(pattern_list, module_list, context):
     """ Run SW-preferred algorithm and select deployment placement
 
     Parameter:
     pattern_list: a list of possible placements
     module_list: all NF modules
-    bess_para: a dictionary of BESS moduels and its profiled
-               CPU cycles
-    constraints: number of available cores
+    context: the PlacementContext of this run
     
     Returns:
     chosen_pattern: the selected deployment placement
     core_num_all: a dictionary of <nic_index, core numbers>
                   for BESS modules
     """
+    bess_para = context.bess_para
     module_list = tag_chain_index(module_list)
     weight_dict = generate_weight(module_list)
     module_list = tag_weight(module_list, weight_dict)
 
-    chain_rate = get_rate()
+    chain_rate = context.chain_rate
     total_chain_num = len(chain_rate)
     chosen_pattern = 0
     chosen_tuple = None
@@ -1476,8 +3004,7 @@ def all_BESS_optimize_pick(pattern_list, module_list, bess_para, constraints):
     categorize_dict = {}
     for entry in unique_entries:
         categorize_dict[entry] = []
-    nic = get_nic_info()
-    spare_core_num = int(nic["nic"][0]["core"])\
+    spare_core_num = context.nic_core()\
                         -RESERVE_CORE\
                         -len(bess_subgroup_list)
     notated_final = []
@@ -1520,7 +3047,7 @@ def all_BESS_optimize_pick(pattern_list, module_list, bess_para, constraints):
         sum_of_left_traffic = [0]*total_chain_num
         sum_of_left_traffic = (np.sum(left_matrix, axis=0)).tolist()
         left_matrix.append(sum_of_left_traffic)
-        right_matrix.append(int(nic["nic"][int(0)]["throughput"])*1000000)
+        right_matrix.append(context.nic_throughput())
 
     left_matrix = np.array(left_matrix)
     right_matrix = np.array(right_matrix)
@@ -1537,14 +3064,13 @@ def all_BESS_optimize_pick(pattern_list, module_list, bess_para, constraints):
     return chosen_pattern, core_num_all
 
 
-def no_core_alloc_optimization_pick(pattern_list, module_list, bess_para): 
+def no_core_alloc_optimization_pick(pattern_list, module_list, context):
     """ Run no core allocation algorithm and select deployment placement
 
     Parameter:
     pattern_list: a list of possible placements
     module_list: all NF modules
-    bess_para: a dictionary of BESS moduels and its profiled
-               CPU cycles
+    context: the PlacementContext of this run
     
     Returns:
     chosen_pattern: the selected deployment placement
@@ -1552,7 +3078,7 @@ def no_core_alloc_optimization_pick(pattern_list, module_list, bess_para):
     """
     chosen_pattern = None
     chosen_tuple = tuple([])
-    all_pattern_dict = no_core_op_calc_cycle(pattern_list, module_list, bess_para)
+    all_pattern_dict = no_core_op_calc_cycle(pattern_list, module_list, context)
     all_pattern_dict_order = sorted(all_pattern_dict, key=itemgetter(1), reverse=True)
     chosen_pattern = all_pattern_dict_order[0][0]
     pattern_binary = "{0:b}".format(chosen_pattern)
@@ -1560,25 +3086,34 @@ def no_core_alloc_optimization_pick(pattern_list, module_list, bess_para):
     chosen_tuple = tuple(tmp_tuple_list)
     return chosen_pattern, chosen_tuple
 
-def E2_optimization_pick(pattern_list, module_list, bess_para):
+def E2_optimization_pick(pattern_list, module_list, context, progress=None):
     """ Run min bounce allocation algorithm and select deployment placement
 
     Parameter:
-    pattern_list: a list of possible placements
+    pattern_list: a list of possible placements, None to enumerate
+                  them lazily
     module_list: all NF modules
-    bess_para: a dictionary of BESS moduels and its profiled
-               CPU cycles
+    context: the PlacementContext of this run
+    progress: an optional Progress counting the evaluated placements,
+              the enumeration stops at its deadline
     
     Returns:
     chosen_pattern: the selected deployment placement
     chosen_tuple: a tuple of # cores for each subgroup
     """
+    bess_para = context.bess_para
     module_list = tag_chain_index(module_list)
     weight_dict = generate_weight(module_list)
     module_list = tag_weight(module_list, weight_dict)
-    chain_rate = get_rate()
+    chain_rate = context.chain_rate
     total_chain_num = len(chain_rate)
-    pattern_dict = []
+    # only the best placement is used, ranked by the number of
+    # subgroups, then by marginal rate
+    sink = ResultSink(1, key=itemgetter(-1, -2), value=lambda row: sum(row[-2]))
+    if pattern_list is None:
+        pattern_list = iter_case(module_list)
+    if progress is not None:
+        pattern_list = progress.track(pattern_list, sink.best_value)
 
     for pattern in pattern_list:
         notated_list = copy.deepcopy(module_list)
@@ -1604,8 +3139,7 @@ def E2_optimization_pick(pattern_list, module_list, bess_para):
         categorize_dict = {}
         for entry in unique_entries:
             categorize_dict[entry] = []
-        nic = get_nic_info()
-        spare_core_num = int(nic["nic"][0]["core"])\
+        spare_core_num = context.nic_core()\
                             -RESERVE_CORE\
                             -len(bess_subgroup_list)
         notated_final = []
@@ -1646,7 +3180,7 @@ def E2_optimization_pick(pattern_list, module_list, bess_para):
             sum_of_left_traffic = [0]*total_chain_num
             sum_of_left_traffic = (np.sum(left_matrix, axis=0)).tolist()
             left_matrix.append(sum_of_left_traffic)
-            right_matrix.append(int(nic["nic"][int(0)]["throughput"])*1000000)
+            right_matrix.append(context.nic_throughput())
         
         left_matrix = np.array(left_matrix)
         right_matrix = np.array(right_matrix)
@@ -1661,9 +3195,9 @@ def E2_optimization_pick(pattern_list, module_list, bess_para):
             else:
                 assert module.nic_index == 0
             core_num_all.append([module.nic_index, module.core_num])
-        pattern_dict.append([pattern, core_num_all, mr, -subgroup_count])
+        sink.push([pattern, core_num_all, mr, -subgroup_count])
 
-    all_pattern_dict_order = sorted(pattern_dict, key=itemgetter(-1, -2), reverse=True)   
+    all_pattern_dict_order = sink.rows()
     chosen_pattern = all_pattern_dict_order[0][0]
     module_info  = all_pattern_dict_order[0][1]
 
@@ -1678,7 +3212,8 @@ def mode_select_pattern_list(mode, module_list):
     module_list: all NF modules
 
     Returns:
-    pattern_list: all possible placement
+    pattern_list: all possible placement, None if the placement
+                  routine enumerates them lazily
 
     """
     pattern_list = []
@@ -1689,16 +3224,18 @@ def mode_select_pattern_list(mode, module_list):
     elif mode == 7:
         pattern_list = pattern_list
     else:
-        pattern_list = enum_case(module_list)
+        # enumerated lazily by the placement routine, see iter_case()
+        pattern_list = None
         
     return pattern_list
 
-def heuristic_core_allocation(module_list):
+def heuristic_core_allocation(module_list, context):
     """ Run brutal force routine for heuristic's 
         core allocation
 
     Parameter:
     module_list: all NF modules
+    context: the PlacementContext of this run
 
     Returns:
     all_chain_pattern_dict: <pattern, throughput> dictionary
@@ -1707,18 +3244,15 @@ def heuristic_core_allocation(module_list):
 
     """
 
-    pattern_list = enum_case(module_list)
-    bess_dict_para, constraints = read_para()
-
-    all_chain_pattern_dict = speed_up_calc_cycle(pattern_list, \
+    all_chain_pattern_dict = speed_up_calc_cycle(None, \
                                                  module_list, \
-                                                 bess_dict_para, \
-                                                 constraints)
+                                                 context)
 
-    return all_chain_pattern_dict, bess_dict_para
+    return all_chain_pattern_dict, context.bess_para
 
 def mode_select_hardware_deployment(mode, chain_enum_list, 
-                    all_modules, bess_dict_para, constraints):
+                    all_modules, context, jobs=1, keep=None, \
+                    time_budget=TIME_BUDGET, seed=0, deadline=DEADLINE):
     """ Select from possible placement and run algorithm
         to decide the best placement and core assignment
 
@@ -1726,9 +3260,15 @@ def mode_select_hardware_deployment(mode, chain_enum_list,
     mode: chosen algorithm number
     chain_enum_list: all possible placement
     all_modules: all NF modules
-    bess_dict_para: a dictionary of bess module name and 
-                    profiled cycles
-    constraints: number of available BESS cores in total
+    context: the PlacementContext of this run
+    jobs: number of worker processes for mode 0/6
+    keep: number of best placements kept for mode 0/4/6/8/10, all
+          of them if None
+    time_budget: wall-clock budget in seconds for mode 8
+    seed: seed of the random moves of mode 8
+    deadline: wall-clock deadline in seconds for mode 0/1/4/5/6, the
+              best placement evaluated by then is used; None for no
+              deadline
 
     Returns:
     chosen_pattern: selected deployment hardware decision
@@ -1737,65 +3277,150 @@ def mode_select_hardware_deployment(mode, chain_enum_list,
     """
     chosen_pattern = -1
     core_alloc = None
+    sink = ResultSink()
+    if keep is not None:
+        sink = ResultSink(keep, RESULT_SAMPLE_SIZE)
+    progress = None
+    if mode in [0, 1, 4, 5, 6]:
+        progress = Progress(case_fraction(all_modules), deadline, \
+                            report_progress)
 
     if mode == 0 or mode == 6:
-        all_chain_pattern_dict = speed_up_calc_cycle(chain_enum_list,\
-                             all_modules, bess_dict_para, constraints)
+        all_chain_pattern_dict = parallel_calc_cycle(chain_enum_list,\
+                             all_modules, context, jobs, sink, progress)
+        progress.finish()
+        log_result_sink(sink)
         chosen_pattern, core_alloc, _ = optimize_pick(all_chain_pattern_dict)
     elif mode == 1:
         chosen_pattern, core_alloc = no_profile_optimize_pick(chain_enum_list,\
-                                     all_modules, bess_dict_para, constraints)
+                                     all_modules, context, progress)
+        progress.finish()
     elif mode == 2:
         chosen_pattern, core_alloc = individual_optimize_pick( all_modules, \
-                                                bess_dict_para, constraints)
+                                                context)
     elif mode == 3:
         chosen_pattern, core_alloc = all_p4_optimize_pick(chain_enum_list, \
-                                                all_modules, bess_dict_para)
+                                                all_modules, context)
     elif mode == 4:
         all_chain_pattern_dict = no_core_op_calc_cycle(chain_enum_list, \
-                                                all_modules, bess_dict_para)
-        chosen_pattern, core_alloc = optimize_pick(all_chain_pattern_dict)
+                                                all_modules, context, sink, \
+                                                progress)
+        progress.finish()
+        log_result_sink(sink)
+        chosen_pattern, core_alloc, _ = optimize_pick(all_chain_pattern_dict)
     elif mode == 5:
         chosen_pattern, core_alloc = E2_optimization_pick(chain_enum_list, \
-                                                all_modules, bess_dict_para)
+                                                all_modules, context, progress)
+        progress.finish()
     elif mode == 7:
         chosen_pattern, core_alloc = all_BESS_optimize_pick(chain_enum_list, \
-                                    all_modules, bess_dict_para, constraints)
+                                    all_modules, context)
+    elif mode == 8:
+        all_chain_pattern_dict = anneal_calc_cycle(all_modules, context, \
+                                                   time_budget, seed, sink)
+        log_result_sink(sink)
+        chosen_pattern, core_alloc, _ = optimize_pick(all_chain_pattern_dict)
+    elif mode == 9:
+        all_chain_pattern_dict = milp_calc_cycle(all_modules, context, sink)
+        chosen_pattern, core_alloc, _ = optimize_pick(all_chain_pattern_dict)
+    elif mode == 10:
+        all_chain_pattern_dict = decompose_calc_cycle(all_modules, context, \
+                                                      sink)
+        log_result_sink(sink)
+        chosen_pattern, core_alloc, _ = optimize_pick(all_chain_pattern_dict)
         
     return chosen_pattern, core_alloc
 
-def place_decision(lemur_parser, next_best_flag, op_mode):
+def shard_decision(lemur_parser, op_mode, shard, jobs=1, context=None, \
+                   keep=None, deadline=DEADLINE):
+    """ Evaluate one shard of the placements of mode 0/4/6 and write
+        its results to the shard store, see merge_optimize_pick()
+
+    Parameter:
+    lemur_parser: DAG parser
+    op_mode: chosen algorithm, 0, 4 or 6
+    shard: (index, count) of the shard, see iter_case()
+    jobs: number of worker processes for mode 0/6
+    context: the PlacementContext of this run, loaded from the
+             input files if None
+    keep: number of best placements kept, all of them if None
+    deadline: wall-clock deadline in seconds, None for no deadline
+
+    Returns:
+    path: the shard store
+    """
+    nf_graph = convert_global_nf_graph(lemur_parser.scanner)
+    modules = nf_graph.list_modules()
+    modules.sort(key=lambda l: (l.service_path_id, l.service_id))
+    if context is None:
+        context = load_context()
+
+    sink = ResultSink()
+    if keep is not None:
+        sink = ResultSink(keep, RESULT_SAMPLE_SIZE)
+    progress = Progress(case_fraction(modules), deadline, report_progress)
+    if op_mode == 4:
+        all_chain_pattern_dict = no_core_op_calc_cycle(None, modules, \
+                                                       context, sink, \
+                                                       progress, shard)
+    else:
+        all_chain_pattern_dict = parallel_calc_cycle(None, modules, context, \
+                                                     jobs, sink, progress, \
+                                                     shard)
+    progress.finish()
+    log_result_sink(sink)
+    path = SHARD_STORE_FILE % shard
+    write_pattern_store(path, all_chain_pattern_dict)
+    return path
+
+def place_decision(lemur_parser, next_best_flag, op_mode, jobs=1, \
+                   context=None, keep=None, time_budget=TIME_BUDGET, seed=0, \
+                   deadline=DEADLINE, merge=False):
     """ Run chosen algorithm to assign deploymenet hardware
 
     Parameter:
     lemur_parser: DAG parser
     next_best_flag: flagged to chose next best placement
     op_mode: chosen algorithm
+    jobs: number of worker processes for mode 0/6
+    context: the PlacementContext of this run, loaded from the
+             input files if None
+    keep: number of best placements kept for mode 0/4/6/8/10, all
+          of them if None
+    time_budget: wall-clock budget in seconds for mode 8
+    seed: seed of the random moves of mode 8
+    deadline: wall-clock deadline in seconds for mode 0/1/4/5/6, None
+              for no deadline
+    merge: merge the shard stores instead of running |op_mode|, see
+           merge_optimize_pick()
 
     Returns:
     all_modules: all marked NFs with assigned deployment info
     
     """
     decision_pattern = None
-    bess_cycle_profile_dict = {}
-    constraints = {}
     all_modules = []
     modules = []
     
     nf_graph = convert_global_nf_graph(lemur_parser.scanner)
     modules = nf_graph.list_modules()
     modules.sort(key=lambda l: (l.service_path_id, l.service_id))
-    bess_cycle_profile_dict, constraints = read_para()
+    if context is None:
+        context = load_context()
 
-    if not next_best_flag:
+    if merge:
+        decision_pattern, core_alloc = merge_optimize_pick(modules, keep)
+    elif not next_best_flag:
         chain_enum_list = mode_select_pattern_list(op_mode, modules)
         decision_pattern, core_alloc = mode_select_hardware_deployment(op_mode, \
-                chain_enum_list, modules, bess_cycle_profile_dict, constraints)
+                chain_enum_list, modules, context, jobs, keep, \
+                time_budget, seed, deadline)
     else:
         decision_pattern, core_alloc = next_optimize_pick()
+    PLACE_LOGGER.info("subgroup row cache %s" % subgroup_row_cache.stats())
 
     all_modules = apply_pattern(modules, decision_pattern, core_alloc, \
-                                bess_cycle_profile_dict)
+                                context.bess_para)
     if all_modules:
         log_module(all_modules)
     else:
@@ -1,5 +1,16 @@
+import os
 import numpy as np
-import gurobipy as gp
+from collections import OrderedDict
+try:
+    import gurobipy as gp
+except ImportError:
+    gp = None
+
+# absolute constraint violation accepted by the closed-form solver,
+# same as Gurobi's default FeasibilityTol
+FEAS_TOL = 1e-6
+# pivoting tolerance of the NumPy simplex (on the scaled LP)
+SIMPLEX_TOL = 1e-9
 
 
 def maximizeMarginalRate(bounds, A, b, noLog=True):
@@ -8,6 +19,249 @@ def maximizeMarginalRate(bounds, A, b, noLog=True):
     # A f <= b
     # return (throughput_f1, ... throughput_fk) > (0, ..., 0) if feasible;
     # otherwise (0, ..., 0)
+    return getSolver().solve(bounds, np.asarray(A, dtype=float), \
+                             np.asarray(b, dtype=float))
+
+
+def maximizeMarginalRateBatch(bounds, A_list, b_list):
+    """ Solve a batch of LPs that share the same chain bounds with
+        the selected solver backend
+
+    Parameter:
+    bounds: the min/max SLOs
+    A_list: a list of constraint matrices
+    b_list: a list of right-hand sides
+
+    Returns:
+    a list of throughput tuples, (0, ..., 0) for infeasible LPs
+
+    """
+    return getSolver().solve_many(bounds, \
+                                  [np.asarray(A, dtype=float) for A in A_list], \
+                                  [np.asarray(b, dtype=float) for b in b_list])
+
+
+class LPSolver(object):
+    """ Interface of a solver backend for the throughput LP
+        max sum(t) s.t. A t <= b, min_f <= t_f <= max_f
+    """
+    name = None
+
+    def solve(self, bounds, A, b):
+        """ Solve one LP
+
+        Parameter:
+        bounds: the min/max SLOs
+        A: the constraint matrix
+        b: the right-hand side
+
+        Returns:
+        a tuple of throughputs, (0, ..., 0) if infeasible
+
+        """
+        raise NotImplementedError
+
+    def solve_many(self, bounds, A_list, b_list):
+        """ Solve a batch of LPs that share the same chain bounds
+
+        Parameter:
+        bounds: the min/max SLOs
+        A_list: a list of constraint matrices
+        b_list: a list of right-hand sides
+
+        Returns:
+        a list of throughput tuples
+
+        """
+        return [self.solve(bounds, A_list[i], b_list[i]) \
+                for i in range(len(A_list))]
+
+
+class GurobiSolver(LPSolver):
+    """ Solve each LP with Gurobi. The solver keeps one environment
+        and one model per LP shape (number of rows and chains), and
+        only updates the bounds, coefficients and right-hand sides that
+        changed since the previous LP of that shape. Re-optimizing a
+        modified model lets Gurobi start from the previous basis.
+    """
+    name = "gurobi"
+
+    def __init__(self):
+        if gp is None:
+            raise RuntimeError("gurobipy is not installed")
+        self.env = None
+        self.pid = None
+        self.models = {}
+
+    def get_env(self):
+        # Gurobi environments cannot be shared with forked pool
+        # workers, so each process creates its own one
+        if self.env is None or self.pid != os.getpid():
+            self.env = gp.Env("")
+            self.pid = os.getpid()
+            self.models = {}
+        return self.env
+
+    def build_model(self, bounds, A, b):
+        (numRow, numFlow) = A.shape
+        model = gp.Model(env=self.get_env())
+        model.setParam("OutputFlag", 0)
+        t = [model.addVar(lb=bounds[f][0], ub=bounds[f][1], \
+                          vtype=gp.GRB.CONTINUOUS, name="t_%d" % f) \
+             for f in range(numFlow)]
+        model.update()
+        model.setObjective(gp.quicksum(t), gp.GRB.MAXIMIZE)
+        constrs = []
+        for row in range(numRow):
+            expr = gp.LinExpr([(A[row, f], t[f]) for f in range(numFlow) \
+                               if A[row, f] != 0])
+            constrs.append(model.addConstr(expr <= b[row], \
+                                           name="c_{0}".format(row)))
+        model.update()
+        return {"model": model, "t": t, "constrs": constrs, \
+                "bounds": np.array(bounds, dtype=float).reshape(numFlow, 2), \
+                "A": A.copy(), "b": b.copy()}
+
+    def update_model(self, entry, bounds, A, b):
+        model = entry["model"]
+        bound = np.array(bounds, dtype=float).reshape(len(entry["t"]), 2)
+        for f in np.flatnonzero((bound != entry["bounds"]).any(axis=1)):
+            entry["t"][f].LB = bound[f, 0]
+            entry["t"][f].UB = bound[f, 1]
+        for row, f in zip(*np.nonzero(A != entry["A"])):
+            model.chgCoeff(entry["constrs"][row], entry["t"][f], A[row, f])
+        changed = np.flatnonzero(b != entry["b"])
+        if len(changed) > 0:
+            model.setAttr("RHS", [entry["constrs"][row] for row in changed], \
+                          b[changed].tolist())
+        entry["bounds"] = bound
+        entry["A"] = A.copy()
+        entry["b"] = b.copy()
+        return
+
+    def solve(self, bounds, A, b):
+        numFlow = len(bounds)
+        (numRow, numCol) = A.shape
+        assert numRow == len(b) and numCol == numFlow
+
+        self.get_env()
+        key = (numRow, numFlow)
+        if key not in self.models:
+            self.models[key] = self.build_model(bounds, A, b)
+        else:
+            self.update_model(self.models[key], bounds, A, b)
+        entry = self.models[key]
+        model = entry["model"]
+        model.optimize()
+        status = model.status
+        throughputs = [0] * numFlow
+        if status == gp.GRB.Status.OPTIMAL:
+            throughputs = [var.X for var in entry["t"]]
+        elif status == gp.GRB.Status.INFEASIBLE or \
+                status == gp.GRB.Status.INF_OR_UNBD:
+            pass
+        else:
+            assert False, "Solver returns neither OPTIMAL nor INFEASIBLE."
+        return tuple(throughputs)
+
+
+class NumpySimplexSolver(LPSolver):
+    """ Solve each LP with the bounded-variable simplex in NumPy,
+        no licence needed
+    """
+    name = "numpy-simplex"
+
+    def solve(self, bounds, A, b):
+        return simplexMaximizeMarginalRate(bounds, A, b)
+
+
+class AutoSolver(LPSolver):
+    """ Solve separable LPs (see isSeparable()) in closed form, and
+        the other LPs with Gurobi if a licence is available, or with
+        the NumPy simplex otherwise
+    """
+    name = "auto"
+
+    def __init__(self):
+        self.fallback = None
+
+    def get_fallback(self):
+        if self.fallback is None:
+            if gurobiAvailable():
+                self.fallback = GurobiSolver()
+            else:
+                self.fallback = NumpySimplexSolver()
+        return self.fallback
+
+    def solve(self, bounds, A, b):
+        return self.solve_many(bounds, [A], [b])[0]
+
+    def solve_many(self, bounds, A_list, b_list):
+        numFlow = len(bounds)
+        results = [None] * len(A_list)
+        shape_index = {}
+        for index in range(len(A_list)):
+            A = A_list[index]
+            if not isSeparable(A):
+                results[index] = self.get_fallback().solve(bounds, A, \
+                                                           b_list[index])
+                continue
+            assert A.shape[1] == numFlow and A.shape[0] == len(b_list[index])
+            shape_index.setdefault(A.shape[0], []).append(index)
+
+        bound = np.array(bounds, dtype=float).reshape(numFlow, 2)
+        for numRow, index_list in shape_index.items():
+            A = np.array([A_list[i] for i in index_list])
+            b = np.array([b_list[i] for i in index_list])
+            t = solveSeparable(bound[:, 0], bound[:, 1], A, b)
+            for pos in range(len(index_list)):
+                results[index_list[pos]] = tuple(t[pos].tolist())
+        return results
+
+
+SOLVER_BACKENDS = OrderedDict([
+    (AutoSolver.name, AutoSolver),
+    (GurobiSolver.name, GurobiSolver),
+    (NumpySimplexSolver.name, NumpySimplexSolver),
+])
+solver = None
+
+
+def setSolver(name):
+    """ Select the LP solver backend
+
+    Parameter:
+    name: one of SOLVER_BACKENDS
+
+    """
+    global solver
+    if name not in SOLVER_BACKENDS:
+        raise ValueError("unknown LP solver %s, choose from %s" % \
+                         (name, ", ".join(SOLVER_BACKENDS)))
+    solver = SOLVER_BACKENDS[name]()
+    return solver
+
+
+def getSolver():
+    # the auto backend is used unless setSolver() was called
+    if solver is None:
+        setSolver(AutoSolver.name)
+    return solver
+
+
+def gurobiAvailable():
+    # True if gurobipy is installed and a licence can be checked out
+    if gp is None:
+        return False
+    try:
+        gp.Env()
+    except gp.GurobiError:
+        return False
+    return True
+
+
+def gurobiMaximizeMarginalRate(bounds, A, b, noLog=True):
+    # same as maximizeMarginalRate, always solved by Gurobi
     numFlow = len(bounds)
     (numRow, numCol) = A.shape
     assert numRow == len(b) and numCol == numFlow
@@ -48,6 +302,206 @@ def maximizeMarginalRate(bounds, A, b, noLog=True):
     return tuple(throughputs)
 
 
+def simplexMaximizeMarginalRate(bounds, A, b):
+    # same as maximizeMarginalRate, solved by boundedSimplex()
+    numFlow = len(bounds)
+    (numRow, numCol) = A.shape
+    assert numRow == len(b) and numCol == numFlow
+    lb = np.array([bound[0] for bound in bounds], dtype=float)
+    ub = np.array([bound[1] for bound in bounds], dtype=float)
+    if (ub < lb).any():
+        return tuple([0] * numFlow)
+
+    # t = lb + colScale * x with 0 <= x <= upper, and every row scaled
+    # so that the largest coefficient is 1
+    span = ub - lb
+    colScale = np.where(np.isfinite(span) & (span > 0), span, 1.0)
+    M = A * colScale[None, :]
+    r = b - A.dot(lb)
+    rowScale = np.abs(M).max(axis=1) if numCol > 0 else np.zeros(numRow)
+    rowScale[rowScale == 0] = 1.0
+    M = M / rowScale[:, None]
+    r = r / rowScale
+    upper = span / colScale
+
+    # slack for each row, an artificial for each row with r < 0
+    negRow = np.flatnonzero(r < 0)
+    numArt = len(negRow)
+    art = np.zeros((numRow, numArt))
+    art[negRow, np.arange(numArt)] = -1.0
+    M = np.hstack([M, np.eye(numRow), art])
+    upper = np.concatenate([upper, np.full(numRow, np.inf), \
+                            np.full(numArt, np.inf)])
+    basis = list(range(numCol, numCol + numRow))
+    for k in range(numArt):
+        basis[negRow[k]] = numCol + numRow + k
+    atUpper = np.zeros(len(upper), dtype=bool)
+
+    if numArt > 0:
+        cost = np.zeros(len(upper))
+        cost[numCol + numRow:] = 1.0
+        z, basis, atUpper = boundedSimplex(cost, M, r, upper, basis, atUpper)
+        if z[numCol + numRow:].sum() > SIMPLEX_TOL * max(1, numRow):
+            return tuple([0] * numFlow)
+        # keep artificials at zero from now on
+        upper[numCol + numRow:] = 0
+
+    cost = np.zeros(len(upper))
+    cost[:numCol] = -colScale
+    z, basis, atUpper = boundedSimplex(cost, M, r, upper, basis, atUpper)
+    t = lb + colScale * z[:numCol]
+    return tuple(np.minimum(np.maximum(t, lb), ub).tolist())
+
+
+def boundedSimplex(cost, M, r, upper, basis, atUpper, maxIter=None):
+    """ Revised simplex for min cost*z s.t. M z = r, 0 <= z <= upper,
+        where a non-basic variable sits at either of its bounds.
+        Bland's rule is used for both the entering and the leaving
+        variable, so degenerate LPs do not cycle.
+
+    Parameter:
+    cost: the objective coefficients
+    M: the equality constraint matrix
+    r: the right-hand side
+    upper: upper bound of each variable (may be inf)
+    basis: column index of the basic variable of each row, must be
+           a feasible basis together with |atUpper|
+    atUpper: True for each non-basic variable at its upper bound
+
+    Returns:
+    z: the optimal solution
+    basis: the final basis
+    atUpper: the final non-basic bounds
+
+    """
+    numRow, numVar = M.shape
+    basis = list(basis)
+    atUpper = atUpper.copy()
+    if maxIter is None:
+        maxIter = 50 * (numRow + numVar)
+    for iteration in range(maxIter):
+        B = M[:, basis]
+        z_N = np.where(atUpper, upper, 0)
+        z_N[basis] = 0
+        z_B = np.linalg.solve(B, r - M.dot(z_N))
+        y = np.linalg.solve(B.T, cost[basis])
+        reduced = cost - M.T.dot(y)
+
+        enter = -1
+        isBasic = np.zeros(numVar, dtype=bool)
+        isBasic[basis] = True
+        for j in range(numVar):
+            if isBasic[j] or upper[j] == 0:
+                continue
+            if (not atUpper[j] and reduced[j] < -SIMPLEX_TOL) or \
+                    (atUpper[j] and reduced[j] > SIMPLEX_TOL):
+                enter = j
+                break
+        if enter < 0:
+            z = z_N
+            z[basis] = z_B
+            return z, basis, atUpper
+
+        # z_B moves by -sign*theta*w when z_enter moves by sign*theta
+        sign = -1.0 if atUpper[enter] else 1.0
+        w = np.linalg.solve(B, M[:, enter]) * sign
+        theta = upper[enter]
+        leave = -1
+        for i in range(numRow):
+            if w[i] > SIMPLEX_TOL:
+                step = max(z_B[i], 0) / w[i]
+            elif w[i] < -SIMPLEX_TOL and np.isfinite(upper[basis[i]]):
+                step = max(upper[basis[i]] - z_B[i], 0) / -w[i]
+            else:
+                continue
+            if step < theta or (step == theta and leave >= 0 and \
+                                basis[i] < basis[leave]):
+                theta = step
+                leave = i
+        if not np.isfinite(theta):
+            raise ValueError("unbounded LP")
+        if leave < 0:
+            atUpper[enter] = not atUpper[enter]
+            continue
+        atUpper[basis[leave]] = w[leave] < 0
+        atUpper[enter] = False
+        basis[leave] = enter
+    raise ValueError("simplex did not converge in %d iterations" % maxIter)
+
+
+def isSeparable(A):
+    """ Check if the LP has the structure built by the placement
+        routines: every row but the last one puts a non-negative
+        coefficient on at most one chain, and the last row (the NIC
+        row) is an arbitrary non-negative coupling row
+
+    Parameter:
+    A: the constraint matrix
+
+    """
+    if A.ndim != 2 or A.shape[0] == 0:
+        return False
+    if (A < 0).any():
+        return False
+    return ((A[:-1] != 0).sum(axis=1) <= 1).all()
+
+
+def solveSeparable(lb, ub, A, b):
+    """ Closed-form solver of a batch of separable LPs
+
+    Parameter:
+    lb: lower bound of each chain, shape (numFlow,)
+    ub: upper bound of each chain, shape (numFlow,)
+    A: constraint matrices, shape (batch, numRow, numFlow)
+    b: right-hand sides, shape (batch, numRow)
+
+    Returns:
+    t: throughput of each chain, shape (batch, numFlow); rows of
+       infeasible LPs are all zero
+
+    """
+    batch, numRow, numFlow = A.shape
+    capA = A[:, :-1, :]
+    capb = b[:, :-1]
+    coef = A[:, -1, :]
+    budget = b[:, -1]
+
+    # per-chain caps from single-chain rows
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(capA > 0, capb[:, :, None] / capA, np.inf)
+    upper = np.minimum(ub[None, :], ratio.min(axis=1) if numRow > 1 \
+                       else np.inf)
+    lower = np.broadcast_to(lb[None, :], upper.shape)
+    # the min rates must fit into every row, tiny violations are
+    # accepted and the cap is lifted up to the min rate
+    feasible = ((capA * lb[None, None, :]).sum(axis=2) \
+                <= capb + FEAS_TOL).all(axis=1)
+    feasible &= (ub >= lb).all()
+    upper = np.maximum(upper, lower)
+
+    # knapsack on the coupling row, cheapest coefficient first
+    remain = budget - (coef * lower).sum(axis=1)
+    feasible &= remain >= -FEAS_TOL
+    remain = np.maximum(remain, 0)
+    slack = upper - lower
+    order = np.argsort(coef, axis=1, kind='mergesort')
+    rows = np.arange(batch)[:, None]
+    sorted_coef = coef[rows, order]
+    sorted_slack = slack[rows, order]
+    sorted_cost = sorted_coef * sorted_slack
+    free = (sorted_coef == 0)
+    sorted_cost[free] = 0
+    spent = np.cumsum(sorted_cost, axis=1) - sorted_cost
+    left = np.maximum(remain[:, None] - spent, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fill = np.where(free, sorted_slack, \
+                        np.minimum(sorted_slack, left / sorted_coef))
+    t = np.empty_like(upper)
+    t[rows, order] = lower[rows, order] + fill
+    t[~feasible] = 0
+    return t
+
+
 def marginalRate(bounds, throughputs):
     """ Calculate marginal rate according to estimated
         throughput and SLO for each chain
@@ -71,6 +525,61 @@ def simpleTest():
     print "Throughput", t
     print "MarginalRate", marginalRate(bounds, t)
 
+
+def separableTest(numTest=200, seed=0):
+    # compare the closed-form solver with Gurobi (or the NumPy simplex
+    # if no licence is available) on random LPs shaped like the
+    # placement LPs (per-subgroup rows plus one NIC row)
+    rng = np.random.RandomState(seed)
+    fast = AutoSolver()
+    if gurobiAvailable():
+        exact = GurobiSolver()
+    else:
+        exact = NumpySimplexSolver()
+    for test in range(numTest):
+        numFlow = rng.randint(1, 5)
+        numGroup = rng.randint(1, 6)
+        bounds = []
+        for f in range(numFlow):
+            minRate = rng.uniform(0, 2e9)
+            bounds.append((minRate, minRate + rng.uniform(0, 1e11)))
+        A = np.zeros((numGroup + 1, numFlow))
+        b = np.zeros(numGroup + 1)
+        for row in range(numGroup):
+            A[row, rng.randint(numFlow)] = rng.uniform(0, 2)
+            b[row] = rng.uniform(1e8, 3e10)
+        A[-1] = A[:-1].sum(axis=0)
+        b[-1] = rng.uniform(1e9, 4e10)
+        t_fast = fast.solve_many(bounds, [A], [b])[0]
+        t_exact = exact.solve(bounds, A, b)
+        assert (sum(t_fast) == 0) == (sum(t_exact) == 0), (bounds, A, b)
+        assert abs(sum(t_fast) - sum(t_exact)) <= \
+            1e-6 * max(1, sum(t_exact))
+    print "separableTest: %d LPs match %s" % (numTest, exact.name)
+
+
+def simplexTest(numTest=200, seed=0):
+    # check the NumPy simplex on random (non-separable) LPs: the result
+    # must be feasible, and match Gurobi if a licence is available
+    rng = np.random.RandomState(seed)
+    for test in range(numTest):
+        numFlow = rng.randint(1, 5)
+        numRow = rng.randint(1, 7)
+        lb = rng.uniform(0, 3, numFlow)
+        bounds = zip(lb, lb + rng.uniform(0, 10, numFlow))
+        A = rng.uniform(0, 2, (numRow, numFlow))
+        b = rng.uniform(0, 15, numRow)
+        t = simplexMaximizeMarginalRate(bounds, A, b)
+        if sum(t) == 0:
+            continue
+        assert (A.dot(t) <= b + FEAS_TOL).all()
+        if gurobiAvailable():
+            t_exact = gurobiMaximizeMarginalRate(bounds, A, b)
+            assert abs(sum(t) - sum(t_exact)) <= 1e-6 * max(1, sum(t))
+    print "simplexTest: %d LPs solved" % numTest
+
     
 if __name__ == "__main__":
     simpleTest()
+    separableTest()
+    simplexTest()
@@ -0,0 +1,116 @@
+"""
+* This file provides the read-only inputs of an NF placement run.
+*
+* The profiled BESS cycles (module_data.txt), chain SLOs (chain_rate.txt),
+* NIC info (device.txt) and delay requirements (max_delay.txt) are parsed
+* once into a PlacementContext, which is then passed to every placement
+* routine. The context is reloaded only when one of the files changes.
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+
+CONTEXT_FILES = ('module_data.txt', 'chain_rate.txt', 'device.txt', \
+                 'max_delay.txt')
+
+
+class PlacementContext(namedtuple('PlacementContext', \
+        ['bess_para', 'constraints', 'chain_rate', 'nic', 'delay_ls', \
+         'max_delay'])):
+    """ Immutable inputs of a placement run. The dictionaries inside
+        are shared by all users of the context and must not be
+        modified, use with_profile() to get a context with another
+        profile.
+
+    Args:
+        bess_para: a dictionary of BESS module name and its profiled
+                   CPU cycles (int)
+        constraints: a dictionary of core constraints
+        chain_rate: min/max throughput of each chain, a tuple of
+                    (min, max) tuples
+        nic: a dictionary containing each nic detail
+        delay_ls: max delay (in cycles) of each chain, a tuple
+        max_delay: |delay_ls| as a float array
+    """
+    __slots__ = ()
+
+    def nic_core(self, nic_index=0):
+        # number of CPU cores of the server attached to a NIC
+        return int(self.nic["nic"][nic_index]["core"])
+
+    def nic_throughput(self, nic_index=0):
+        # NIC throughput in bps
+        return int(self.nic["nic"][nic_index]["throughput"])*1000000
+
+    def nic_num(self):
+        # number of NICs (BESS servers) attached to the switch
+        return len(self.nic["nic"])
+
+    def nic_reserve(self, nic_index, default):
+        # number of CPU cores kept away from NFs, optional "reserve"
+        return int(self.nic["nic"][nic_index].get("reserve", default))
+
+    def nic_cpu_freq(self, nic_index, default):
+        # CPU frequency in Hz, optional "freq" in MHz
+        return int(self.nic["nic"][nic_index].get("freq", default))*1000000
+
+    def with_profile(self, bess_para):
+        """ Get a copy of the context with another profile
+
+        Parameter:
+        bess_para: a dictionary of BESS module name and its profiled
+                   CPU cycles
+
+        Returns:
+        a new PlacementContext
+        """
+        return self._replace(bess_para=dict(bess_para))
+
+
+def make_context(bess_para, constraints, chain_rate, nic, delay_ls):
+    """ Build a PlacementContext from parsed inputs
+
+    Parameter:
+    bess_para: a dictionary of BESS module name and its profiled
+               CPU cycles, as read from module_data.txt
+    constraints: a dictionary of core constraints
+    chain_rate: min/max throughput of each chain
+    nic: a dictionary containing each nic detail
+    delay_ls: a list of max delay for each chain
+
+    Returns:
+    a new PlacementContext
+    """
+    typed_para = {}
+    for name in bess_para:
+        try:
+            typed_para[name] = int(bess_para[name])
+        except ValueError:
+            typed_para[name] = bess_para[name]
+    chain_rate = tuple([tuple(rate) for rate in chain_rate])
+    delay_ls = tuple(delay_ls)
+    return PlacementContext(typed_para, dict(constraints), chain_rate, nic, \
+                            delay_ls, np.array(delay_ls, dtype=float))
+
+
+def file_stamp(paths):
+    """ Get a stamp that changes whenever one of the files changes
+
+    Parameter:
+    paths: file paths
+
+    Returns:
+    a tuple of (path, mtime, size), mtime and size are None for
+    missing files
+    """
+    stamp = []
+    for path in paths:
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+            stamp.append((path, stat.st_mtime, stat.st_size))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
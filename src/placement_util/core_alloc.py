@@ -0,0 +1,85 @@
+"""
+* This file provides the spare-core allocator used by NF placement.
+*
+* Spare BESS cores are spread over replicable subgroups. Each allocation
+* is an integer composition of the spare cores, i.e. a tuple whose i-th
+* entry is the number of extra cores given to the i-th subgroup.
+"""
+
+import math
+
+
+def core_upper_bound(base_rate, base_core, core_num, max_rate):
+    """ Compute the number of extra cores after which a subgroup
+        already passes its chain's max rate. Adding more cores to
+        such a subgroup does not change the LP result.
+
+    Parameter:
+    base_rate: the subgroup throughput with |base_core| cores
+    base_core: number of cores used to compute |base_rate|
+    core_num: number of cores the subgroup already has
+    max_rate: the max throughput of the subgroup's chain
+
+    Returns:
+    bound: the max number of extra cores worth assigning, None
+           if the subgroup has no throughput estimation
+    """
+    if base_rate <= 0:
+        return None
+    core_rate = base_rate/float(base_core)
+    total_core = int(math.ceil(max_rate/core_rate))
+    return max(0, total_core-int(core_num))
+
+
+def iter_core_alloc(total_core, group_num, upper_bound=None):
+    """ Enumerate each composition of |total_core| over |group_num|
+        subgroups exactly once, in the order produced by counting
+        itertools.combinations_with_replacement(range(group_num),
+        total_core), i.e. the first subgroup gets the most cores first.
+
+    Parameter:
+    total_core: number of spare cores to be assigned
+    group_num: number of subgroups
+    upper_bound: an optional list of max extra cores for each subgroup
+                 (None means unbounded). If the bounds cannot absorb all
+                 spare cores, the remaining cores stay idle.
+
+    Returns:
+    a generator of core tuples
+    """
+    if group_num <= 0:
+        return
+    bound = []
+    for index in range(group_num):
+        if upper_bound is None or upper_bound[index] is None:
+            bound.append(total_core)
+        else:
+            bound.append(min(total_core, upper_bound[index]))
+    suffix_bound = [0]*(group_num+1)
+    for index in range(group_num-1, -1, -1):
+        suffix_bound[index] = suffix_bound[index+1]+bound[index]
+    total_core = min(total_core, suffix_bound[0])
+
+    alloc = [0]*group_num
+    remaining = total_core
+    for index in range(group_num):
+        alloc[index] = min(bound[index], remaining)
+        remaining -= alloc[index]
+    yield tuple(alloc)
+
+    while True:
+        tail_sum = alloc[-1]
+        index = group_num-2
+        while index >= 0:
+            if alloc[index] > 0 and suffix_bound[index+1] > tail_sum:
+                break
+            tail_sum += alloc[index]
+            index -= 1
+        if index < 0:
+            return
+        alloc[index] -= 1
+        remaining = tail_sum+1
+        for fill in range(index+1, group_num):
+            alloc[fill] = min(bound[fill], remaining)
+            remaining -= alloc[fill]
+        yield tuple(alloc)
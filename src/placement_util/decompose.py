@@ -0,0 +1,203 @@
+"""
+* This file provides the building blocks of the per-chain decomposition.
+*
+* Chains only share the BESS cores of each server and the NIC bandwidth.
+* Each chain is therefore placed on its own, as a table of its best value
+* for the vectors of per-server cores where its throughput steps up. The
+* tables are then combined with a knapsack over the core budget. The NIC
+* bandwidth row is left to the caller, which prices it with Lagrangian
+* multipliers.
+"""
+
+import numpy as np
+
+
+def rate_curve(groups, max_core):
+    """ Compute the best throughput of a set of subgroups sharing the
+        cores of one server, for each number of cores. Each subgroup
+        needs one core; extra cores go one by one to the slowest
+        replicable subgroup, which maximizes the slowest rate.
+
+    Parameter:
+    groups: a list of (rate, replicable), |rate| being the throughput
+            of the subgroup with one core
+    max_core: the largest number of cores
+
+    Returns:
+    curve: a list of the throughput with 0..max_core cores, None
+           where there are fewer cores than subgroups; inf if
+           |groups| is empty
+    """
+    if len(groups) == 0:
+        return [float('inf')]*(max_core+1)
+    curve = [None]*(max_core+1)
+    if len(groups) > max_core:
+        return curve
+    cores = [1]*len(groups)
+    rates = [rate for rate, _ in groups]
+    curve[len(groups)] = min(rates)
+    for core in range(len(groups)+1, max_core+1):
+        slowest = min(range(len(groups)), key=lambda index: rates[index])
+        if groups[slowest][1]:
+            cores[slowest] += 1
+            rates[slowest] = groups[slowest][0]*cores[slowest]
+        curve[core] = min(rates)
+    return curve
+
+
+def split_cores(groups, core):
+    """ Give |core| cores to a set of subgroups, same allocation as
+        rate_curve()
+
+    Parameter:
+    groups: a list of (rate, replicable)
+    core: number of cores of the server, at least len(groups)
+
+    Returns:
+    cores: number of cores of each subgroup
+    """
+    cores = [1]*len(groups)
+    rates = [rate for rate, _ in groups]
+    for extra in range(core-len(groups)):
+        slowest = min(range(len(groups)), key=lambda index: rates[index])
+        if not groups[slowest][1]:
+            break
+        cores[slowest] += 1
+        rates[slowest] = groups[slowest][0]*cores[slowest]
+    return cores
+
+
+def core_steps(curves, rate_cap):
+    """ List the core vectors where the throughput of a plan steps up.
+        The throughput with a core vector is the slowest of the
+        per-server curves, capped. For each throughput level, only
+        the fewest cores reaching it on every server are kept; any
+        other vector is beaten by one of them with no more cores on
+        any server.
+
+    Parameter:
+    curves: the rate_curve() of the subgroups on each server
+    rate_cap: the highest throughput of the plan
+
+    Returns:
+    a dictionary of core tuple and throughput
+    """
+    levels = set([rate_cap])
+    for curve in curves:
+        for rate in curve:
+            if rate is not None and rate < rate_cap:
+                levels.add(rate)
+    steps = {}
+    for level in sorted(levels):
+        state = []
+        for curve in curves:
+            reach = [core for core in range(len(curve)) \
+                     if curve[core] is not None and curve[core] >= level]
+            if len(reach) == 0:
+                # curves never go down, no higher level is reached
+                return steps
+            state.append(reach[0])
+        rate = min([rate_cap]+[curve[core] \
+                               for curve, core in zip(curves, state)])
+        steps[tuple(state)] = rate
+    return steps
+
+
+def pareto_front(entries):
+    """ Drop the entries that another entry beats with no more cores
+        on any server. The entries are swept once, best value first;
+        an entry is beaten iff a kept entry uses no more cores on any
+        server. Kept entries are indexed per server by bitsets, bit j
+        of below[nic][core] telling whether kept entry j uses at most
+        |core| cores there, so each test is one AND per server.
+
+    Parameter:
+    entries: a list of (core tuple, value, ...)
+
+    Returns:
+    the remaining entries, by increasing number of cores
+    """
+    if len(entries) == 0:
+        return []
+    entries = sorted(entries, key=lambda entry: (-entry[1], sum(entry[0])))
+    top = [max([entry[0][nic] for entry in entries]) \
+           for nic in range(len(entries[0][0]))]
+    below = [[0]*(core+1) for core in top]
+    full = 0
+    front = []
+    for entry in entries:
+        beaten = full
+        for nic in range(len(top)):
+            beaten &= below[nic][entry[0][nic]]
+        if beaten:
+            continue
+        bit = 1<<len(front)
+        full |= bit
+        for nic in range(len(top)):
+            for core in range(entry[0][nic], top[nic]+1):
+                below[nic][core] |= bit
+        front.append(entry)
+    front.sort(key=lambda entry: (sum(entry[0]), -entry[1], entry[0]))
+    return front
+
+
+def knapsack_combine(tables, spare_core):
+    """ Combine per-chain tables under the per-server core budget.
+        A table gives the value of a chain for each core vector it
+        may use at most; cores may stay idle. Each table is added to
+        every kept state at once with numpy, the best value of each
+        resulting core vector is kept and the states beaten with no
+        more cores are dropped.
+
+    Parameter:
+    tables: a list of dictionaries of core tuple and (value, plan),
+            one per chain, value None for an infeasible entry
+    spare_core: number of spare cores of each server
+
+    Returns:
+    total: the best total value, None if no combination is feasible
+    picks: the (core tuple, plan) of each chain
+    """
+    budget = np.array(spare_core, dtype=np.int64)
+    # core vector -> integer, mixed radix of the budget
+    radix = np.cumprod(np.concatenate(([1], budget[:-1]+1)))
+    states = np.zeros((1, len(spare_core)), dtype=np.int64)
+    values = np.zeros(1)
+    history = []
+    for index in range(len(tables)):
+        entries = pareto_front([(cores, entry[0], entry[1]) \
+                                for cores, entry in tables[index].items() \
+                                if entry[0] is not None])
+        if len(entries) == 0:
+            return None, []
+        cores = np.array([entry[0] for entry in entries], dtype=np.int64)
+        gains = np.array([entry[1] for entry in entries], dtype=float)
+        sums = states[:, None, :]+cores[None, :, :]
+        used, picked = np.nonzero((sums <= budget).all(axis=2))
+        if len(used) == 0:
+            return None, []
+        sums = sums[used, picked]
+        candidate = values[used]+gains[picked]
+        key = sums.dot(radix)
+        # best value of each core vector, the first one on ties
+        order = np.lexsort((-candidate, key))
+        first = order[np.concatenate(([True], \
+                                      key[order][1:] != key[order][:-1]))]
+        # only the best state of the last table is needed
+        if index < len(tables)-1:
+            front = pareto_front([(tuple(sums[pos]), candidate[pos], pos) \
+                                  for pos in first])
+            first = np.array([entry[2] for entry in front])
+        history.append((used[first], picked[first], entries))
+        states = sums[first]
+        values = candidate[first]
+
+    final = int(np.argmax(values))
+    total = float(values[final])
+    picks = []
+    for used, picked, entries in reversed(history):
+        cores, _, plan = entries[picked[final]]
+        picks.append((cores, plan))
+        final = used[final]
+    picks.reverse()
+    return total, picks
@@ -0,0 +1,376 @@
+"""
+* This file provides an array-backed evaluation kernel for NF placement.
+*
+* The kernel is built once from the sorted NF module list. It keeps
+* weights, profiled cycles, nf_type masks, chain indexes and the DAG
+* adjacency (CSR) in NumPy arrays, so that placement routines can
+* evaluate a pattern with plain integer node ids instead of deep-copying
+* nf_node objects for each pattern and each core allocation.
+"""
+
+import numpy as np
+
+from placement_util.subgroup import partition_subgroups
+
+
+class EvalKernel(object):
+    """ Compact evaluation representation of all NF modules.
+
+    Node i in the kernel is module_list[i]. The module list must already
+    be sorted by (service_path_id, service_id) and tagged with chain
+    index and weight (see tag_chain_index() and tag_weight()).
+
+    Args:
+        module_list: all NF modules
+        bess_para: a dictionary of BESS module name and its profiled
+                   CPU cycles
+        bounce_time: the delay of one bounce between hardwares
+        row_cache: an optional RowCache of subgroup rows
+    """
+    def __init__(self, module_list, bess_para, bounce_time, row_cache=None):
+        self.node_num = len(module_list)
+        self.bounce_time = bounce_time
+        self.row_cache = row_cache
+        index_of = {}
+        for index in range(self.node_num):
+            index_of[id(module_list[index])] = index
+
+        self.nf_class = [str(module.nf_class) for module in module_list]
+        self.base_type = np.array([module.nf_type for module in module_list])
+        self.both_mask = (self.base_type == 2)
+        self.bess_mask = (self.base_type == 1)
+        self.chain_index = np.array([module.chain_index \
+                                     for module in module_list])
+        self.weight = np.array([module.weight for module in module_list], \
+                               dtype=float)
+        # keep the python scalars as well, head nodes carry an integer
+        # weight and the traffic computation relies on its division
+        self.weight_list = [module.weight for module in module_list]
+
+        cycle_list = []
+        for module in module_list:
+            if module.nf_type == 1 or module.nf_type == 2:
+                cycle_list.append(int(bess_para.get(str(module.nf_class))))
+            else:
+                cycle_list.append(0)
+        self.cycles = np.array(cycle_list, dtype=np.int64)
+        self.cycle_list = cycle_list
+
+        adj_ptr = [0]
+        adj_idx = []
+        prev_ptr = [0]
+        prev_idx = []
+        for module in module_list:
+            for adj_node in module.adj_nodes:
+                adj_idx.append(index_of[id(adj_node)])
+            adj_ptr.append(len(adj_idx))
+            for prev_node in module.prev_nodes:
+                if id(prev_node) in index_of:
+                    prev_idx.append(index_of[id(prev_node)])
+            prev_ptr.append(len(prev_idx))
+        self.adj_ptr = np.array(adj_ptr, dtype=np.int64)
+        self.adj_idx = np.array(adj_idx, dtype=np.int64)
+        self.prev_ptr = np.array(prev_ptr, dtype=np.int64)
+        self.prev_idx = np.array(prev_idx, dtype=np.int64)
+        self.out_degree = np.diff(self.adj_ptr)
+        self.in_degree = np.array([len(module.prev_nodes) \
+                                   for module in module_list])
+        self.adj_list = [adj_idx[adj_ptr[i]:adj_ptr[i+1]] \
+                         for i in range(self.node_num)]
+
+        self.tail_mask = (self.out_degree == 0)
+        self.root_mask = np.zeros(self.node_num, dtype=bool)
+        if self.node_num > 0:
+            self.root_mask[0] = True
+            self.root_mask[1:] = self.tail_mask[:-1]
+        self.dup_avoid_mask = np.array([module.is_dup_avoid() \
+                                        for module in module_list])
+        self.no_dup_mask = self.dup_avoid_mask | (self.out_degree > 1) \
+                           | (self.in_degree > 1)
+
+        self.cut_index = np.flatnonzero(self.tail_mask).tolist()
+        self.chain_slices = []
+        start = 0
+        for index in self.cut_index:
+            self.chain_slices.append(range(start, index+1))
+            start = index+1
+
+        self.core_num = [module.core_num for module in module_list]
+        self.nic_index = [module.nic_index for module in module_list]
+        self.core_index = [module.core_index for module in module_list]
+        self.time = [module.time for module in module_list]
+        return
+
+    def decode(self, pattern):
+        """ Decode a placement pattern into per-node nf_type
+            (1: BESS, 0: P4), same as notate_list()
+
+        Parameter:
+        pattern: the deployment decision
+
+        Returns:
+        types: a list of nf_type for each node
+        """
+        node_num = self.node_num
+        return [(pattern>>(node_num-i-1))&1 for i in range(node_num)]
+
+    def calc_delay(self, types):
+        """ Compute the largest delay observed till each node
+
+        Parameter:
+        types: nf_type of each node
+
+        Returns:
+        end_of_node_time: a list of calculated delays for all chains
+        """
+        node_time = list(self.time)
+        root_bool = True
+        for i in range(self.node_num):
+            if root_bool:
+                if types[i]:
+                    node_time[i] = self.bounce_time
+                else:
+                    node_time[i] = 0
+                root_bool = False
+            for adj in self.adj_list[i]:
+                mypass = node_time[i]
+                if types[i]:
+                    mypass += self.cycle_list[i]
+                if types[adj] != types[i]:
+                    mypass = mypass+self.bounce_time
+                node_time[adj] = max(node_time[adj], mypass)
+            if self.tail_mask[i]:
+                root_bool = True
+        return [node_time[i] for i in self.cut_index]
+
+    def decode_batch(self, patterns):
+        """ Decode a block of placement patterns at once
+
+        Parameter:
+        patterns: a sequence of deployment decisions
+
+        Returns:
+        types: an int array of shape (len(patterns), node_num)
+        """
+        node_num = self.node_num
+        if node_num < 63:
+            shifts = np.arange(node_num-1, -1, -1, dtype=np.int64)
+            patterns = np.asarray(patterns, dtype=np.int64).reshape(-1, 1)
+            return (patterns >> shifts[None, :]) & 1
+        # patterns do not fit in int64, decode them one by one
+        return np.array([self.decode(pattern) for pattern in patterns], \
+                        dtype=np.int64).reshape(-1, node_num)
+
+    def delay_filter(self, patterns, max_delay):
+        """ Compute the end-to-end delay of each chain for a block
+            of patterns, same model as calc_delay(), and check them
+            against the delay requirement
+
+        Parameter:
+        patterns: a sequence of deployment decisions
+        max_delay: max delay (in cycles) of each chain
+
+        Returns:
+        mask: True for each pattern meeting all delay requirements
+        delays: an int array of per-chain delays, shape
+                (len(patterns), number of chains)
+        """
+        types = self.decode_batch(patterns)
+        node_time = np.tile(np.array(self.time, dtype=np.int64), \
+                            (types.shape[0], 1))
+        for i in range(self.node_num):
+            if self.root_mask[i]:
+                node_time[:, i] = types[:, i]*self.bounce_time
+            if len(self.adj_list[i]) == 0:
+                continue
+            out_time = node_time[:, i]+types[:, i]*self.cycle_list[i]
+            for adj in self.adj_list[i]:
+                mypass = out_time+(types[:, adj] != types[:, i])*\
+                         self.bounce_time
+                node_time[:, adj] = np.maximum(node_time[:, adj], mypass)
+        delays = node_time[:, self.cut_index]
+        max_delay = np.asarray(max_delay, dtype=float)
+        mask = (delays[:, :len(max_delay)] <= max_delay[None, :]).all(axis=1)
+        return mask, delays
+
+    def ancestors(self, members):
+        """ Find out all nodes that can reach |members|
+
+        Parameter:
+        members: node ids
+
+        Returns:
+        a sorted list of node ids, including |members|
+        """
+        visited = set(members)
+        queue = list(members)
+        while len(queue)>0:
+            node = queue.pop()
+            for prev in self.prev_idx[self.prev_ptr[node]:self.prev_ptr[node+1]]:
+                if prev not in visited:
+                    visited.add(prev)
+                    queue.append(prev)
+        return sorted(visited)
+
+    def partition(self, types, members):
+        """ Find out BESS subgroups among |members|, see
+            subgroup.partition_subgroups()
+
+        Parameter:
+        types: nf_type of each node
+        members: node ids to be partitioned, in list order
+
+        Returns:
+        bess_list: lists of node ids of BESS subgroups
+        p4_list: node ids assigned to PISA switch
+        """
+        return partition_subgroups(types, self.adj_list, members)
+
+    def tag_core_index(self, subgroup, core_index):
+        """ Tag CPU core index to each node in a subgroup
+
+        Parameter:
+        subgroup: node ids of a subgroup
+        core_index: per-node core index, updated in place
+
+        Returns:
+        return_subgroup: the subgroup sorted by node id
+        """
+        default_value = 0
+        cp_subgroup = list(subgroup)
+        while len(cp_subgroup)>0:
+            queue_a = [cp_subgroup.pop(0)]
+            while len(queue_a)>0:
+                target = queue_a.pop(0)
+                for adj in self.adj_list[target]:
+                    if self.in_degree[adj] < 2 and adj in cp_subgroup:
+                        queue_a.append(adj)
+                if target in cp_subgroup:
+                    cp_subgroup.remove(target)
+                core_index[target] = default_value
+            default_value += 1
+        return sorted(subgroup)
+
+    def is_dup(self, subgroup):
+        """ Check if a subgroup is replicable
+
+        Parameter:
+        subgroup: node ids of a subgroup
+
+        Returns:
+        True if no module in the subgroup avoids replication
+        """
+        return not self.no_dup_mask[subgroup].any()
+
+    def is_path(self, members):
+        """ Check if |members| form a linear chain
+
+        Parameter:
+        members: node ids
+
+        Returns:
+        True if no member has more than one parent or child
+        """
+        return not (self.out_degree[members] > 1).any() and \
+               not (self.in_degree[members] > 1).any()
+
+    def subgroup_form(self, subgroup, core_num, core_index, err_rate):
+        """ Calculate outgoing traffic and bottleneck cycles of
+            a subgroup, see nf_placement.inequal_form(). Results are
+            cached in |row_cache| by node ids, core numbers, core
+            indexes and error rate; the profile is fixed per kernel.
+
+        Parameter:
+        subgroup: node ids of a subgroup
+        core_num: per-node number of cores
+        core_index: per-node core index
+        err_rate: artificial error added to profiled cycles
+
+        Returns:
+        chain_col: the chain (column) index of the subgroup
+        traffic: the traffic weight leaving the subgroup
+        bottleneck_cycle: cycles of the busiest core
+        """
+        subgroup = sorted(subgroup)
+        if self.row_cache is None:
+            return self.calc_subgroup_form(subgroup, core_num, core_index, \
+                                           err_rate)
+        key = (err_rate, tuple(subgroup), \
+               tuple([core_num[module] for module in subgroup]), \
+               tuple([core_index[module] for module in subgroup]))
+        row = self.row_cache.get(key)
+        if row is None:
+            row = self.calc_subgroup_form(subgroup, core_num, core_index, \
+                                          err_rate)
+            self.row_cache.put(key, row)
+        return row
+
+    def calc_subgroup_form(self, subgroup, core_num, core_index, err_rate):
+        # the uncached computation of subgroup_form()
+        right_index_dict = {}
+        member = set(subgroup)
+        traffic = 0
+        for module in subgroup:
+            if core_num[module] < 1:
+                raise ValueError("core assignment error at %s" % \
+                                 self.nf_class[module])
+            key = core_index[module]
+            if key not in right_index_dict:
+                right_index_dict[key] = 0
+            right_index_dict[key] += self.weight_list[module]*\
+                (self.cycle_list[module]*(1+err_rate))/float(core_num[module])
+        for module in subgroup:
+            child_num = 0
+            for adj in self.adj_list[module]:
+                if adj not in member:
+                    child_num += 1
+            if child_num > 0:
+                traffic += self.weight_list[module]*child_num/\
+                           (len(self.adj_list[module]))
+        return self.chain_index[subgroup[0]]-1, traffic, \
+               max(right_index_dict.values())
+
+    def lp_matrix(self, subgroups, core_num, core_index, total_chain_num, \
+                  nic_throughput, err_rate, cpu_freq, pkt_size, nic_of=None):
+        """ Assemble the throughput constraints A t <= b of a placement
+
+        Parameter:
+        subgroups: lists of node ids of BESS subgroups
+        core_num: per-node number of cores
+        core_index: per-node core index
+        total_chain_num: number of service chains
+        nic_throughput: the NIC throughput (bps), a list of the
+                        throughput of each NIC if |nic_of| is given
+        err_rate: artificial error added to profiled cycles
+        cpu_freq: CPU frequency of the BESS server, a list of the
+                  frequency of each server if |nic_of| is given
+        pkt_size: packet size in bits
+        nic_of: the NIC index of each subgroup, None if all subgroups
+                run behind a single NIC
+
+        Returns:
+        left_matrix: one row per subgroup plus the aggregated row
+                     of each NIC
+        right_matrix: throughput constraint of each row
+        """
+        if nic_of is None:
+            nic_of = [0]*len(subgroups)
+            nic_throughput = [nic_throughput]
+            cpu_freq = [cpu_freq]
+        group_num = len(subgroups)
+        nic_num = len(nic_throughput)
+        left_matrix = np.zeros((group_num+nic_num, total_chain_num))
+        right_matrix = np.zeros(group_num+nic_num)
+        for row in range(group_num):
+            chain_col, traffic, bottleneck = self.subgroup_form(\
+                subgroups[row], core_num, core_index, err_rate)
+            left_matrix[row, chain_col] = traffic
+            right_matrix[row] = cpu_freq[nic_of[row]]/float(bottleneck)*\
+                                pkt_size
+        if nic_num == 1:
+            left_matrix[-1] = left_matrix[:-1].sum(axis=0)
+        else:
+            for row in range(group_num):
+                left_matrix[group_num+nic_of[row]] += left_matrix[row]
+        right_matrix[group_num:] = nic_throughput
+        return left_matrix, right_matrix
@@ -0,0 +1,127 @@
+"""
+* This file provides an anytime simulated annealing driver.
+*
+* The driver only knows about states, scores and moves; the placement
+* specific parts (neighbour moves and the LP score) are given by the
+* caller, see nf_placement.anneal_calc_cycle(). The best state seen
+* so far (the incumbent) is kept at any time, so the search can stop
+* as soon as its wall-clock budget runs out.
+"""
+
+import math
+import random
+import time
+
+START_TEMPERATURE = 0.05
+END_TEMPERATURE = 0.0001
+RESTART_MOVES = 200
+KICK_MOVES = 3
+REPORT_INTERVAL = 1.0
+
+
+class Annealer(object):
+    """ Simulated annealing with a wall-clock budget.
+
+    The temperature is relative to the current score and cools down
+    geometrically from START_TEMPERATURE to END_TEMPERATURE over the
+    budget. A move to a state that scores |delta| lower is accepted
+    with probability exp(-|delta|/(temperature*|score|)). After
+    RESTART_MOVES moves without a new incumbent, the search restarts
+    from the incumbent kicked by up to KICK_MOVES random moves, which
+    lets it cross infeasible or worse intermediate states.
+
+    Args:
+        score: score(state), the larger the better, None for an
+               infeasible state
+        neighbor: neighbor(state, rand), a random state next to |state|
+        time_budget: wall-clock budget in seconds
+        seed: seed of the random moves
+        report: an optional report(annealer), called about every
+                REPORT_INTERVAL seconds and once at the end
+        improve: an optional improve(state, score), called for each
+                 new incumbent
+    """
+    def __init__(self, score, neighbor, time_budget, seed=0, report=None, \
+                 improve=None):
+        self.score = score
+        self.neighbor = neighbor
+        self.time_budget = time_budget
+        self.random = random.Random(seed)
+        self.report = report
+        self.improve = improve
+        self.moves = 0
+        self.accepted = 0
+        self.elapsed = 0
+        self.best = None
+        self.best_score = None
+        return
+
+    def accept(self, current_score, new_score, temperature):
+        # Metropolis criterion on the relative score change
+        if new_score is None:
+            return current_score is None
+        if current_score is None or new_score >= current_score:
+            return True
+        scale = temperature*max(abs(current_score), 1.0)
+        return self.random.random() < math.exp((new_score-current_score)/scale)
+
+    def offer(self, state, state_score):
+        # keep |state| if it is a new incumbent
+        if state_score is None:
+            return False
+        if self.best_score is not None and state_score <= self.best_score:
+            return False
+        self.best = state
+        self.best_score = state_score
+        if self.improve is not None:
+            self.improve(state, state_score)
+        return True
+
+    def run(self, initial):
+        """ Search from |initial| until the budget runs out
+
+        Parameter:
+        initial: the initial state
+
+        Returns:
+        best: the incumbent, None if no feasible state is found
+        best_score: the score of the incumbent
+        """
+        start = time.time()
+        next_report = REPORT_INTERVAL
+        current = initial
+        current_score = self.score(current)
+        self.offer(current, current_score)
+        stale = 0
+        while True:
+            self.elapsed = time.time()-start
+            if self.elapsed >= self.time_budget:
+                break
+            if self.report is not None and self.elapsed >= next_report:
+                self.report(self)
+                next_report += REPORT_INTERVAL
+            progress = self.elapsed/float(self.time_budget)
+            temperature = START_TEMPERATURE*\
+                (END_TEMPERATURE/START_TEMPERATURE)**progress
+
+            candidate = self.neighbor(current, self.random)
+            candidate_score = self.score(candidate)
+            self.moves += 1
+            if self.accept(current_score, candidate_score, temperature):
+                current = candidate
+                current_score = candidate_score
+                self.accepted += 1
+            if self.offer(candidate, candidate_score):
+                stale = 0
+            else:
+                stale += 1
+            if stale >= RESTART_MOVES and self.best is not None:
+                current = self.best
+                for kick in range(self.random.randint(1, KICK_MOVES)):
+                    current = self.neighbor(current, self.random)
+                current_score = self.score(current)
+                self.offer(current, current_score)
+                stale = 0
+        if self.report is not None:
+            self.report(self)
+        return self.best, self.best_score
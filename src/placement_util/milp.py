@@ -0,0 +1,181 @@
+"""
+* This file provides a solver-neutral mixed integer linear program.
+*
+* A MILP is collected as plain variables and rows first, so that its
+* formulation can be built (and checked against a given assignment)
+* without a solver licence. solve_gurobi() hands the model over to
+* Gurobi in one shot; the branch-and-bound search is left to the solver.
+"""
+
+try:
+    import gurobipy as gp
+except ImportError:
+    gp = None
+
+CONTINUOUS = 'C'
+INTEGER = 'I'
+BINARY = 'B'
+
+LESS_EQUAL = '<='
+EQUAL = '=='
+GREATER_EQUAL = '>='
+
+# absolute row violation accepted by violation(), same as Gurobi's
+# default FeasibilityTol
+FEAS_TOL = 1e-6
+# relative MIP gap at which Gurobi stops
+MIP_GAP = 1e-6
+
+
+class MILPModel(object):
+    """ A maximization MILP.
+
+    Variables are referred to by the index returned from add_var(),
+    a row is a list of (coefficient, variable index) pairs.
+
+    Args:
+        name: name of the model
+    """
+    def __init__(self, name="milp"):
+        self.name = name
+        self.var_name = []
+        self.var_type = []
+        self.lower = []
+        self.upper = []
+        self.objective = []
+        self.rows = []
+        return
+
+    def add_var(self, name, vtype=CONTINUOUS, lb=0.0, ub=None, obj=0.0):
+        """ Add a variable
+
+        Parameter:
+        name: name of the variable
+        vtype: CONTINUOUS, INTEGER or BINARY
+        lb: lower bound
+        ub: upper bound, None for no upper bound
+        obj: objective coefficient
+
+        Returns:
+        the variable index
+        """
+        if vtype == BINARY:
+            lb = max(lb, 0)
+            ub = 1 if ub is None else min(ub, 1)
+        self.var_name.append(name)
+        self.var_type.append(vtype)
+        self.lower.append(lb)
+        self.upper.append(ub)
+        if obj != 0:
+            self.objective.append((obj, len(self.var_name)-1))
+        return len(self.var_name)-1
+
+    def add_row(self, terms, sense, rhs, name=None):
+        """ Add a row sum(coefficient*variable) |sense| rhs
+
+        Parameter:
+        terms: a list of (coefficient, variable index)
+        sense: LESS_EQUAL, EQUAL or GREATER_EQUAL
+        rhs: right-hand side
+        name: name of the row
+
+        Returns:
+        the row index
+        """
+        if name is None:
+            name = "r_%d" % len(self.rows)
+        terms = [(coef, var) for coef, var in terms if coef != 0]
+        self.rows.append((terms, sense, rhs, name))
+        return len(self.rows)-1
+
+    def num_vars(self):
+        return len(self.var_name)
+
+    def num_rows(self):
+        return len(self.rows)
+
+    def objective_value(self, values):
+        return sum([coef*values[var] for coef, var in self.objective])
+
+    def violation(self, values):
+        """ Find the bounds, integrality and rows that an assignment
+            breaks
+
+        Parameter:
+        values: a value for each variable
+
+        Returns:
+        a list of names of the violated bounds and rows, empty if
+        |values| is feasible
+        """
+        broken = []
+        for var in range(self.num_vars()):
+            value = values[var]
+            if value < self.lower[var]-FEAS_TOL or \
+                    (self.upper[var] is not None and \
+                     value > self.upper[var]+FEAS_TOL):
+                broken.append(self.var_name[var])
+            elif self.var_type[var] != CONTINUOUS and \
+                    abs(value-round(value)) > FEAS_TOL:
+                broken.append(self.var_name[var])
+        for terms, sense, rhs, name in self.rows:
+            lhs = sum([coef*values[var] for coef, var in terms])
+            tol = FEAS_TOL*max(1.0, abs(rhs))
+            if (sense == LESS_EQUAL and lhs > rhs+tol) or \
+                    (sense == GREATER_EQUAL and lhs < rhs-tol) or \
+                    (sense == EQUAL and abs(lhs-rhs) > tol):
+                broken.append(name)
+        return broken
+
+
+def solve_gurobi(model, log=False):
+    """ Solve a MILPModel with Gurobi
+
+    Parameter:
+    model: the MILPModel
+    log: print the Gurobi log
+
+    Returns:
+    values: a value for each variable, None if the model is
+            infeasible
+    objective: the objective value, None if the model is infeasible
+    """
+    if gp is None:
+        raise RuntimeError("gurobipy is not installed")
+    try:
+        grb = gp.Model(model.name)
+    except gp.GurobiError as error:
+        raise RuntimeError("no usable Gurobi licence: %s" % error)
+    grb.setParam("OutputFlag", 1 if log else 0)
+    grb.setParam("MIPGap", MIP_GAP)
+    vtype_of = {CONTINUOUS: gp.GRB.CONTINUOUS, INTEGER: gp.GRB.INTEGER, \
+                BINARY: gp.GRB.BINARY}
+    grb_vars = []
+    for var in range(model.num_vars()):
+        upper = model.upper[var]
+        if upper is None:
+            upper = gp.GRB.INFINITY
+        grb_vars.append(grb.addVar(lb=model.lower[var], ub=upper, \
+                                   vtype=vtype_of[model.var_type[var]], \
+                                   name=model.var_name[var]))
+    grb.update()
+    grb.setObjective(gp.LinExpr([(coef, grb_vars[var]) \
+                                 for coef, var in model.objective]), \
+                     gp.GRB.MAXIMIZE)
+    for terms, sense, rhs, name in model.rows:
+        expr = gp.LinExpr([(coef, grb_vars[var]) for coef, var in terms])
+        if sense == LESS_EQUAL:
+            grb.addConstr(expr <= rhs, name=name)
+        elif sense == GREATER_EQUAL:
+            grb.addConstr(expr >= rhs, name=name)
+        else:
+            grb.addConstr(expr == rhs, name=name)
+    grb.optimize()
+    if grb.SolCount == 0:
+        if grb.status == gp.GRB.Status.INFEASIBLE or \
+                grb.status == gp.GRB.Status.INF_OR_UNBD:
+            return None, None
+        raise RuntimeError("Gurobi stopped without a solution, status %d" \
+                           % grb.status)
+    values = [var.X for var in grb_vars]
+    return values, model.objective_value(values)
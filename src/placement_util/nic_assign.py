@@ -0,0 +1,78 @@
+"""
+* This file provides the NIC assignment enumerator used by NF placement.
+*
+* Each BESS subgroup runs on the server behind one of the NICs listed in
+* device.txt. An assignment is a tuple whose i-th entry is the NIC index
+* of the i-th subgroup. NICs with the same resources (cores, reserved
+* cores, bandwidth and CPU frequency) are interchangeable, so only one
+* assignment of each class of interchangeable assignments is produced.
+"""
+
+
+def nic_classes(nic_spec):
+    """ Group interchangeable NICs
+
+    Parameter:
+    nic_spec: a list of hashable resource descriptions, one per NIC
+
+    Returns:
+    nic_class: the class id of each NIC, NICs with equal descriptions
+               share a class
+    """
+    class_of = {}
+    nic_class = []
+    for spec in nic_spec:
+        if spec not in class_of:
+            class_of[spec] = len(class_of)
+        nic_class.append(class_of[spec])
+    return nic_class
+
+
+def iter_nic_assign(group_num, nic_class):
+    """ Enumerate the assignments of |group_num| subgroups to NICs.
+        Within a class, a subgroup may only go to a NIC already in
+        use or to the first unused one, so that assignments which
+        only differ by swapping interchangeable NICs come out once.
+        Assignments are produced in lexicographic order, the first
+        one puts every subgroup on NIC 0.
+
+    Parameter:
+    group_num: number of subgroups
+    nic_class: the class id of each NIC, see nic_classes()
+
+    Returns:
+    a generator of NIC index tuples
+    """
+    nic_num = len(nic_class)
+    if nic_num == 1:
+        yield (0,)*group_num
+        return
+    members = {}
+    rank = []
+    for nic in range(nic_num):
+        members.setdefault(nic_class[nic], []).append(nic)
+        rank.append(len(members[nic_class[nic]])-1)
+
+    assign = []
+    used = dict([(class_id, 0) for class_id in members])
+
+    def extend():
+        if len(assign) == group_num:
+            yield tuple(assign)
+            return
+        for nic in range(nic_num):
+            class_id = nic_class[nic]
+            if rank[nic] > used[class_id]:
+                continue
+            fresh = (rank[nic] == used[class_id])
+            if fresh:
+                used[class_id] += 1
+            assign.append(nic)
+            for result in extend():
+                yield result
+            assign.pop()
+            if fresh:
+                used[class_id] -= 1
+
+    for result in extend():
+        yield result
@@ -0,0 +1,461 @@
+"""
+* This file provides a binary, memory-mapped store of evaluated placement
+* patterns.
+*
+* The store replaces the tab-separated 'pattern.txt'. It is one file made
+* of four sections:
+*   header:  magic, version, section offsets and the adopted record
+*   records: fixed-width records sorted by estimated throughput (best
+*            first), each holding the pattern, throughput, total delay,
+*            flags and the offset of its data in the blob
+*   firsts:  ids of the records where a pattern first shows up, i.e. the
+*            best core allocation of each distinct pattern, in record order
+*   blob:    data of each record in 8-byte words: core allocation as int16
+*            (nic index, number of cores) pairs, per-chain delays and
+*            per-chain throughput as float64, then the pattern words if
+*            the pattern does not fit in int64
+* All sections are opened with numpy.memmap. Picking the best, the top-K
+* or the next not-yet-tried pattern only touches the records involved,
+* and marking a pattern as tried updates a few bytes in place.
+*
+* A sharded run writes the results of each shard to its own store, see
+* SHARD_STORE_FILE; they are read back with PatternStore.row() and
+* merged into the final store.
+"""
+
+import os
+import re
+import sys
+from array import array
+from itertools import chain
+
+import numpy as np
+
+PATTERN_STORE_FILE = 'pattern.bin'
+# store of shard i of n
+SHARD_STORE_FILE = 'pattern.shard-%d-of-%d.bin'
+SHARD_STORE_RE = re.compile(r'^pattern\.shard-(\d+)-of-(\d+)\.bin$')
+STORE_MAGIC = 'LEMURPAT'
+STORE_VERSION = 1
+
+# record flags
+ADOPTED = 1
+TRIED = 2
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<i8'), \
+                         ('count', '<i8'), ('first_count', '<i8'), \
+                         ('record_offset', '<i8'), ('first_offset', '<i8'), \
+                         ('blob_offset', '<i8'), ('cursor', '<i8')])
+RECORD_DTYPE = np.dtype([('pattern', '<i8'), ('throughput', '<f8'), \
+                         ('delay', '<f8'), ('offset', '<i8'), \
+                         ('alloc_len', '<i4'), ('delay_len', '<i2'), \
+                         ('rate_len', '<i2'), ('pattern_len', '<i2'), \
+                         ('flags', 'u1'), ('pad', 'V5')])
+
+INT64_MAX = (1<<63)-1
+# blob pieces buffered per file write
+WRITE_CHUNK_SIZE = 1<<14
+
+
+def split_row(row):
+    """ Split a placement result into its columns. Results are
+        [pattern, core_alloc, throughput],
+        [pattern, core_alloc, per-chain throughput, throughput] or
+        [pattern, core_alloc, per-chain delay, delay,
+         per-chain throughput, throughput].
+
+    Parameter:
+    row: a placement result
+
+    Returns:
+    delays: per-chain delays, empty if not recorded
+    delay: the total delay, NaN if not recorded
+    rates: per-chain throughput, empty if not recorded
+    """
+    delays = []
+    delay = float('nan')
+    rates = []
+    if len(row) == 6:
+        delays = row[2]
+        delay = row[3]
+        rates = row[4]
+    elif len(row) == 4:
+        rates = row[2]
+    return delays, delay, rates
+
+
+def pattern_words(pattern):
+    """ Split a pattern into little-endian 64-bit words
+
+    Parameter:
+    pattern: the deployment decision, a non-negative integer
+
+    Returns:
+    a list of words
+    """
+    words = []
+    while True:
+        words.append(pattern & ((1<<64)-1))
+        pattern >>= 64
+        if pattern == 0:
+            break
+    return words
+
+
+def find_shard_stores(directory='.'):
+    """ List the shard stores in a directory
+
+    Parameter:
+    directory: the directory to look in
+
+    Returns:
+    a dictionary of shard count to a dictionary of shard index to
+    store path
+    """
+    shards = {}
+    for name in sorted(os.listdir(directory)):
+        match = SHARD_STORE_RE.match(name)
+        if match is None:
+            continue
+        index, count = int(match.group(1)), int(match.group(2))
+        shards.setdefault(count, {})[index] = os.path.join(directory, name)
+    return shards
+
+
+def le_bytes(values):
+    # get the little-endian bytes of an array.array
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tostring()
+
+
+def alloc_words(alloc_len):
+    # blob words taken by |alloc_len| int16 pairs
+    return (alloc_len+1)//2
+
+
+def write_pattern_store(path, rows):
+    """ Sort placement results by throughput and write them to a
+        pattern store. The best record is marked as adopted.
+
+    Parameter:
+    path: the store file
+    rows: placement results, the last column of each is its
+          estimated throughput
+
+    Returns:
+    order: the index into |rows| of each record, best first
+    """
+    count = len(rows)
+    throughput = np.array([row[-1] for row in rows], dtype=float)
+    # stable, equal throughput keeps the evaluation order
+    order = np.argsort(-throughput, kind='mergesort')
+
+    columns = {'pattern': [], 'delay': [], 'offset': [], 'alloc_len': [], \
+               'delay_len': [], 'rate_len': [], 'pattern_len': []}
+    firsts = []
+    seen = set()
+    tmp_path = path+'.tmp'
+    # the record sections are only known after the scan, write the
+    # blob to its own file first
+    blob_fp = open(tmp_path+'.blob', 'w+b')
+    blob_len = 0
+    chunk = []
+    for index, row_index in enumerate(order.tolist()):
+        row = rows[row_index]
+        pattern = row[0]
+        delays, delay, rates = split_row(row)
+        alloc = array('h', map(int, chain.from_iterable(row[1])))
+        if len(row[1])%2 == 1:
+            alloc.extend((0, 0))
+        values = array('d', delays)
+        values.extend(rates)
+        chunk.append(le_bytes(alloc))
+        chunk.append(le_bytes(values))
+        columns['offset'].append(blob_len)
+        columns['delay'].append(delay)
+        columns['alloc_len'].append(len(row[1]))
+        columns['delay_len'].append(len(delays))
+        columns['rate_len'].append(len(rates))
+        blob_len += alloc_words(len(row[1]))+len(values)
+        if pattern <= INT64_MAX:
+            columns['pattern'].append(pattern)
+            columns['pattern_len'].append(0)
+        else:
+            words = np.array(pattern_words(pattern), dtype='<u8')
+            chunk.append(words.tobytes())
+            columns['pattern'].append(-1)
+            columns['pattern_len'].append(len(words))
+            blob_len += len(words)
+        if len(chunk) >= WRITE_CHUNK_SIZE:
+            blob_fp.write(''.join(chunk))
+            chunk = []
+        if pattern not in seen:
+            seen.add(pattern)
+            firsts.append(index)
+    blob_fp.write(''.join(chunk))
+
+    records = np.zeros(count, dtype=RECORD_DTYPE)
+    for field in columns:
+        records[field] = columns[field]
+    records['throughput'] = throughput[order]
+    firsts = np.array(firsts, dtype='<i8')
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = STORE_MAGIC
+    header['version'] = STORE_VERSION
+    header['count'] = count
+    header['first_count'] = len(firsts)
+    header['record_offset'] = HEADER_DTYPE.itemsize
+    header['first_offset'] = HEADER_DTYPE.itemsize+records.nbytes
+    header['blob_offset'] = header['first_offset']+firsts.nbytes
+    header['cursor'] = -1
+    if count > 0:
+        header['cursor'] = 0
+        records['flags'][0] = ADOPTED | TRIED
+
+    store_fp = open(tmp_path, 'wb')
+    store_fp.write(header.tobytes())
+    store_fp.write(records.tobytes())
+    store_fp.write(firsts.tobytes())
+    blob_fp.seek(0)
+    while True:
+        data = blob_fp.read(1<<20)
+        if len(data) == 0:
+            break
+        store_fp.write(data)
+    store_fp.close()
+    blob_fp.close()
+    os.remove(tmp_path+'.blob')
+    os.rename(tmp_path, path)
+    return order
+
+
+class PatternStore(object):
+    """ A memory-mapped pattern store written by write_pattern_store().
+
+    Args:
+        path: the store file
+        mode: 'r' to read, 'r+' to also mark patterns as tried
+    """
+    def __init__(self, path=PATTERN_STORE_FILE, mode='r'):
+        self.header = np.memmap(path, dtype=HEADER_DTYPE, mode=mode, \
+                                shape=(1,))
+        if self.header['magic'][0] != STORE_MAGIC or \
+           self.header['version'][0] != STORE_VERSION:
+            raise ValueError("%s is not a pattern store" % path)
+        self.records = self.section(path, mode, RECORD_DTYPE, \
+                                    'record_offset', 'count')
+        self.firsts = self.section(path, mode, np.dtype('<i8'), \
+                                   'first_offset', 'first_count')
+        blob_offset = int(self.header['blob_offset'][0])
+        if os.path.getsize(path) > blob_offset:
+            self.blob = np.memmap(path, dtype='<f8', mode=mode, \
+                                  offset=blob_offset)
+        else:
+            self.blob = np.zeros(0, dtype='<f8')
+        return
+
+    def section(self, path, mode, dtype, offset_field, count_field):
+        # map one fixed-width section of the store
+        count = int(self.header[count_field][0])
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode=mode, \
+                         offset=int(self.header[offset_field][0]), \
+                         shape=(count,))
+
+    def __len__(self):
+        return len(self.records)
+
+    def pattern(self, index):
+        """ Get the pattern of a record
+
+        Parameter:
+        index: the record id
+
+        Returns:
+        the deployment decision
+        """
+        record = self.records[index]
+        if record['pattern'] >= 0:
+            return int(record['pattern'])
+        start = int(record['offset'])+alloc_words(int(record['alloc_len']))+\
+                int(record['delay_len'])+int(record['rate_len'])
+        words = self.blob[start:start+int(record['pattern_len'])].view('<u8')
+        pattern = 0
+        for word in reversed(words.tolist()):
+            pattern = (pattern<<64) | int(word)
+        return pattern
+
+    def core_alloc(self, index):
+        """ Get the core allocation of a record
+
+        Parameter:
+        index: the record id
+
+        Returns:
+        a list of [nic index, number of cores] of each module
+        """
+        record = self.records[index]
+        start = int(record['offset'])
+        alloc_len = int(record['alloc_len'])
+        pairs = self.blob[start:start+alloc_words(alloc_len)].view('<i2')
+        pairs = pairs[:2*alloc_len].tolist()
+        return [pairs[pos:pos+2] for pos in range(0, len(pairs), 2)]
+
+    def chain_detail(self, index):
+        """ Get the per-chain delays and throughput of a record
+
+        Parameter:
+        index: the record id
+
+        Returns:
+        delays: per-chain delays, empty if not recorded
+        rates: per-chain throughput, empty if not recorded
+        """
+        record = self.records[index]
+        start = int(record['offset'])+alloc_words(int(record['alloc_len']))
+        delay_end = start+int(record['delay_len'])
+        delays = self.blob[start:delay_end].tolist()
+        rates = self.blob[delay_end:delay_end+int(record['rate_len'])].tolist()
+        return delays, rates
+
+    def row(self, index):
+        """ Get a record back as a placement result, in the format
+            of split_row()
+
+        Parameter:
+        index: the record id
+
+        Returns:
+        the placement result
+        """
+        record = self.records[index]
+        pattern = self.pattern(index)
+        alloc = self.core_alloc(index)
+        delays, rates = self.chain_detail(index)
+        throughput = float(record['throughput'])
+        if len(delays) > 0:
+            return [pattern, alloc, delays, float(record['delay']), \
+                    tuple(rates), throughput]
+        if len(rates) > 0:
+            return [pattern, alloc, tuple(rates), throughput]
+        return [pattern, alloc, throughput]
+
+    def best(self):
+        """ Get the record id of the best pattern
+
+        Returns:
+        the record id, None if the store is empty
+        """
+        if len(self.records) == 0:
+            return None
+        return 0
+
+    def top(self, k, distinct=False):
+        """ Get the record ids of the K best results
+
+        Parameter:
+        k: number of results
+        distinct: only keep the best core allocation of each pattern
+
+        Returns:
+        a list of record ids, best first
+        """
+        if distinct:
+            return self.firsts[:k].tolist()
+        return range(min(k, len(self.records)))
+
+    def adopted(self):
+        """ Get the record id of the pattern deployed at the moment
+
+        Returns:
+        the record id, None if no pattern is adopted
+        """
+        cursor = int(self.header['cursor'][0])
+        if cursor < 0:
+            return None
+        return cursor
+
+    def next_untried(self):
+        """ Find the best pattern that is not tried yet, ranked after
+            the adopted one
+
+        Returns:
+        the record id, None if all patterns are tried
+        """
+        cursor = self.adopted()
+        if cursor is None:
+            return None
+        pos = np.searchsorted(self.firsts, cursor, side='right')
+        while pos < len(self.firsts):
+            if not self.records['flags'][self.firsts[pos]] & TRIED:
+                return int(self.firsts[pos])
+            pos += 1
+        return None
+
+    def adopt(self, index):
+        """ Mark the adopted pattern as tried and adopt another one,
+            the store must be opened with mode 'r+'
+
+        Parameter:
+        index: the record id to adopt, None to stop adopting
+        """
+        cursor = self.adopted()
+        if cursor is not None:
+            self.records['flags'][cursor] &= ~ADOPTED
+        if index is None:
+            self.header['cursor'] = -1
+        else:
+            self.records['flags'][index] |= ADOPTED | TRIED
+            self.header['cursor'] = index
+        self.flush()
+        return
+
+    def flush(self):
+        for section in (self.header, self.records):
+            if isinstance(section, np.memmap):
+                section.flush()
+        return
+
+    def write_text(self, text_fp):
+        """ Write the store out in the tab-separated 'pattern.txt'
+            format for inspection
+
+        Parameter:
+        text_fp: an open text file, e.g. sys.stdout
+
+        Output format:
+        pattern adopt_bit executed_bit core_allocation [chain_delays
+        total_delay] [chain_throughput] total_throughput
+        """
+        tried = set()
+        for index in self.firsts:
+            if self.records['flags'][index] & TRIED:
+                tried.add(self.pattern(index))
+        cursor = self.adopted()
+        for index in range(len(self.records)):
+            record = self.records[index]
+            pattern = self.pattern(index)
+            delays, rates = self.chain_detail(index)
+            recorded_data = [pattern, int(index == cursor), \
+                             int(pattern in tried), self.core_alloc(index)]
+            if len(delays) > 0:
+                recorded_data.extend([delays, float(record['delay'])])
+            if len(rates) > 0:
+                recorded_data.append(tuple(rates))
+            recorded_data.append(float(record['throughput']))
+            for item in recorded_data:
+                text_fp.write(str(item))
+                text_fp.write('\t')
+            text_fp.write('\n')
+        return
+
+
+if __name__ == "__main__":
+    # dump a store for inspection, e.g.
+    # python placement_util/pattern_store.py pattern.bin > pattern.txt
+    if len(sys.argv) != 2:
+        print >> sys.stderr, "usage: %s STORE" % sys.argv[0]
+        sys.exit(1)
+    PatternStore(sys.argv[1]).write_text(sys.stdout)
@@ -0,0 +1,110 @@
+"""
+* This file provides the progress tracker of an exhaustive placement
+* search.
+*
+* The placement routines count each placement once it is evaluated.
+* The tracker reports the speed, the fraction of the search space that
+* is done and the best marginal rate so far, and tells the routine to
+* stop once its wall-clock deadline is hit. The placements evaluated
+* by then are kept, so the best one found so far can still be used.
+"""
+
+import time
+
+REPORT_INTERVAL = 1.0
+
+
+class Progress(object):
+    """ Progress of a placement enumeration with an optional deadline.
+
+    Args:
+        fraction: fraction(pattern), the fraction of the search space
+                  enumerated up to and including |pattern|, None if
+                  done() is not used
+        deadline: wall-clock deadline in seconds from now, None for
+                  no deadline
+        report: an optional report(progress), called about every
+                REPORT_INTERVAL seconds and once at the end
+    """
+    def __init__(self, fraction, deadline=None, report=None):
+        self.fraction = fraction
+        self.deadline = deadline
+        self.report = report
+        self.start = time.time()
+        self.next_report = REPORT_INTERVAL
+        self.patterns = 0
+        self.last = None
+        self.best = None
+        self.elapsed = 0
+        self.expired = False
+        self.finished = False
+        return
+
+    def update(self, pattern, best=None, count=1):
+        """ Count evaluated placements
+
+        Parameter:
+        pattern: the last evaluated placement
+        best: the best marginal rate so far, None if unknown
+        count: number of placements evaluated since the last update
+
+        Returns:
+        False once the deadline is hit, True otherwise
+        """
+        self.patterns += count
+        if count > 0:
+            self.last = pattern
+        if best is not None:
+            self.best = best
+        self.elapsed = time.time()-self.start
+        if self.report is not None and self.elapsed >= self.next_report:
+            self.report(self)
+            while self.next_report <= self.elapsed:
+                self.next_report += REPORT_INTERVAL
+        if self.deadline is not None and self.elapsed >= self.deadline:
+            self.expired = True
+        return not self.expired
+
+    def track(self, items, best=None, pattern_of=None):
+        """ Pass items through and count each one once the caller
+            asks for the next one, i.e. once it is evaluated. Stops
+            at the deadline.
+
+        Parameter:
+        items: placements, or tuples holding them
+        best: an optional best() giving the best marginal rate so far
+        pattern_of: gets the placement of an item, None if the items
+                    are placements
+
+        Returns:
+        a generator of the items
+        """
+        for item in items:
+            yield item
+            pattern = item
+            if pattern_of is not None:
+                pattern = pattern_of(item)
+            if not self.update(pattern, None if best is None else best()):
+                return
+
+    def rate(self):
+        """ Placements evaluated per second """
+        if self.elapsed <= 0:
+            return 0.0
+        return self.patterns/float(self.elapsed)
+
+    def done(self):
+        """ Fraction of the search space that is done """
+        if self.finished and not self.expired:
+            return 1.0
+        if self.last is None:
+            return 0.0
+        return self.fraction(self.last)
+
+    def finish(self):
+        """ Stop the clock and report once more """
+        self.elapsed = time.time()-self.start
+        self.finished = True
+        if self.report is not None:
+            self.report(self)
+        return
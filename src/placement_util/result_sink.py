@@ -0,0 +1,145 @@
+"""
+* This file provides a streaming sink for evaluated placements.
+*
+* Placement routines push every feasible (pattern, core allocation)
+* result into a ResultSink instead of collecting them in a list. The
+* sink keeps either all results or only the K best ones in a heap, so
+* that memory stays bounded whatever the size of the search space.
+* Results that are not kept can be sampled (reservoir sampling) to
+* report a histogram of their throughput.
+"""
+
+import heapq
+import random
+from operator import itemgetter
+
+import numpy as np
+
+
+class ResultSink(object):
+    """ Collector of placement results with a retention policy.
+
+    Args:
+        top_k: number of results to keep, None to keep all of them
+        sample_size: number of dropped results sampled for the
+                     histogram, 0 to disable sampling
+        key: the ranking key of a result, the larger the better;
+             defaults to the last column (estimated throughput)
+        value: the sampled value of a result, also reported for the
+               best result, defaults to the last column
+        seed: seed of the sampling
+    """
+    def __init__(self, top_k=None, sample_size=0, key=itemgetter(-1), \
+                 value=itemgetter(-1), seed=0):
+        self.top_k = top_k
+        self.sample_size = sample_size
+        self.key = key
+        self.value = value
+        self.random = random.Random(seed)
+        # kept results, a list of rows without limit, otherwise
+        # a min-heap of (key, -sequence, row)
+        self.kept = []
+        self.count = 0
+        self.dropped = 0
+        self.sample = []
+        # best result pushed so far, kept or not
+        self.best = None
+        self.best_key = None
+        return
+
+    def __len__(self):
+        return len(self.kept)
+
+    def push(self, row):
+        """ Add a placement result
+
+        Parameter:
+        row: a placement result
+        """
+        self.count += 1
+        key = self.key(row)
+        # on equal keys the earlier result ranks first, same as a
+        # stable sort of all results
+        if self.best is None or key > self.best_key:
+            self.best = row
+            self.best_key = key
+        if self.top_k is None:
+            self.kept.append(row)
+            return
+        entry = (key, -self.count, row)
+        if len(self.kept) < self.top_k:
+            heapq.heappush(self.kept, entry)
+            return
+        if len(self.kept) > 0 and entry > self.kept[0]:
+            entry = heapq.heapreplace(self.kept, entry)
+        self.drop(entry[2])
+        return
+
+    def extend(self, rows):
+        """ Add placement results in order
+
+        Parameter:
+        rows: placement results
+        """
+        for row in rows:
+            self.push(row)
+        return
+
+    def drop(self, row):
+        # sample a result which is not kept
+        self.dropped += 1
+        if self.sample_size <= 0:
+            return
+        if len(self.sample) < self.sample_size:
+            self.sample.append(self.value(row))
+            return
+        slot = self.random.randint(0, self.dropped-1)
+        if slot < self.sample_size:
+            self.sample[slot] = self.value(row)
+        return
+
+    def best_value(self):
+        """ Get the value of the best result pushed so far
+
+        Returns:
+        the value, None if no result is pushed
+        """
+        if self.best is None:
+            return None
+        return self.value(self.best)
+
+    def rows(self):
+        """ Get the kept results in the order they were pushed
+
+        Returns:
+        a list of placement results
+        """
+        if self.top_k is None:
+            return list(self.kept)
+        return [entry[2] for entry in sorted(self.kept, \
+                                             key=lambda entry: -entry[1])]
+
+    def histogram(self, bins=10):
+        """ Get a histogram of the sampled values of dropped results
+
+        Parameter:
+        bins: number of bins
+
+        Returns:
+        counts: estimated number of dropped results in each bin
+        edges: bin edges
+        """
+        if len(self.sample) == 0:
+            return [], []
+        counts, edges = np.histogram(self.sample, bins)
+        scale = float(self.dropped)/len(self.sample)
+        return [int(round(count*scale)) for count in counts], edges.tolist()
+
+    def stats(self):
+        """ Report the sink usage
+
+        Returns:
+        a dictionary of pushed, kept, dropped and sampled results
+        """
+        return {"pushed": self.count, "kept": len(self.kept), \
+                "dropped": self.dropped, "sampled": len(self.sample)}
@@ -0,0 +1,94 @@
+"""
+* This file provides a bounded LRU cache for subgroup constraint rows.
+*
+* The same subgroup (same modules, core numbers and core indexes) is
+* evaluated again and again across patterns, core allocations and the
+* heuristic's offload checks. The cache keeps the computed rows so that
+* each distinct subgroup is only evaluated once per profile and error
+* rate.
+"""
+
+from collections import OrderedDict
+
+
+class RowCache(object):
+    """ Bounded LRU cache with hit/miss counters.
+
+    Args:
+        max_size: max number of cached entries
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self.profile = None
+        self.profile_copy = None
+        return
+
+    def get(self, key):
+        """ Look up a cached entry and mark it as recently used
+
+        Parameter:
+        key: the subgroup signature
+
+        Returns:
+        the cached entry, None on a miss
+        """
+        value = self.entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """ Cache an entry, evicting the least recently used one
+            if the cache is full
+
+        Parameter:
+        key: the subgroup signature
+        value: the computed entry
+        """
+        if key in self.entries:
+            self.entries.pop(key)
+        elif len(self.entries) >= self.max_size:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
+        return
+
+    def profile_version(self, profile):
+        """ Get a version number of the profiled CPU cycles. The
+            number changes whenever |profile| holds different
+            content than the previous profile.
+
+        Parameter:
+        profile: a dictionary of BESS module name and its profiled
+                 CPU cycles, which is not modified in place
+
+        Returns:
+        version: the profile version
+        """
+        if profile is not self.profile:
+            if profile != self.profile_copy:
+                self.version += 1
+                self.profile_copy = dict(profile)
+            self.profile = profile
+        return self.version
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def stats(self):
+        """ Report the cache usage
+
+        Returns:
+        a dictionary of hits, misses and size
+        """
+        return {"hits": self.hits, "misses": self.misses, \
+                "size": len(self.entries)}
@@ -0,0 +1,129 @@
+"""
+* This file provides the perturbations of a profile sensitivity sweep.
+*
+* A sweep places the same NF chains again and again under perturbed
+* inputs and reports whether the chosen placement stays the same. A
+* perturbation either adds a global error rate to every profiled CPU
+* cycle (see nf_placement.err_add) or replaces the profile with one whose
+* per-module cycles are drawn around the profiled ones.
+"""
+
+import random
+from collections import namedtuple
+
+SAME = "SAME"
+DIFFERENT = "Different"
+INVALID = "INVALID"
+
+
+class Perturbation(namedtuple('Perturbation', \
+        ['label', 'error_rate', 'bess_para'])):
+    """ One input of a sensitivity sweep.
+
+    Args:
+        label: a printable name of the perturbation
+        error_rate: the global error rate added to every profiled
+                    CPU cycle
+        bess_para: the perturbed profile, None to keep the profile
+                   of the run
+    """
+    __slots__ = ()
+
+    def apply(self, context):
+        """ Get the context of the run under this perturbation
+
+        Parameter:
+        context: the PlacementContext of the unperturbed run
+
+        Returns:
+        a PlacementContext
+        """
+        if self.bess_para is None:
+            return context
+        return context.with_profile(self.bess_para)
+
+
+def error_rate_perturbations(max_percent, step=1):
+    """ Get global error rates from -max_percent% to +max_percent%
+
+    Parameter:
+    max_percent: the largest error in percent
+    step: distance between two error rates in percent
+
+    Returns:
+    a list of Perturbation
+    """
+    perturbations = []
+    for percent in range(-max_percent, max_percent+1, step):
+        perturbations.append(Perturbation("error %+d%%" % percent, \
+                                          percent/100.0, None))
+    return perturbations
+
+
+def profile_perturbations(bess_para, samples, sigma, seed=0):
+    """ Draw perturbed profiles. The cycles of each module are scaled
+        by an independent factor 1+e, e following a normal
+        distribution N(0, sigma) cut at +/-3 sigma.
+
+    Parameter:
+    bess_para: a dictionary of BESS module name and its profiled
+               CPU cycles
+    samples: number of perturbed profiles
+    sigma: standard deviation of the relative error
+    seed: seed of the sampling
+
+    Returns:
+    a list of Perturbation
+    """
+    rand = random.Random(seed)
+    names = sorted(bess_para)
+    perturbations = []
+    for index in range(samples):
+        profile = dict(bess_para)
+        for name in names:
+            cycles = bess_para[name]
+            if not isinstance(cycles, int):
+                continue
+            error = max(-3*sigma, min(3*sigma, rand.gauss(0, sigma)))
+            profile[name] = max(1, int(round(cycles*(1+error))))
+        perturbations.append(Perturbation("profile #%d" % index, 0, \
+                                          profile))
+    return perturbations
+
+
+def compare_placement(base_info, info):
+    """ Classify a placement against the unperturbed one
+
+    Parameter:
+    base_info: per-module placement info of the unperturbed run
+    info: per-module placement info of the perturbed run, an empty
+          list if no placement is found
+
+    Returns:
+    status: SAME, DIFFERENT or INVALID
+    changed: number of modules placed differently
+    """
+    if len(info) == 0:
+        return INVALID, len(base_info)
+    changed = 0
+    for base, current in zip(base_info, info):
+        if base != current:
+            changed += 1
+    if changed == 0:
+        return SAME, 0
+    return DIFFERENT, changed
+
+
+def stability_summary(report):
+    """ Count the outcomes of a sweep
+
+    Parameter:
+    report: a list of (perturbation, status, changed, throughput)
+
+    Returns:
+    a dictionary of status and its count
+    """
+    summary = {SAME: 0, DIFFERENT: 0, INVALID: 0}
+    for _, status, _, _ in report:
+        summary[status] += 1
+    return summary
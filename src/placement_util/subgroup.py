@@ -0,0 +1,113 @@
+"""
+* This file provides the BESS subgroup partitioner used by NF placement.
+*
+* A BESS subgroup is a set of BESS modules connected by edges between
+* BESS modules, i.e. packets stay on the BESS server while traversing
+* it. Subgroups are the weakly connected components of the BESS-only
+* subgraph, found with a union-find over integer node ids. The input
+* is never modified.
+"""
+
+
+def find_root(parent, node):
+    """ Find the representative of |node| with path halving
+
+    Parameter:
+    parent: a dictionary of node id and its parent node id
+    node: a node id
+
+    Returns:
+    the representative node id
+    """
+    while parent[node] != node:
+        parent[node] = parent[parent[node]]
+        node = parent[node]
+    return node
+
+
+def partition_subgroups(bess_mask, adj_list, members, start_mask=None):
+    """ Find out BESS subgroups among |members|. A subgroup holds the
+        BESS nodes reachable from a starting member through BESS nodes
+        only, subgroups sharing a node are merged.
+
+    Parameter:
+    bess_mask: True for each node id running on BESS
+    adj_list: children node ids of each node id
+    members: node ids to be partitioned, in list order
+    start_mask: True for each node id that starts a subgroup, defaults
+                to |bess_mask|. Nodes that may run on both hardwares
+                only join a subgroup reached from a BESS parent.
+
+    Returns:
+    bess_list: lists of node ids of BESS subgroups, each sorted by
+               node id, ordered by their smallest node id
+    p4_list: node ids of |members| outside any subgroup, in list order
+    """
+    if start_mask is None:
+        start_mask = bess_mask
+    parent = {}
+    for node in members:
+        if not start_mask[node] or node in parent:
+            continue
+        parent[node] = node
+        stack = [node]
+        while len(stack)>0:
+            current = stack.pop()
+            for adj in adj_list[current]:
+                if not bess_mask[adj]:
+                    continue
+                if adj not in parent:
+                    parent[adj] = current
+                    stack.append(adj)
+                    continue
+                root_a = find_root(parent, current)
+                root_b = find_root(parent, adj)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups = {}
+    for node in sorted(parent):
+        root = find_root(parent, node)
+        if root not in groups:
+            groups[root] = []
+        groups[root].append(node)
+    bess_list = sorted(groups.values(), key=lambda group: group[0])
+    p4_list = [node for node in members if node not in parent]
+    return bess_list, p4_list
+
+
+def index_modules(module_list):
+    """ Give integer ids to NF modules, module_list[i] gets id i.
+        Children outside |module_list| reached from BESS modules get
+        the following ids. Modules are identified the same way as
+        nf_node.__cmp__(), by name, service path id and service id.
+
+    Parameter:
+    module_list: NF modules
+
+    Returns:
+    nodes: the module of each id
+    adj_list: children ids of each id
+    """
+    nodes = list(module_list)
+    index_of = {}
+    for index in range(len(nodes)):
+        key = (nodes[index].name, nodes[index].service_path_id, \
+               nodes[index].service_id)
+        if key not in index_of:
+            index_of[key] = index
+    adj_list = []
+    index = 0
+    while index < len(nodes):
+        children = []
+        if nodes[index].is_bess():
+            for adj_node in nodes[index].adj_nodes:
+                key = (adj_node.name, adj_node.service_path_id, \
+                       adj_node.service_id)
+                if key not in index_of:
+                    index_of[key] = len(nodes)
+                    nodes.append(adj_node)
+                children.append(index_of[key])
+        adj_list.append(children)
+        index += 1
+    return nodes, adj_list
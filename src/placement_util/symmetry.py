@@ -0,0 +1,54 @@
+"""
+* This file provides the symmetry reduction over identical chains.
+*
+* Two chains are interchangeable if they have the same NF modules in the
+* same DAG shape with the same SLO and delay bound: swapping their
+* placements gives a placement with the same throughput and delay. Only
+* one representative of each orbit of such swaps needs to be evaluated.
+"""
+
+
+def chain_orbits(signatures):
+    """ Group interchangeable chains
+
+    Parameter:
+    signatures: a hashable signature of each chain, None for a chain
+                that is never grouped
+
+    Returns:
+    orbits: lists of two or more chain indexes with the same
+            signature, each list in chain order
+    """
+    groups = {}
+    order = []
+    for chain_index in range(len(signatures)):
+        signature = signatures[chain_index]
+        if signature is None:
+            continue
+        if signature not in groups:
+            groups[signature] = []
+            order.append(signature)
+        groups[signature].append(chain_index)
+    return [groups[key] for key in order \
+            if len(groups[key]) > 1]
+
+
+def option_key(pattern, node_num, option_index):
+    """ Read the options of one chain out of a placement, the last
+        option being the most significant bit. Placements are
+        enumerated in increasing order of this key for the last
+        chains first (see nf_placement.iter_case()).
+
+    Parameter:
+    pattern: the placement
+    node_num: number of modules
+    option_index: module indexes of the chain that may run on both
+                  hardwares, in list order
+
+    Returns:
+    the key of the chain
+    """
+    key = 0
+    for index in reversed(option_index):
+        key = (key<<1)|((pattern>>(node_num-index-1))&1)
+    return key
@@ -61,12 +61,10 @@ def convert_global_nf_graph(scanner):
                 cmp_node.shared_spi_list += node.shared_spi_list
 
         for head in nfchain_graph.heads:
-            find_global_head = False
-            for global_head in res_graph.heads:
-                if head.name == global_head.name:
-                    find_global_head = True
-            if not find_global_head:
-                res_graph.heads.append( res_graph.get_module(head.name) )
+            if res_graph.get_module(head.name) == None:
+                # a chain with a single module has no edges
+                res_graph.add_module(head)
+            res_graph.heads.append( res_graph.get_module(head.name) )
     return res_graph
 
 def convert_nf_graph(ll_node):
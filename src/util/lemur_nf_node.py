@@ -8,6 +8,7 @@
 from __future__ import print_function
 import copy
 import re
+from collections import OrderedDict
 
 """
 Three module lists record p4-14, p4-16 and BESS modules.
@@ -100,12 +101,54 @@ S_ROOT_BESS=2
 S_NON_ROOT_BESS=3
 S_NON_ROOT_BESS_CONT=4
 
+class nf_node_set(object):
+    """ An insertion-ordered set of nf_nodes, keyed by the NF instance
+    name. It is used for the heads and tails of an nf_chain_graph, so
+    that membership tests and removals are O(1) while iteration keeps
+    the insertion order of the plain lists it replaces.
+
+    Args:
+        nodes: initial nf_nodes (optional)
+    """
+    def __init__(self, nodes=None):
+        self.nodes = OrderedDict()
+        if nodes != None:
+            for node in nodes:
+                self.append(node)
+        return
+
+    def append(self, node):
+        if node.name not in self.nodes:
+            self.nodes[node.name] = node
+        return
+
+    def remove(self, node):
+        if node not in self:
+            raise ValueError("%s is not in the set" %(node.name))
+        self.nodes.pop(node.name)
+        return
+
+    def __contains__(self, node):
+        return (node.name in self.nodes) and (self.nodes[node.name] == node)
+
+    def __iter__(self):
+        return iter(list(self.nodes.values()))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, index):
+        return list(self.nodes.values())[index]
+
+
 class nf_chain_graph(object):
     """ The NF chain graph class.
     This class represents a single NF chain input. Each NF chain graph
     should be associated with a flowspec.
     An nf_chain_graph can be converted from a ll_node graph by calling
     'convert_nf_graph(ll_node)'.
+    Each module gets a stable integer id when it is added to the graph,
+    see get_node_id() and get_adjacency().
     """
     def __init__(self, flowspec_instance):
         self.module_list = {}
@@ -117,15 +160,36 @@ class nf_chain_graph(object):
         self.heads = []
         self.tails = []
         self.spi_list = None
+        # node ids: module name -> id, id -> module (None once removed)
+        self.node_ids = {}
+        self.id_nodes = []
+        self.adjacency = None
         if flowspec_instance != None:
             self.set_flowspec(flowspec_instance)
 
         # for topo sort (DFS method)
         self.curr_finish_time = 0
         self.p4_nodes = None
+        self.p4_node_keys = None
         self.bess_nodes = None
         return
 
+    @property
+    def heads(self):
+        return self.head_set
+
+    @heads.setter
+    def heads(self, nodes):
+        self.head_set = nf_node_set(nodes)
+
+    @property
+    def tails(self):
+        return self.tail_set
+
+    @tails.setter
+    def tails(self, nodes):
+        self.tail_set = nf_node_set(nodes)
+
     def set_flowspec(self, flowspec_instance):
         self.flowspec = copy.deepcopy(flowspec_instance)
         return
@@ -139,17 +203,31 @@ class nf_chain_graph(object):
             self.heads.append(new_nf_node)
             self.tails.append(new_nf_node)
             self.module_num += 1
+            self.node_ids[module_key] = len(self.id_nodes)
+            self.id_nodes.append(new_nf_node)
+            self.adjacency = None
         else:
             if self.module_list[module_key] != new_nf_node:
                 self.module_list[module_key].update_shared_module(new_nf_node)
         return
 
     def get_module(self, module_key):
-        if module_key in self.module_list.keys():
+        if module_key in self.module_list:
             return self.module_list[module_key]
         else:
             return None
 
+    def get_node_id(self, target_node):
+        """
+        This function returns the integer id of a module in the graph,
+        or None if the module is not in the graph.
+        Input: target_node (type=nf_node)
+        Output: node id (type=int)
+        """
+        if not self.has_node(target_node):
+            return None
+        return self.node_ids[target_node.name]
+
     def add_edge(self, src, dst):
         """
         This function add a edge between two nf_node instances. 
@@ -167,6 +245,7 @@ class nf_chain_graph(object):
         if dst in self.heads: # dst is a new child
             self.heads.remove(dst)
         src.add_neighbor(dst)
+        self.adjacency = None
         return
 
     def del_edge(self, src, dst):
@@ -186,6 +265,34 @@ class nf_chain_graph(object):
         if len(dst.prev_nodes) == 0: # dst should be removed
             self.module_num -= 1
             self.module_list.pop(dst.name)
+            self.id_nodes[self.node_ids.pop(dst.name)] = None
+        self.adjacency = None
+
+    def get_adjacency(self):
+        """
+        This function returns the CSR-style adjacency of the graph over
+        node ids. The children of node i are fwd_idx[fwd_ptr[i]:fwd_ptr[i+1]]
+        and its parents are bwd_idx[bwd_ptr[i]:bwd_ptr[i+1]], both in the
+        order of adj_nodes / prev_nodes. Removed ids have no edges.
+        The result is cached until the graph changes.
+        Output: (fwd_ptr, fwd_idx, bwd_ptr, bwd_idx) (type=tuple of lists)
+        """
+        if self.adjacency != None:
+            return self.adjacency
+        fwd_ptr, fwd_idx = [0], []
+        bwd_ptr, bwd_idx = [0], []
+        for node in self.id_nodes:
+            if node != None:
+                for next_node in node.adj_nodes:
+                    if self.has_node(next_node):
+                        fwd_idx.append(self.node_ids[next_node.name])
+                for prev_node in node.prev_nodes:
+                    if self.has_node(prev_node):
+                        bwd_idx.append(self.node_ids[prev_node.name])
+            fwd_ptr.append(len(fwd_idx))
+            bwd_ptr.append(len(bwd_idx))
+        self.adjacency = (fwd_ptr, fwd_idx, bwd_ptr, bwd_idx)
+        return self.adjacency
 
     def list_modules(self):
         return self.module_list.values()
@@ -201,7 +308,7 @@ class nf_chain_graph(object):
         # check whether all children can be found in self.module_list
         for nf_name, nf_node in self.module_list.items():
             for next_node in nf_node.adj_nodes:
-                if next_node not in self.module_list.values():
+                if not self.has_node(next_node):
                     assert (next_node == self.module_list[next_node.name])
         return
 
@@ -211,6 +318,15 @@ class nf_chain_graph(object):
     def __contains__(self, target_node):
         return (target_node.name in self.module_list)
 
+    def has_node(self, target_node):
+        """
+        This function checks whether |target_node| itself (same name,
+        spi and si) is a module of the graph.
+        Input: target_node (type=nf_node)
+        Output: Bool
+        """
+        return self.module_list.get(target_node.name) == target_node
+
     def check_shared_modules(self):
         """
         (Deprecated because we do not use shared modules any way.)
@@ -257,23 +373,29 @@ class nf_chain_graph(object):
             return len(self.spi_list)
 
         self.spi_list = []
+        fwd_ptr, fwd_idx, _, _ = self.get_adjacency()
+        visited = set()
+        seen_spi = set()
         for starter in self.heads:
-            self.get_sp_count_helper(starter)
+            stack = [self.node_ids[starter.name]]
+            # preorder DFS, a visited node has all its children visited
+            while len(stack) > 0:
+                node_id = stack.pop()
+                if node_id in visited:
+                    continue
+                visited.add(node_id)
+                spi = self.id_nodes[node_id].service_path_id
+                if spi not in seen_spi:
+                    seen_spi.add(spi)
+                    self.spi_list.append(spi)
+                stack.extend(reversed(fwd_idx[fwd_ptr[node_id]:fwd_ptr[node_id+1]]))
         return len(self.spi_list)
 
-    def get_sp_count_helper(self, node):
-        if node.service_path_id not in self.spi_list:
-            self.spi_list.append(node.service_path_id)
-
-        # process the next nodes
-        for next_node in node.adj_nodes:
-            self.get_sp_count_helper(next_node)
-        return
-
     def get_p4_nodes(self):
         if self.p4_nodes != None:
             return self.p4_nodes
         self.p4_nodes = []
+        self.p4_node_keys = set()
         for starter in self.heads:
             self.get_p4_nodes_helper(starter, S_ROOT_STARTER, 1, 0, 0)
         return self.p4_nodes
@@ -310,9 +432,8 @@ class nf_chain_graph(object):
             S_NON_ROOT_BESS: S_NON_ROOT_BESS_CONT, S_NON_ROOT_BESS_CONT: S_NON_ROOT_BESS_CONT}
 
         # we have processed this node (the 'merge' node = P4 / BESS root node)
-        for p4_node in self.p4_nodes: # either S_P4 or S_ROOT_BESS
-            if p4_node.service_path_id==node.service_path_id and p4_node.service_id==node.service_id:
-                return
+        if (node.service_path_id, node.service_id) in self.p4_node_keys:
+            return
         if node.is_p4():
             curr_node_status = S_P4
         elif node.is_bess() or node.is_smartnic():
@@ -351,6 +472,7 @@ class nf_chain_graph(object):
                 for next_node in node.adj_nodes:
                     target_node.next_nf_selection.append((next_node.transition_condition, next_node.service_path_id, next_node.service_id))
             self.p4_nodes.append(target_node)
+            self.p4_node_keys.add((target_node.service_path_id, target_node.service_id))
 
         # next_node_entry: the flag that indicates whether the next node sees the entry (control_flow_graph)
         next_node_entry = 0
@@ -386,6 +508,57 @@ class nf_chain_graph(object):
         return
 
 
+class nf_p4_lib(object):
+    """ The P4 library artefacts of an nf_node, i.e. the code parsed
+    from the node's P4 library by lemur_p4lib_parser. The payload is
+    shared by pointer: deep copies of an nf_node refer to the same
+    nf_p4_lib, and nf_node.update_p4_lib() copies it before writing,
+    so a payload is never modified once it is attached to a node.
+    """
+    __slots__ = ('macro_list', 'const_list', 'header_list', \
+        'metadata_dict', 'parser_states', 'parser_state_list', \
+        'output_prefix', 'field_lists', 'field_list_calcs', \
+        'action_prefix', 'table_prefix', 'ingress_actions', \
+        'ingress_tables', 'ingress_apply_rule', 'ingress_apply_rules', \
+        'egress_code', 'deparser_header_list')
+
+    def __init__(self):
+        for field in nf_p4_lib.__slots__:
+            setattr(self, field, None)
+        return
+
+    def copy(self):
+        new_lib = nf_p4_lib.__new__(nf_p4_lib)
+        for field in nf_p4_lib.__slots__:
+            setattr(new_lib, field, getattr(self, field))
+        return new_lib
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def nf_p4_lib_property(field):
+    """
+    The function returns an nf_node property that reads/writes |field|
+    of the node's nf_p4_lib payload.
+    """
+    def get_field(self):
+        if self.p4_lib == None:
+            return None
+        return getattr(self.p4_lib, field)
+
+    def set_field(self, value):
+        self.update_p4_lib(**{field: value})
+    return property(get_field, set_field)
+
+
+# immutable field values that deep copies of an nf_node share
+NF_NODE_ATOMIC_TYPES = (type(None), bool, int, long, float, str, unicode)
+
+
 class nf_node(object):
     """ This class implements an abstract NF node. The |nf_type| field
     is the placement decision of |this| node.
@@ -408,7 +581,23 @@ class nf_node(object):
         node after a BESS node)
         control_flow_layer: the layer's index in the P4 control flow graph (tree)
         control_flow_idx: the node's index at its control flow tree's layer
+        p4_lib: the node's P4 library artefacts (nf_p4_lib), shared by
+        the copies of the node
     """
+    __slots__ = ('name', 'nf_class', 'nf_type', 'service_path_id', \
+        'service_id', 'shared_spi_list', 'transition_condition', \
+        'argument', 'prev_nodes', 'adj_nodes', 'next_nf_selection', \
+        'nf_select_tables', 'entry_flag', 'control_flow_layer', \
+        'control_flow_idx', 'finish_time', 'visited', \
+        # BESS/P4 code generator
+        'nsh_gate', 'bpf_gate', 'optimize', 'offload', 'reset', \
+        'branch_str', 'arg', 'bounce', 'parent_count', 'merge', \
+        'nickname', \
+        # placement
+        'core_num', 'nic_index', 'chain_index', 'core_index', 'time', \
+        'weight', \
+        'p4_lib')
+
     def __init__(self, ll_node=None):
         self.name = None
         self.nf_class = None
@@ -450,21 +639,39 @@ class nf_node(object):
         self.core_index = -1
         self.time = -1
         self.weight = 0
-        self.macro_list = None
-        self.const_list = None
-        self.header_list = None
-        self.metadata_dict = None
-        self.parser_states = None
-        self.output_prefix = None
-        self.field_lists = None
-        self.field_list_calcs = None
-        self.action_prefix = None
-        self.table_prefix = None
-        self.ingress_actions = None
-        self.ingress_tables = None
-        self.ingress_apply_rules = None
-        self.egress_code = None
-        self.deparser_header_list = None
+        self.p4_lib = None
+        return
+
+    def __deepcopy__(self, memo):
+        """
+        Copy the node field by field. The P4 library payload is shared
+        with the copy, see nf_p4_lib.
+        """
+        new_node = nf_node.__new__(nf_node)
+        memo[id(self)] = new_node
+        for field in nf_node.__slots__:
+            try:
+                value = getattr(self, field)
+            except AttributeError: # unset slot, e.g. nickname
+                continue
+            if type(value) not in NF_NODE_ATOMIC_TYPES:
+                value = copy.deepcopy(value, memo)
+            setattr(new_node, field, value)
+        return new_node
+
+    def update_p4_lib(self, **fields):
+        """
+        This function sets fields of the node's P4 library payload. The
+        payload may be shared with copies of the node, so it is copied
+        before the update.
+        """
+        if self.p4_lib == None:
+            new_lib = nf_p4_lib()
+        else:
+            new_lib = self.p4_lib.copy()
+        for field, value in fields.items():
+            setattr(new_lib, field, value)
+        self.p4_lib = new_lib
         return
 
     def setup_node_from_argument(self, nf_name, nf_class, spi, si):
@@ -610,6 +817,21 @@ class nf_node(object):
             else:
                 return 1
 
+    # __eq__/__hash__ follow __cmp__: nodes are identified by
+    # (name, service_path_id, service_id)
+    def __eq__(self, other_nf_node):
+        if not isinstance(other_nf_node, nf_node):
+            return False
+        return self.name == other_nf_node.name and \
+            self.service_path_id == other_nf_node.service_path_id and \
+            self.service_id == other_nf_node.service_id
+
+    def __ne__(self, other_nf_node):
+        return not self.__eq__(other_nf_node)
+
+    def __hash__(self):
+        return hash((self.name, self.service_path_id, self.service_id))
+
     def __str__(self):
         res_str = "%s(%s)[spi=%d,si=%d,type=%d] Trans:%s Args:%s" %(self.nf_class, self.name, self.service_path_id, self.service_id, self.nf_type, str(self.transition_condition), str(self.argument))
         return res_str
@@ -626,32 +848,32 @@ class nf_node(object):
         return res_nf_nodes
 
     def nf_node_store_macro(self, input_macro_list):
-        self.macro_list = copy.deepcopy(input_macro_list)
+        self.update_p4_lib(macro_list=copy.deepcopy(input_macro_list))
         return
 
     def nf_node_store_const(self, input_const_list):
-        self.const_list = copy.deepcopy(input_const_list)
+        self.update_p4_lib(const_list=copy.deepcopy(input_const_list))
         return
 
     def nf_node_store_header(self, input_header_list):
         """
         This function stores all headers in the list named self.headers
         """
-        self.header_list = copy.deepcopy(input_header_list)
+        self.update_p4_lib(header_list=copy.deepcopy(input_header_list))
         return
 
     def nf_node_store_metadata(self, input_header_dict):
         """
         This function stores all headers in the list named self.headers
         """
-        self.metadata_dict = copy.deepcopy(input_header_dict)
+        self.update_p4_lib(metadata_dict=copy.deepcopy(input_header_dict))
         return
 
     def nf_node_store_parser_state(self, input_state_list):
         """
         This function stores all parser states in the list named self.parser_states
         """
-        self.parser_state_list = copy.deepcopy(input_state_list)
+        self.update_p4_lib(parser_state_list=copy.deepcopy(input_state_list))
         return
 
     def nf_node_store_ingress_code(self, default_prefix, field_list, field_list_calc, actions, tables, apply_rules):
@@ -659,21 +881,22 @@ class nf_node(object):
         This function stores actions, tables, apply rules in the OrderedDict()
         Also, default_prefix is stored as self.output_prefix
         """
-        self.output_prefix = copy.deepcopy(default_prefix)
-        self.field_lists = copy.deepcopy(field_list)
-        self.field_list_calcs = copy.deepcopy(field_list_calc)
-        self.action_prefix = copy.deepcopy(default_prefix)
-        self.table_prefix = self.action_prefix + "_%d_%d" %(self.service_path_id, self.service_id)
-        self.ingress_actions = copy.deepcopy(actions)
-        self.ingress_tables = copy.deepcopy(tables)
-        self.ingress_apply_rule = copy.deepcopy(apply_rules)
+        action_prefix = copy.deepcopy(default_prefix)
+        self.update_p4_lib(output_prefix=copy.deepcopy(default_prefix), \
+            field_lists=copy.deepcopy(field_list), \
+            field_list_calcs=copy.deepcopy(field_list_calc), \
+            action_prefix=action_prefix, \
+            table_prefix=action_prefix + "_%d_%d" %(self.service_path_id, self.service_id), \
+            ingress_actions=copy.deepcopy(actions), \
+            ingress_tables=copy.deepcopy(tables), \
+            ingress_apply_rule=copy.deepcopy(apply_rules))
         return
 
     def nf_node_store_egress_code(self):
         return
 
     def nf_node_store_deparser(self, input_header_list):
-        self.deparser_header_list = copy.deepcopy(input_header_list)
+        self.update_p4_lib(deparser_header_list=copy.deepcopy(input_header_list))
         return
 
     def nf_node_store_arg(self, input_arg_list):
@@ -697,6 +920,12 @@ class nf_node(object):
         return
 
 
+# nf_node exposes the payload fields as before, e.g. node.macro_list
+for p4_lib_field in nf_p4_lib.__slots__:
+    setattr(nf_node, p4_lib_field, nf_p4_lib_property(p4_lib_field))
+del p4_lib_field
+
+
 def nfcp_nf_chain_length(p4_list):
     """
     The function returns the length of each NF service chain in terms of the
@@ -715,6 +944,21 @@ def nfcp_nf_chain_length(p4_list):
     return nf_chain_length
 
 
+def nfcp_nf_node_lookup(node_list):
+    """
+    The function builds a lookup table for a list of nf_nodes. Looking up
+    a node returns the first node in the list that equals it, i.e. the
+    same result as node_list[node_list.index(node)].
+    Input: node_list (type=list)
+    Output: lookup table (type=dict)
+    """
+    lookup = {}
+    for node in node_list:
+        if node not in lookup:
+            lookup[node] = node
+    return lookup
+
+
 def nfcp_get_bess_module_name(module_name):
     """
     The function removes the brackets and returns the BESS NF's name